@@ -39,6 +39,7 @@ from appgate.openapi.openapi import (
 )
 from appgate.openapi.utils import join
 from appgate.operator import init_kubernetes, run_k8s
+from appgate.watcher import Informer
 from appgate.state import (
     entities_conflict_summary,
     resolve_appgate_state,
@@ -61,6 +62,7 @@ from appgate.types import (
     DEVICE_ID_ENV,
     HOST_ENV,
     TIMEOUT_ENV,
+    FETCH_CONCURRENCY_ENV,
     TWO_WAY_SYNC_ENV,
     CLEANUP_ENV,
     APPGATE_SSL_NO_VERIFY,
@@ -72,8 +74,27 @@ from appgate.types import (
     get_tags,
     to_bool,
     get_dry_run,
+    get_apply_mode,
+    SUPPORTED_APPLY_MODES,
     APPGATE_EXCLUDE_ENTITIES_ENV,
     APPGATE_INCLUDE_ENTITIES_ENV,
+    PAGE_SIZE_ENV,
+    MAX_RETRIES_ENV,
+    READ_RATE_LIMIT_ENV,
+    WRITE_RATE_LIMIT_ENV,
+    APPLY_CONCURRENCY_ENV,
+    APPLY_MODE_ENV,
+    APPLY_MAX_IN_FLIGHT_ENV,
+    FULL_REFRESH_INTERVAL_ENV,
+    CONNECTION_POOL_SIZE_ENV,
+    CONNECTIONS_PER_HOST_ENV,
+    KEEPALIVE_TIMEOUT_ENV,
+    DNS_CACHE_TTL_ENV,
+    COMPRESSION_ENV,
+    RECORD_FILE_ENV,
+    HEDGE_PERCENTILE_ENV,
+    HEDGE_BUDGET_ENV,
+    CIRCUIT_RESET_TIMEOUT_ENV,
 )
 from appgate.attrs import K8S_LOADER
 from appgate.openapi.openapi import generate_api_spec
@@ -122,6 +143,32 @@ def appgate_operator_context(
     device_id = os.getenv(DEVICE_ID_ENV) or args.device_id
     controller = os.getenv(HOST_ENV) or args.host
     timeout = os.getenv(TIMEOUT_ENV) or args.timeout
+    fetch_concurrency = os.getenv(FETCH_CONCURRENCY_ENV) or args.fetch_concurrency
+    page_size = os.getenv(PAGE_SIZE_ENV) or args.page_size
+    max_retries = os.getenv(MAX_RETRIES_ENV) or args.max_retries
+    read_rate_limit = os.getenv(READ_RATE_LIMIT_ENV) or args.read_rate_limit
+    write_rate_limit = os.getenv(WRITE_RATE_LIMIT_ENV) or args.write_rate_limit
+    apply_concurrency = os.getenv(APPLY_CONCURRENCY_ENV) or args.apply_concurrency
+    apply_mode = os.getenv(APPLY_MODE_ENV) or args.apply_mode
+    apply_max_in_flight = os.getenv(APPLY_MAX_IN_FLIGHT_ENV) or args.apply_max_in_flight
+    full_refresh_interval = (
+        os.getenv(FULL_REFRESH_INTERVAL_ENV) or args.full_refresh_interval
+    )
+    connection_pool_size = (
+        os.getenv(CONNECTION_POOL_SIZE_ENV) or args.connection_pool_size
+    )
+    connections_per_host = (
+        os.getenv(CONNECTIONS_PER_HOST_ENV) or args.connections_per_host
+    )
+    keepalive_timeout = os.getenv(KEEPALIVE_TIMEOUT_ENV) or args.keepalive_timeout
+    dns_cache_ttl = os.getenv(DNS_CACHE_TTL_ENV) or args.dns_cache_ttl
+    compression = os.getenv(COMPRESSION_ENV) or args.compression
+    record_file = os.getenv(RECORD_FILE_ENV) or args.record_file
+    hedge_percentile = os.getenv(HEDGE_PERCENTILE_ENV) or args.hedge_percentile
+    hedge_budget = os.getenv(HEDGE_BUDGET_ENV) or args.hedge_budget
+    circuit_reset_timeout = (
+        os.getenv(CIRCUIT_RESET_TIMEOUT_ENV) or args.circuit_reset_timeout
+    )
 
     two_way_sync = args.no_two_way_sync or (to_bool(os.getenv(TWO_WAY_SYNC_ENV)))
     dry_run_mode = get_dry_run(args.no_dry_run)
@@ -191,6 +238,24 @@ def appgate_operator_context(
         metadata_configmap=metadata_configmap,
         cafile=appgate_cacert_path,
         reverse_mode=args.reverse_mode,
+        fetch_concurrency=int(fetch_concurrency),
+        page_size=int(page_size),
+        max_retries=int(max_retries),
+        read_rate_limit=float(read_rate_limit),
+        write_rate_limit=float(write_rate_limit),
+        apply_concurrency=int(apply_concurrency),
+        apply_mode=get_apply_mode(apply_mode),
+        apply_max_in_flight=int(apply_max_in_flight),
+        full_refresh_interval=int(full_refresh_interval),
+        connection_pool_size=int(connection_pool_size),
+        connections_per_host=int(connections_per_host),
+        keepalive_timeout=float(keepalive_timeout),
+        dns_cache_ttl=int(dns_cache_ttl),
+        compression=to_bool(str(compression)),
+        record_file=Path(record_file) if record_file else None,
+        hedge_percentile=float(hedge_percentile),
+        hedge_budget=float(hedge_budget),
+        circuit_reset_timeout=float(circuit_reset_timeout),
     )
 
 
@@ -237,14 +302,30 @@ async def run_appgate_operator(args: AppgateOperatorArguments) -> None:
         version=ctx.api_spec.api_version,
         no_verify=ctx.no_verify,
         cafile=ctx.cafile,
+        page_size=ctx.page_size,
+        max_retries=ctx.max_retries,
+        read_rate_limit=ctx.read_rate_limit,
+        write_rate_limit=ctx.write_rate_limit,
+        connection_pool_size=ctx.connection_pool_size,
+        connections_per_host=ctx.connections_per_host,
+        keepalive_timeout=ctx.keepalive_timeout,
+        dns_cache_ttl=ctx.dns_cache_ttl,
+        compression=ctx.compression,
+        record_file=ctx.record_file,
+        hedge_percentile=ctx.hedge_percentile,
+        hedge_budget=ctx.hedge_budget,
+        circuit_reset_timeout=ctx.circuit_reset_timeout,
         expiration_time_delta=ctx.timeout,
         dry_run=ctx.dry_run_mode,
     ) as appgate_client:
+        # The custom resources seen by the watches, read when writing them
+        informer = Informer()
         operator = appgate_operator(
             queue=events_queue,
             ctx=ctx,
             k8s_configmap_client=k8s_configmap_client,
             appgate_client=appgate_client,
+            informer=informer,
         )
         await run_k8s(
             queue=events_queue,
@@ -252,6 +333,7 @@ async def run_appgate_operator(args: AppgateOperatorArguments) -> None:
             api_spec=ctx.api_spec,
             k8s_configmap_client=k8s_configmap_client,
             operator=operator,
+            informer=informer,
         )
 
 
@@ -279,6 +361,19 @@ async def dump_entities(
         version=ctx.api_spec.api_version,
         no_verify=ctx.no_verify,
         cafile=ctx.cafile,
+        page_size=ctx.page_size,
+        max_retries=ctx.max_retries,
+        read_rate_limit=ctx.read_rate_limit,
+        write_rate_limit=ctx.write_rate_limit,
+        connection_pool_size=ctx.connection_pool_size,
+        connections_per_host=ctx.connections_per_host,
+        keepalive_timeout=ctx.keepalive_timeout,
+        dns_cache_ttl=ctx.dns_cache_ttl,
+        compression=ctx.compression,
+        record_file=ctx.record_file,
+        hedge_percentile=ctx.hedge_percentile,
+        hedge_budget=ctx.hedge_budget,
+        circuit_reset_timeout=ctx.circuit_reset_timeout,
         expiration_time_delta=ctx.timeout,
         dry_run=ctx.dry_run_mode,
     ) as appgate_client:
@@ -450,7 +545,9 @@ def main() -> None:
         action="store_true",
     )
     appgate_operator.add_argument(
-        "--host", help="Controller host to connect", default=None
+        "--host",
+        help="Controller host to connect, comma separated for several controllers",
+        default=None,
     )
     appgate_operator.add_argument(
         "--user",
@@ -488,6 +585,113 @@ def main() -> None:
         help="Event loop timeout to determine when there are not more events",
         default=30,
     )
+    appgate_operator.add_argument(
+        "--fetch-concurrency",
+        type=int,
+        help="Maximum number of entity types read from the controller at the same time",
+        default=1,
+    )
+    appgate_operator.add_argument(
+        "--page-size",
+        type=int,
+        help="Number of entities requested per page, 0 disables paging",
+        default=0,
+    )
+    appgate_operator.add_argument(
+        "--max-retries",
+        type=int,
+        help="Number of times a request is retried on transient errors",
+        default=3,
+    )
+    appgate_operator.add_argument(
+        "--read-rate-limit",
+        type=float,
+        help="Maximum read requests per second, 0 means unlimited",
+        default=0,
+    )
+    appgate_operator.add_argument(
+        "--write-rate-limit",
+        type=float,
+        help="Maximum write requests per second, 0 means unlimited",
+        default=0,
+    )
+    appgate_operator.add_argument(
+        "--apply-concurrency",
+        type=int,
+        help="Maximum number of entities of the same type applied at the same time",
+        default=1,
+    )
+    appgate_operator.add_argument(
+        "--apply-mode",
+        choices=SUPPORTED_APPLY_MODES,
+        help="How entities are applied",
+        default="sequential",
+    )
+    appgate_operator.add_argument(
+        "--apply-max-in-flight",
+        type=int,
+        help="Maximum number of entities applied at the same time across entity types",
+        default=10,
+    )
+    appgate_operator.add_argument(
+        "--full-refresh-interval",
+        type=int,
+        help="Seconds between full refetches of the controller state, 0 means always",
+        default=0,
+    )
+    appgate_operator.add_argument(
+        "--connection-pool-size",
+        type=int,
+        help="Maximum number of connections open with the controller, 0 means no limit",
+        default=100,
+    )
+    appgate_operator.add_argument(
+        "--connections-per-host",
+        type=int,
+        help="Maximum number of connections open with each controller host, 0 means no limit",
+        default=0,
+    )
+    appgate_operator.add_argument(
+        "--keepalive-timeout",
+        type=float,
+        help="Seconds an idle connection with the controller is kept open",
+        default=15.0,
+    )
+    appgate_operator.add_argument(
+        "--dns-cache-ttl",
+        type=int,
+        help="Seconds the controller DNS resolution is cached",
+        default=10,
+    )
+    appgate_operator.add_argument(
+        "--no-compression",
+        action="store_true",
+        default=False,
+        help="Do not ask the controller for compressed responses",
+    )
+    appgate_operator.add_argument(
+        "--record-file",
+        help="File where the requests to the controller and their responses are recorded",
+        default=None,
+    )
+    appgate_operator.add_argument(
+        "--hedge-percentile",
+        type=float,
+        help="Latency percentile after which a GET request is hedged, 0 disables hedging",
+        default=0.0,
+    )
+    appgate_operator.add_argument(
+        "--hedge-budget",
+        type=float,
+        help="Maximum fraction of extra GET requests sent when hedging",
+        default=0.1,
+    )
+    appgate_operator.add_argument(
+        "--circuit-reset-timeout",
+        type=float,
+        help="Seconds to wait before sending requests again to a controller that is not available",
+        default=30.0,
+    )
     appgate_operator.add_argument(
         "--no-verify",
         action="store_true",
@@ -597,6 +801,24 @@ def main() -> None:
                     no_verify=args.no_verify,
                     cafile=Path(args.cafile) if args.cafile else None,
                     reverse_mode=args.reverse_mode,
+                    fetch_concurrency=args.fetch_concurrency,
+                    page_size=args.page_size,
+                    max_retries=args.max_retries,
+                    read_rate_limit=args.read_rate_limit,
+                    write_rate_limit=args.write_rate_limit,
+                    apply_concurrency=args.apply_concurrency,
+                    apply_mode=args.apply_mode,
+                    apply_max_in_flight=args.apply_max_in_flight,
+                    full_refresh_interval=args.full_refresh_interval,
+                    connection_pool_size=args.connection_pool_size,
+                    connections_per_host=args.connections_per_host,
+                    keepalive_timeout=args.keepalive_timeout,
+                    dns_cache_ttl=args.dns_cache_ttl,
+                    compression=not args.no_compression,
+                    record_file=Path(args.record_file) if args.record_file else None,
+                    hedge_percentile=args.hedge_percentile,
+                    hedge_budget=args.hedge_budget,
+                    circuit_reset_timeout=args.circuit_reset_timeout,
                     entities_to_include=get_tags(
                         args.entities_to_include,
                         os.environ.get(APPGATE_INCLUDE_ENTITIES_ENV, ""),
@@ -1,8 +1,9 @@
 import asyncio
 import sys
+import time
 from asyncio import Queue
 from copy import deepcopy
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Set, FrozenSet
 
 from kubernetes.client import CustomObjectsApi
 
@@ -15,15 +16,20 @@ from appgate.types import (
     get_operator_mode,
 )
 from appgate.logger import log
+from appgate.metrics import log_metrics
+from appgate.poller import AppgateStatePoller
 from appgate.client import (
     AppgateClient,
     K8SConfigMapClient,
     K8sEntityClient,
     AppgateEntityClient,
+    AppgateTransientException,
+    AppgateCircuitOpenException,
 )
 from appgate.openapi.types import (
     AppgateException,
     APISpec,
+    Entity_T,
 )
 from appgate.openapi.types import (
     K8S_APPGATE_VERSION,
@@ -39,12 +45,16 @@ from appgate.state import (
     appgate_state_empty,
 )
 from appgate.types import AppgateEvent, EntityWrapper
+from appgate.operator import coalesce_events
+from appgate.watcher import Informer
 
 
 __all__ = [
     "appgate_operator",
     "get_current_appgate_state",
+    "refresh_appgate_state",
     "get_crds",
+    "next_event",
 ]
 
 
@@ -59,10 +69,15 @@ def get_crds() -> CustomObjectsApi:
 
 
 async def get_current_appgate_state(
-    ctx: AppgateOperatorContext, appgate_client: AppgateClient
+    ctx: AppgateOperatorContext,
+    appgate_client: AppgateClient,
+    entity_types: Optional[Set[str]] = None,
+    tags: Optional[FrozenSet[str]] = None,
 ) -> AppgateState:
     """
     Gets the current AppgateState for controller
+    If entity_types is specified, only those entity types are fetched.
+    If tags is specified, only the entities with any of those tags are fetched.
     """
     api_spec = ctx.api_spec
     log.info(
@@ -82,10 +97,29 @@ async def get_current_appgate_state(
     entity_clients = openapi.generate_api_spec_clients(
         api_spec=api_spec, appgate_client=appgate_client
     )
-    entities_set = {}
-    for entity, client in entity_clients.items():
+    if entity_types is not None:
+        entity_clients = {k: v for k, v in entity_clients.items() if k in entity_types}
+    # Limit the number of entity types being fetched at the same time
+    semaphore = asyncio.Semaphore(max(ctx.fetch_concurrency, 1))
+
+    async def get_entities(client: EntityClient | None) -> List[Entity_T] | None:
         assert isinstance(client, AppgateEntityClient)
-        entities = await client.get()
+        async with semaphore:
+            return await client.get(tags=tags)
+
+    try:
+        async with asyncio.TaskGroup() as task_group:
+            tasks = {
+                entity: task_group.create_task(get_entities(client))
+                for entity, client in entity_clients.items()
+            }
+    except BaseExceptionGroup as e:
+        # Fail with the error of the first entity type that failed, the rest of
+        # them are cancelled by the task group
+        raise e.exceptions[0]
+    entities_set = {}
+    for entity, task in tasks.items():
+        entities = task.result()
         if entities is not None:
             entities_set[entity] = EntitiesSet({EntityWrapper(e) for e in entities})
     if len(entities_set) < len(entity_clients):
@@ -99,8 +133,113 @@ async def get_current_appgate_state(
     return appgate_state
 
 
+async def refresh_appgate_state(
+    ctx: AppgateOperatorContext,
+    appgate_client: AppgateClient,
+    current_appgate_state: AppgateState,
+    changed_entities: Dict[str, Set[str]],
+) -> AppgateState:
+    """
+    Refresh only the entities in current_appgate_state that could have changed,
+    changed_entities contains the names of those entities by entity type.
+    If all of them are known, they are fetched one by one, otherwise we fetch
+    all the entities of that type.
+    """
+    entity_clients = openapi.generate_api_spec_clients(
+        api_spec=ctx.api_spec, appgate_client=appgate_client
+    )
+    entity_types_to_fetch = set()
+    ids_to_fetch: Dict[str, Set[str]] = {}
+    for entity_type, names in changed_entities.items():
+        client = entity_clients.get(entity_type)
+        current_entities = current_appgate_state.entities_set.get(entity_type)
+        if not isinstance(client, AppgateEntityClient) or not current_entities:
+            continue
+        known = current_entities.entities_by_name
+        if client.singleton or any(n not in known for n in names):
+            entity_types_to_fetch.add(entity_type)
+        else:
+            ids_to_fetch[entity_type] = {known[n].id for n in names}
+    log.info(
+        "[appgate-operator/%s] Refreshing current state from controller: %s",
+        ctx.namespace,
+        ", ".join(
+            sorted(entity_types_to_fetch)
+            + [f"{k} ({len(v)})" for k, v in sorted(ids_to_fetch.items())]
+        )
+        or "nothing changed",
+    )
+    entities_set = dict(current_appgate_state.entities_set)
+    if entity_types_to_fetch:
+        appgate_state = await get_current_appgate_state(
+            ctx=ctx,
+            appgate_client=appgate_client,
+            entity_types=entity_types_to_fetch,
+        )
+        entities_set.update(appgate_state.entities_set)
+
+    semaphore = asyncio.Semaphore(max(ctx.fetch_concurrency, 1))
+
+    async def get_entity(client: AppgateEntityClient, id: str) -> Optional[Entity_T]:
+        async with semaphore:
+            return await client.get_entity(id)
+
+    for entity_type, ids in ids_to_fetch.items():
+        client = entity_clients[entity_type]
+        assert isinstance(client, AppgateEntityClient)
+        entities = await asyncio.gather(*(get_entity(client, id) for id in ids))
+        entities_set[entity_type] = EntitiesSet(
+            {
+                e
+                for e in current_appgate_state.entities_set[entity_type].entities
+                if e.id not in ids
+            }
+            | {EntityWrapper(e) for e in entities if e}
+        )
+    return AppgateState(entities_set=entities_set)
+
+
+async def next_event(
+    queue: Queue, timeout: float, synced: Optional[asyncio.Future] = None
+) -> AppgateEvent:
+    """
+    Next event in queue. Raises asyncio.TimeoutError when no event is received
+    in timeout seconds or, if synced is given, as soon as it's done and there
+    are no events left.
+    """
+    if synced is None or synced.done() and not queue.empty():
+        return await asyncio.wait_for(queue.get(), timeout=timeout)
+    get = asyncio.ensure_future(queue.get())
+    done, _ = await asyncio.wait(
+        {get, synced}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+    )
+    if get in done:
+        return get.result()
+    get.cancel()
+    raise asyncio.TimeoutError()
+
+
+def appgate_state_poller(
+    ctx: AppgateOperatorContext, appgate_client: AppgateClient
+) -> AppgateStatePoller:
+    entity_clients = openapi.generate_api_spec_clients(
+        api_spec=ctx.api_spec, appgate_client=appgate_client
+    )
+    return AppgateStatePoller(
+        entity_clients={
+            k: v
+            for k, v in entity_clients.items()
+            if isinstance(v, AppgateEntityClient)
+        },
+        concurrency=ctx.fetch_concurrency,
+    )
+
+
 def generate_k8s_clients(
-    api_spec: APISpec, namespace: str, k8s_api: CustomObjectsApi
+    api_spec: APISpec,
+    namespace: str,
+    k8s_api: CustomObjectsApi,
+    informer: Informer | None = None,
 ) -> Dict[str, EntityClient | None]:
     return {
         k: K8sEntityClient(
@@ -109,6 +248,7 @@ def generate_k8s_clients(
             crd_version=K8S_APPGATE_VERSION,
             namespace=namespace,
             kind=k,
+            informer=informer,
         )
         for k in api_spec.api_entities.keys()
     }
@@ -119,6 +259,7 @@ async def appgate_operator(
     ctx: AppgateOperatorContext,
     k8s_configmap_client: K8SConfigMapClient | None,
     appgate_client: AppgateClient,
+    informer: Informer | None = None,
 ) -> None:
     namespace = ctx.namespace
     operator_name: OperatorMode = get_operator_mode(ctx.reverse_mode)
@@ -128,9 +269,67 @@ async def appgate_operator(
     log.info("[%s/%s]   + reverse mode: %s", operator_name, namespace, ctx.reverse_mode)
     log.info("[%s/%s]   + log-level: %s", operator_name, namespace, log.level)
     log.info("[%s/%s]   + timeout: %s", operator_name, namespace, ctx.timeout)
+    log.info(
+        "[%s/%s]   + fetch-concurrency: %s",
+        operator_name,
+        namespace,
+        ctx.fetch_concurrency,
+    )
+    log.info("[%s/%s]   + page-size: %s", operator_name, namespace, ctx.page_size)
+    log.info(
+        "[%s/%s]   + apply-concurrency: %s",
+        operator_name,
+        namespace,
+        ctx.apply_concurrency,
+    )
+    log.info(
+        "[%s/%s]   + apply-mode: %s (max in flight %s)",
+        operator_name,
+        namespace,
+        ctx.apply_mode,
+        ctx.apply_max_in_flight,
+    )
+    log.info(
+        "[%s/%s]   + rate-limit: read %s/s, write %s/s",
+        operator_name,
+        namespace,
+        ctx.read_rate_limit or "unlimited",
+        ctx.write_rate_limit or "unlimited",
+    )
+    log.info(
+        "[%s/%s]   + connections: pool %s, per host %s, keep-alive %ss, compression %s",
+        operator_name,
+        namespace,
+        ctx.connection_pool_size or "unlimited",
+        ctx.connections_per_host or "unlimited",
+        ctx.keepalive_timeout,
+        ctx.compression,
+    )
+    log.info(
+        "[%s/%s]   + hedging: %s",
+        operator_name,
+        namespace,
+        (
+            f"p{ctx.hedge_percentile:g}, budget {ctx.hedge_budget:g}"
+            if ctx.hedge_percentile
+            else "disabled"
+        ),
+    )
+    log.info(
+        "[%s/%s]   + circuit-reset-timeout: %ss",
+        operator_name,
+        namespace,
+        ctx.circuit_reset_timeout,
+    )
     log.info("[%s/%s]   + dry-run: %s", operator_name, namespace, ctx.dry_run_mode)
     log.info("[%s/%s]   + cleanup: %s", operator_name, namespace, ctx.cleanup_mode)
     log.info("[%s/%s]   + two-way-sync: %s", operator_name, namespace, ctx.two_way_sync)
+    log.info(
+        "[%s/%s]   + full-refresh-interval: %s",
+        operator_name,
+        namespace,
+        ctx.full_refresh_interval or "always",
+    )
     log.info(
         "[%s/%s]   + entities-included: %s",
         operator_name,
@@ -164,11 +363,26 @@ async def appgate_operator(
     log.info("[%s/%s] Getting current state from controller", operator_name, namespace)
 
     # Get current and total state
+    poller: Optional[AppgateStatePoller] = None
     if ctx.reverse_mode:
         current_appgate_state = appgate_state_empty(ctx.api_spec)
-        expected_appgate_state = await get_current_appgate_state(
-            ctx=ctx, appgate_client=appgate_client
-        )
+        if ctx.full_refresh_interval:
+            # Poll only the changes in the controller between full refreshes
+            poller = appgate_state_poller(ctx=ctx, appgate_client=appgate_client)
+            await poller.poll(full=True)
+            expected_appgate_state = poller.appgate_state
+        else:
+            # We only need the builtin and target entities, let the controller
+            # filter them
+            expected_appgate_state = await get_current_appgate_state(
+                ctx=ctx,
+                appgate_client=appgate_client,
+                tags=(
+                    ctx.builtin_tags.union(ctx.target_tags)
+                    if ctx.builtin_tags and ctx.target_tags
+                    else None
+                ),
+            )
         total_appgate_state = deepcopy(expected_appgate_state)
         if ctx.builtin_tags:
             # only keep the default builtins entities
@@ -217,15 +431,31 @@ async def appgate_operator(
         namespace,
     )
     event_errors = []
+    # Entities (by type) that could have changed in the controller since the
+    # last refresh of the current state, used by two-way-sync.
+    changed_entities: Dict[str, Set[str]] = {}
+    track_changes = ctx.two_way_sync and not ctx.reverse_mode
+    last_full_refresh = time.monotonic()
+    # The first plan is computed as soon as the initial list of all the CRDs
+    # has been received, without waiting for the events to settle
+    initial_sync: Optional[asyncio.Future] = None
+    if informer:
+        initial_sync = asyncio.ensure_future(informer.wait_synced())
+    started = time.monotonic()
     while True:
         try:
             log.info("[%s/%s] Waiting for event", operator_name, namespace)
-            event: AppgateEvent = await asyncio.wait_for(
-                queue.get(), timeout=ctx.timeout
-            )
-            if isinstance(event, AppgateEventError):
-                event_errors.append(event)
-            else:
+            events: List[AppgateEvent] = [
+                await next_event(queue, timeout=ctx.timeout, synced=initial_sync)
+            ]
+            # Apply the events received meanwhile at once, only the last one of
+            # each entity changes the state
+            while not queue.empty():
+                events.append(queue.get_nowait())
+            for event in coalesce_events(events):
+                if isinstance(event, AppgateEventError):
+                    event_errors.append(event)
+                    continue
                 log.info(
                     "[%s/%s] Event: %s %s with name %s",
                     operator_name,
@@ -242,7 +472,28 @@ async def appgate_operator(
                     expected_appgate_state.with_entity(
                         EntityWrapper(event.entity), event.op, current_appgate_state
                     )
+                    if track_changes:
+                        changed_entities.setdefault(
+                            event.entity.__class__.__qualname__, set()
+                        ).add(event.entity.name)
         except asyncio.exceptions.TimeoutError:
+            if initial_sync:
+                if not initial_sync.done():
+                    # Planning now could delete the entities not listed yet
+                    log.warning(
+                        "[%s/%s] Waiting for the initial list of %s",
+                        operator_name,
+                        namespace,
+                        ", ".join(informer.pending() if informer else []),
+                    )
+                    continue
+                log.info(
+                    "[%s/%s] Initial list of all the CRDs received in %.2fs",
+                    operator_name,
+                    namespace,
+                    time.monotonic() - started,
+                )
+                initial_sync = None
             if event_errors:
                 log.error(
                     "[%s/%s] Found events with errors, dying now!",
@@ -262,9 +513,39 @@ async def appgate_operator(
 
             if ctx.reverse_mode:
                 # Fetch the state of the appgate system
-                expected_appgate_state = await get_current_appgate_state(
-                    ctx=ctx, appgate_client=appgate_client
-                )
+                try:
+                    if poller:
+                        full_refresh = (
+                            time.monotonic() - last_full_refresh
+                            >= ctx.full_refresh_interval
+                        )
+                        deltas = await poller.poll(full=full_refresh)
+                        if full_refresh:
+                            last_full_refresh = time.monotonic()
+                        for entity_type, entity_deltas in deltas.items():
+                            for delta in entity_deltas:
+                                log.info(
+                                    "[%s/%s] Controller event: %s %s with name %s",
+                                    operator_name,
+                                    namespace,
+                                    delta.op,
+                                    entity_type,
+                                    delta.entity.name,
+                                )
+                        # The poller applies the deltas to the state it keeps
+                        expected_appgate_state = poller.appgate_state
+                    else:
+                        expected_appgate_state = await get_current_appgate_state(
+                            ctx=ctx, appgate_client=appgate_client, tags=ctx.target_tags
+                        )
+                except (AppgateTransientException, AppgateCircuitOpenException) as exc:
+                    log.warning(
+                        "[%s/%s] Unable to read the current state, pausing: %s",
+                        operator_name,
+                        namespace,
+                        exc.message,
+                    )
+                    continue
                 if ctx.target_tags:
                     expected_appgate_state = AppgateState(
                         {
@@ -321,12 +602,35 @@ async def appgate_operator(
                 )
                 continue
 
-            if not ctx.reverse_mode and ctx.two_way_sync:
+            if track_changes:
                 # use current appgate state from controller instead of from memory
-                current_appgate_state = await get_current_appgate_state(
-                    ctx=ctx, appgate_client=appgate_client
+                full_refresh = (
+                    not ctx.full_refresh_interval
+                    or time.monotonic() - last_full_refresh >= ctx.full_refresh_interval
                 )
+                try:
+                    if full_refresh:
+                        current_appgate_state = await get_current_appgate_state(
+                            ctx=ctx, appgate_client=appgate_client
+                        )
+                        last_full_refresh = time.monotonic()
+                    else:
+                        current_appgate_state = await refresh_appgate_state(
+                            ctx=ctx,
+                            appgate_client=appgate_client,
+                            current_appgate_state=current_appgate_state,
+                            changed_entities=changed_entities,
+                        )
+                except (AppgateTransientException, AppgateCircuitOpenException) as exc:
+                    log.warning(
+                        "[%s/%s] Unable to read the current state, pausing: %s",
+                        operator_name,
+                        namespace,
+                        exc.message,
+                    )
+                    continue
                 total_appgate_state = deepcopy(current_appgate_state)
+                changed_entities = {}
 
             # Create a plan
             # Need to copy?
@@ -359,6 +663,7 @@ async def appgate_operator(
                         api_spec=ctx.api_spec,
                         namespace=ctx.namespace,
                         k8s_api=get_crds(),
+                        informer=informer,
                     )
 
                 new_plan, entity_clients = await appgate_plan_apply(
@@ -368,6 +673,9 @@ async def appgate_operator(
                     entity_clients=entity_clients,
                     k8s_configmap_client=k8s_configmap_client,
                     api_spec=ctx.api_spec,
+                    concurrency=ctx.apply_concurrency,
+                    mode=ctx.apply_mode,
+                    max_in_flight=ctx.apply_max_in_flight,
                 )
 
                 if len(new_plan.errors) > 0:
@@ -378,11 +686,32 @@ async def appgate_operator(
                     )
                     for err in new_plan.errors:
                         log.error("[%s/%s] Error %s:", operator_name, namespace, err)
+                    if appgate_client.circuit_breaker.is_open:
+                        # The controller is not available, wait for it instead of dying
+                        log.warning(
+                            "[%s/%s] Controller is not available, pausing until next cycle",
+                            operator_name,
+                            namespace,
+                        )
+                        if not ctx.dry_run_mode:
+                            # Keep what was applied, so it's not applied again
+                            current_appgate_state = new_plan.appgate_state
+                        continue
                     sys.exit(1)
 
                 if not ctx.dry_run_mode and not ctx.reverse_mode:
                     current_appgate_state = new_plan.appgate_state
                     expected_appgate_state = expected_appgate_state.sync_generations()
+                    for entity_type, entity_plan in new_plan.entities_plan.items():
+                        names = {
+                            e.name
+                            for e in entity_plan.create.entities
+                            | entity_plan.modify.entities
+                        }
+                        if names and track_changes:
+                            changed_entities.setdefault(entity_type, set()).update(
+                                names
+                            )
                 elif not ctx.dry_run_mode and ctx.reverse_mode:
                     current_appgate_state = new_plan.appgate_state
             else:
@@ -391,6 +720,7 @@ async def appgate_operator(
                     operator_name,
                     namespace,
                 )
+            log_metrics(operator_name, namespace)
 
 
 async def main_loop(
@@ -408,6 +738,19 @@ async def main_loop(
         version=ctx.api_spec.api_version,
         no_verify=ctx.no_verify,
         cafile=ctx.cafile,
+        page_size=ctx.page_size,
+        max_retries=ctx.max_retries,
+        read_rate_limit=ctx.read_rate_limit,
+        write_rate_limit=ctx.write_rate_limit,
+        connection_pool_size=ctx.connection_pool_size,
+        connections_per_host=ctx.connections_per_host,
+        keepalive_timeout=ctx.keepalive_timeout,
+        dns_cache_ttl=ctx.dns_cache_ttl,
+        compression=ctx.compression,
+        record_file=ctx.record_file,
+        hedge_percentile=ctx.hedge_percentile,
+        hedge_budget=ctx.hedge_budget,
+        circuit_reset_timeout=ctx.circuit_reset_timeout,
         expiration_time_delta=ctx.timeout,
         dry_run=ctx.dry_run_mode,
     ) as appgate_client:
@@ -112,6 +112,8 @@ def _new_converter() -> Converter:
     def _unstructure_set(v: set[Any] | frozenset[Any]) -> List[Any]:
         values = [_json_safe(converter.unstructure(i)) for i in v]
         try:
+            # The order must not change between versions, keep the stdlib
+            # encoding as the sort key
             return sorted(values, key=lambda value: json.dumps(value, sort_keys=True))
         except Exception:
             return values
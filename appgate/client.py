@@ -1,14 +1,37 @@
 import asyncio
+import contextvars
 import datetime
+import email.utils
 import functools
+import hashlib
+import random
 import ssl
+import time
 import uuid
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Callable, Type
-from urllib.parse import urljoin
+from types import SimpleNamespace
+from typing import (
+    Dict,
+    Any,
+    Optional,
+    List,
+    Callable,
+    Type,
+    AsyncIterator,
+    FrozenSet,
+    Tuple,
+)
+from urllib.parse import urlencode
 
 import aiohttp
-from aiohttp import InvalidURL, ClientConnectorCertificateError, ClientConnectorError
+from aiohttp import (
+    InvalidURL,
+    ClientConnectorCertificateError,
+    ClientConnectorError,
+    ClientOSError,
+    ServerDisconnectedError,
+)
 from kubernetes.client import (
     CoreV1Api,
     V1ConfigMap,
@@ -27,7 +50,15 @@ from appgate.attrs import (
     K8S_DUMPER,
     k8s_name,
 )
+from appgate import codec
+from appgate.endpoints import Endpoint, EndpointPool, parse_controllers
+from appgate.hedging import HedgingPolicy
+from appgate.jsonstream import CollectionParser
 from appgate.logger import log
+from appgate.metrics import Summary, counter, gauge, summary
+from appgate.recorder import Recorder
+from appgate.ratelimiter import TokenBucket, RATE_LIMITED_BACKOFF
+from appgate.watcher import Informer
 from appgate.openapi.types import Entity_T, AppgateException, APISpec, EntityDumper
 from appgate.types import (
     LatestEntityGeneration,
@@ -37,13 +68,28 @@ from appgate.types import (
 
 __all__ = [
     "AppgateClient",
+    "AppgateTransientException",
+    "AppgateCircuitOpenException",
+    "AppgateNotFoundException",
+    "RetryPolicy",
+    "CircuitBreaker",
+    "retry_policies",
     "AppgateEntityClient",
+    "EntityClientState",
     "K8SConfigMapClient",
     "entity_unique_id",
     "K8sEntityClient",
 ]
 
 
+# Query parameter used to list only the entities with a tag
+FILTER_BY_TAG_PARAM = "filterBy[tag]"
+# Page size used to list the updated entities when paging is disabled
+DELTA_PAGE_SIZE = 50
+# Size of the chunks read when decoding a response while it's being received
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
 def get_plural(kind: str) -> str:
     entity_name = kind.lower()
     if entity_name.endswith("y"):
@@ -64,6 +110,8 @@ class K8sEntityClient(EntityClient):
     crd_version: str = attrib()
     namespace: str = attrib()
     kind: str = attrib()
+    # Custom resources known by the watches, used to avoid unneeded writes
+    informer: Optional[Informer] = attrib(default=None, hash=False, eq=False)
 
     @functools.cache
     def crd_domain(self) -> str:
@@ -73,9 +121,33 @@ class K8sEntityClient(EntityClient):
     def dumper(self) -> EntityDumper:
         return K8S_DUMPER(self.api_spec)
 
+    def _up_to_date(self, data: Dict[str, Any]) -> bool:
+        """
+        The custom resource for data is known and has the same spec and annotations.
+        """
+        if self.informer is None:
+            return False
+        current = self.informer.get(self.kind, data["metadata"]["name"])
+        if current is None or current.get("spec") != data["spec"]:
+            return False
+        annotations = current["metadata"].get("annotations") or {}
+        return all(
+            annotations.get(k) == v
+            for k, v in (data["metadata"].get("annotations") or {}).items()
+        )
+
+    def _skip(self, e: Entity_T, reason: str) -> EntityClient:
+        log.info("[k8s-entity-client/%s] k8s entity %s %s", self.kind, e.name, reason)
+        counter("appgate_k8s_writes_skipped", kind=self.kind).inc()
+        return self
+
     async def create(self, e: Entity_T) -> EntityClient:
+        if self.informer and self.informer.get(self.kind, k8s_name(e.name)):
+            # Created meanwhile (or we missed its event), update it instead
+            return await self.modify(e)
         log.info("[k8s-entity-client/%s] Creating k8s entity %s", self.kind, e.name)
-        self.k8s_api.create_namespaced_custom_object(  # type: ignore
+        await asyncio.to_thread(
+            self.k8s_api.create_namespaced_custom_object,  # type: ignore
             self.crd_domain(),
             self.crd_version,
             self.namespace,
@@ -85,8 +157,15 @@ class K8sEntityClient(EntityClient):
         return self
 
     async def delete(self, e: Entity_T) -> EntityClient:
+        if (
+            self.informer
+            and self.informer.synced(self.kind)
+            and self.informer.get(self.kind, k8s_name(e.name)) is None
+        ):
+            return self._skip(e, "does not exist, nothing to delete")
         log.info("[k8s-entity-client/%s] Deleting k8s entity %s", self.kind, e.name)
-        self.k8s_api.delete_namespaced_custom_object(
+        await asyncio.to_thread(
+            self.k8s_api.delete_namespaced_custom_object,
             self.crd_domain(),
             self.crd_version,
             self.namespace,
@@ -96,9 +175,12 @@ class K8sEntityClient(EntityClient):
         return self
 
     async def modify(self, e: Entity_T) -> EntityClient:
-        log.info("[k8s-entity-client/%s] Updating k8s entity %s", self.kind, e.name)
         data = self.dumper().dump(e, True, None)
-        self.k8s_api.patch_namespaced_custom_object(  # type: ignore
+        if self._up_to_date(data):
+            return self._skip(e, "is up to date, nothing to update")
+        log.info("[k8s-entity-client/%s] Updating k8s entity %s", self.kind, e.name)
+        await asyncio.to_thread(
+            self.k8s_api.patch_namespaced_custom_object,  # type: ignore
             self.crd_domain(),
             self.crd_version,
             self.namespace,
@@ -109,6 +191,23 @@ class K8sEntityClient(EntityClient):
         return self
 
 
+@attrs()
+class EntityClientState:
+    """
+    State of the entity client of a type, kept between cycles.
+    """
+
+    # Time spent in the requests made to the collection
+    latency: Summary = attrib(factory=Summary)
+    # totalCount reported and number of pages walked in the last listing
+    total_count: Optional[int] = attrib(default=None)
+    pages: int = attrib(default=0)
+    # Parameters of each request made in the last listing, pages and tag filters
+    listing: List[Optional[Dict[str, str]]] = attrib(factory=list)
+    # The controller failed to filter the collection by tag
+    unfilterable: bool = attrib(default=False)
+
+
 class AppgateEntityClient(EntityClient):
     def __init__(
         self,
@@ -120,6 +219,9 @@ class AppgateEntityClient(EntityClient):
         kind: str,
         magic_entities: Optional[List[Entity_T]] = None,
         dry_run: bool = False,
+        page_size: int = 0,
+        filterable: bool = False,
+        incremental: bool = False,
     ) -> None:
         self._client = appgate_client
         self.path = path
@@ -129,24 +231,255 @@ class AppgateEntityClient(EntityClient):
         self.magic_entities = magic_entities
         self.dry_run = dry_run
         self.kind = kind
+        self.page_size = page_size
+        # The controller can filter this collection by tag
+        self.filterable = filterable and not singleton
+        # The controller can list this collection by update time
+        self.incremental = incremental and not singleton
+        self.state = EntityClientState(
+            latency=summary("appgate_entity_client_request_seconds", kind=kind)
+        )
+
+    @property
+    def paged(self) -> bool:
+        return self.page_size > 0 and not self.singleton
+
+    @property
+    def validators(self) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        ETag and Last-Modified of each response of the last listing of the
+        collection, one per page and tag filter, each one is revalidated on its own.
+        """
+        validators: List[Tuple[Optional[str], Optional[str]]] = []
+        for params in self.state.listing:
+            cached = self._client.cached_response(self.path, params)
+            validators.append(
+                (cached.etag, cached.last_modified) if cached else (None, None)
+            )
+        return validators
+
+    @property
+    def _stream_load(self) -> Optional[Callable[[Dict[str, Any]], Entity_T]]:
+        # Collections are loaded while they are being received
+        return None if self.singleton else self.load
+
+    async def get(
+        self, tags: Optional[FrozenSet[str]] = None
+    ) -> Optional[List[Entity_T]]:
+        """
+        Get all the entities, if tags is specified only the ones with any of them.
+        The tags are filtered by the controller when it supports it.
+        """
+        entities = None
+        self.state.listing = []
+        if tags is not None and self.filterable:
+            entities = await self._list_with_tags(tags)
+        if entities is None:
+            entities = await self._list()
+        if entities is None:
+            return None
+        entities = entities + (self.magic_entities or [])
+        if tags is not None:
+            entities = [
+                e for e in entities if tags & (getattr(e, "tags", None) or set())
+            ]
+        return entities
 
-    async def get(self) -> Optional[List[Entity_T]]:
-        data = await self._client.get(self.path)
+    async def _list(
+        self, params: Optional[Dict[str, str]] = None
+    ) -> Optional[List[Entity_T]]:
+        if self.paged:
+            return [e async for e in self._get_pages(params)]
+        self.state.listing.append(params)
+        data = await self._get(
+            self.path, params=params, load=self._stream_load, cache=True
+        )
         if not data:
             log.error(
                 "[aggpate-client] GET %s :: Expecting a response but we got empty data",
                 self.path,
             )
             return None
+        self.state.total_count = data.get("totalCount")
+        self.state.pages = 1
+        return self._load_entities(data)
+
+    async def _get(
+        self,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        cache: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        start = time.monotonic()
+        try:
+            return await self._client.get(path, params=params, load=load, cache=cache)
+        finally:
+            self.state.latency.observe(time.monotonic() - start)
+
+    async def _list_with_tags(self, tags: FrozenSet[str]) -> Optional[List[Entity_T]]:
+        """
+        List the entities with any of tags using the controller filters, filters are
+        and-ed so we need a request per tag.
+        Returns None when the controller is not able to filter the collection.
+        """
+        if self.state.unfilterable:
+            return None
+        entities: Dict[str, Entity_T] = {}
+        try:
+            for tag in sorted(tags):
+                tagged = await self._list({FILTER_BY_TAG_PARAM: tag})
+                if tagged is None:
+                    raise AppgateException(f"Error: [GET {self.path}] Empty response")
+                entities.update({e.id: e for e in tagged})
+        except (AppgateTransientException, AppgateCircuitOpenException):
+            raise
+        except AppgateException as exc:
+            log.warning(
+                "[aggpate-client] GET %s :: Unable to filter by tag, filtering locally: %s",
+                self.path,
+                exc.message,
+            )
+            self.state.unfilterable = True
+            return None
+        return list(entities.values())
+
+    async def get_entity(self, id: str) -> Optional[Entity_T]:
+        """
+        Get the entity with id, None if it does not exist.
+        """
+        try:
+            data = await self._get(f"{self.path}/{id}")
+        except AppgateNotFoundException:
+            return None
+        if not data:
+            log.error(
+                "[aggpate-client] GET %s/%s :: Expecting a response but we got empty data",
+                self.path,
+                id,
+            )
+            raise AppgateException(f"Error: [GET {self.path}/{id}] Empty response")
+        return self.load(data)
+
+    async def get_updated_since(
+        self, since: datetime.datetime
+    ) -> Optional[List[Entity_T]]:
+        """
+        Get the entities updated at or after since, walking the collection from the
+        most recently updated entity until we find an older one.
+        """
+        page_size = self.page_size or DELTA_PAGE_SIZE
+        entities: List[Entity_T] = []
+        start = 0
+        while True:
+            params = {
+                "orderBy": "updated",
+                "descending": "true",
+                "range": f"{start}-{start + page_size}",
+            }
+            data = await self._get(self.path, params=params, load=self._stream_load)
+            if not data or "data" not in data:
+                log.error(
+                    "[aggpate-client] GET %s :: Expecting a response but we got empty data",
+                    self.path,
+                )
+                return None
+            page = self._load_entities(data)
+            for e in page:
+                # Entities without update time are always considered updated
+                if e.updated is not None and e.updated < since:
+                    return entities
+                entities.append(e)
+            start = start + len(page)
+            total_count = data.get("totalCount")
+            if len(page) < page_size or (
+                total_count is not None and start >= total_count
+            ):
+                return entities
+
+    async def count(self) -> Optional[int]:
+        """
+        Number of entities in the collection, None if the controller does not
+        report it.
+        """
+        data = await self._get(self.path, params={"range": "0-0"})
+        if not data:
+            return None
+        return data.get("totalCount")
+
+    def _load_entities(self, data: Dict[str, Any]) -> List[Entity_T]:
+        # Collections are loaded while they are being received
+        if self._stream_load is not None and "data" in data:
+            return list(data["data"])
         # TODO: We should discover this from the api spec
-        entities = None
         if "data" in data:
-            entities = [self.load(e) for e in data["data"]]
-        else:
-            entities = [self.load(data)]
-        if self.magic_entities:
-            return entities + self.magic_entities
-        return entities
+            return [self.load(e) for e in data["data"]]
+        return [self.load(data)]
+
+    def _page_params(
+        self, start: int, params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, str]:
+        return {
+            **(params or {}),
+            "range": f"{start}-{start + self.page_size}",
+            "orderBy": "name",
+        }
+
+    async def _get_page(
+        self, start: int, params: Optional[Dict[str, str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        return await self._get(
+            self.path,
+            params=self._page_params(start, params),
+            load=self._stream_load,
+            cache=True,
+        )
+
+    async def _get_pages(
+        self, params: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[Entity_T]:
+        """
+        Get the entities walking the collection page by page.
+        The next page is requested before loading the entities in the current one.
+        """
+        start = 0
+        pages = 0
+        next_page: Optional[asyncio.Task] = asyncio.create_task(
+            self._get_page(start, params)
+        )
+        try:
+            while next_page:
+                self.state.listing.append(self._page_params(start, params))
+                data = await next_page
+                next_page = None
+                if not data or "data" not in data:
+                    log.error(
+                        "[aggpate-client] GET %s :: Expecting a response but we got empty data",
+                        self.path,
+                    )
+                    raise AppgateException(
+                        f"Error: [GET {self.path}] Empty page received"
+                    )
+                page = data["data"]
+                start = start + len(page)
+                pages += 1
+                total_count = data.get("totalCount")
+                if total_count is not None:
+                    more_pages = len(page) > 0 and start < total_count
+                else:
+                    more_pages = len(page) >= self.page_size
+                if more_pages:
+                    next_page = asyncio.create_task(self._get_page(start, params))
+                    # Let the request for the next page start
+                    await asyncio.sleep(0)
+                else:
+                    self.state.total_count = total_count
+                    self.state.pages = pages
+                for e in self._load_entities(data):
+                    yield e
+        finally:
+            if next_page:
+                next_page.cancel()
 
     async def create(self, entity: Entity_T) -> EntityClient:
         await self.post(entity)
@@ -394,6 +727,296 @@ class K8SConfigMapClient:
         return entry
 
 
+class AppgateTransientException(AppgateException):
+    """
+    Error that may go away if the request is sent again: 5xx responses,
+    timeouts and connection errors.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status: Optional[int] = None,
+        connection_error: bool = False,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        super().__init__(message)
+        self.status = status
+        # The request never reached the controller
+        self.connection_error = connection_error
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After can be a number of seconds or an HTTP date
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_date.timestamp() - time.time(), 0)
+
+
+class AppgateCircuitOpenException(AppgateException):
+    pass
+
+
+class AppgateResponseException(AppgateException):
+    """
+    Error response from the controller to a request it did not like.
+    """
+
+    def __init__(self, message: str, status: int) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class AppgateNotFoundException(AppgateResponseException):
+    def __init__(self, message: str, status: int = 404) -> None:
+        super().__init__(message, status)
+
+
+@attrs(frozen=True)
+class RetryPolicy:
+    max_retries: int = attrib(default=3)
+    retry_statuses: FrozenSet[int] = attrib(
+        default=frozenset({429, 500, 502, 503, 504})
+    )
+    # Retry requests that could have reached the controller (timeouts, dropped connections)
+    retry_unknown_outcome: bool = attrib(default=True)
+    backoff_base: float = attrib(default=0.5)
+    backoff_max: float = attrib(default=30.0)
+
+    def should_retry(self, error: AppgateTransientException, retry: int) -> bool:
+        if retry >= self.max_retries:
+            return False
+        if error.status is not None:
+            return error.status in self.retry_statuses
+        return error.connection_error or self.retry_unknown_outcome
+
+    def backoff(self, retry: int) -> float:
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**retry))
+
+
+def retry_policies(max_retries: int) -> Dict[str, RetryPolicy]:
+    """
+    GET, PUT and DELETE are idempotent and can be retried on any transient error.
+    POST is only retried when we know that the controller did not process it
+    (connection refused, 429 and 503).
+    """
+    idempotent = RetryPolicy(max_retries=max_retries)
+    return {
+        "GET": idempotent,
+        "PUT": idempotent,
+        "DELETE": idempotent,
+        "POST": RetryPolicy(
+            max_retries=max_retries,
+            retry_statuses=frozenset({429, 503}),
+            retry_unknown_outcome=False,
+        ),
+    }
+
+
+# Set while sending the request probing the controller with the circuit half-open,
+# requests it sends (like a login) are let through too
+_circuit_probe: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "circuit_probe", default=False
+)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive requests failed with transient
+    errors. While open, requests fail fast with AppgateCircuitOpenException.
+    After reset_timeout seconds the circuit is half-open: a single request is
+    let through to probe the controller while the others keep failing fast.
+    The circuit is closed if it succeeds and opened again if it fails.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    @property
+    def healthy(self) -> bool:
+        return self.failures == 0
+
+    def check(self, probe: bool = True) -> bool:
+        """
+        Fail fast while the circuit is open.
+        Returns True when the caller is the request probing the controller, it
+        must call end_probe once it's done. Callers that can't probe always fail.
+        """
+        if self.opened_at is None or _circuit_probe.get():
+            return False
+        if (
+            not probe
+            or self.probing
+            or time.monotonic() - self.opened_at < self.reset_timeout
+        ):
+            raise AppgateCircuitOpenException(
+                "Circuit breaker is open, controller is not available"
+            )
+        log.info("[appgate-client] Probing if the controller is available")
+        self.probing = True
+        return True
+
+    def end_probe(self) -> None:
+        self.probing = False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            log.info("[appgate-client] Controller is available, closing circuit")
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            log.warning(
+                "[appgate-client] Controller is not available, opening circuit for %ss",
+                self.reset_timeout,
+            )
+            self.opened_at = time.monotonic()
+
+
+# Minimum time to wait between token renewals
+TOKEN_RENEWAL_MIN_DELAY = 5
+# Fraction of the lifetime of the token left when it's renewed, so it's renewed
+# before requests need to login
+TOKEN_RENEWAL_MARGIN = 0.1
+# Maximum number of listings cached for each collection
+CACHE_ENTRIES_PER_PATH = 16
+
+
+@attrs()
+class CachedResponse:
+    """
+    Last response received listing a collection, with the validators needed to
+    revalidate it and the entities loaded from it.
+    """
+
+    digest: str = attrib()
+    data: Dict[str, Any] = attrib()
+    etag: Optional[str] = attrib(default=None)
+    last_modified: Optional[str] = attrib(default=None)
+    # The entities were loaded while the response was being received
+    streamed: bool = attrib(default=False)
+    # Entities loaded by the digest of their JSON text, when streamed
+    loaded_items: Optional[Dict[bytes, Any]] = attrib(default=None)
+
+
+class ResponseCache:
+    """
+    Responses listing the collections, by path and parameters.
+    Each collection keeps at most max_entries listings (pages or filters), the
+    least recently used ones are forgotten first.
+    """
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES_PER_PATH) -> None:
+        self.max_entries = max_entries
+        self._paths: Dict[str, OrderedDict[str, CachedResponse]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._paths.values())
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entries = self._paths.get(key.split("?", 1)[0])
+        if entries is None or key not in entries:
+            return None
+        entries.move_to_end(key)
+        return entries[key]
+
+    def put(self, key: str, cached: CachedResponse) -> None:
+        entries = self._paths.setdefault(key.split("?", 1)[0], OrderedDict())
+        entries[key] = cached
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def invalidate(self, path: str) -> None:
+        """
+        Forget the responses for path and for the collections containing it.
+        """
+        for key_path in list(self._paths.keys()):
+            if path == key_path or path.startswith(key_path + "/"):
+                del self._paths[key_path]
+
+
+def connection_pool_trace_config() -> aiohttp.TraceConfig:
+    """
+    Report how the connections with the controller are used: new and reused
+    connections and requests waiting for a free connection in the pool.
+    """
+    trace_config = aiohttp.TraceConfig()
+    waiting = 0
+
+    async def on_connection_queued_start(
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceConnectionQueuedStartParams,
+    ) -> None:
+        nonlocal waiting
+        waiting += 1
+        context.queued_at = time.monotonic()
+        counter("appgate_client_connections_queued").inc()
+        gauge("appgate_client_connections_waiting").set(waiting)
+
+    async def on_connection_queued_end(
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceConnectionQueuedEndParams,
+    ) -> None:
+        nonlocal waiting
+        waiting -= 1
+        summary("appgate_client_connection_queued_seconds").observe(
+            time.monotonic() - context.queued_at
+        )
+        gauge("appgate_client_connections_waiting").set(waiting)
+
+    async def on_connection_create_end(
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceConnectionCreateEndParams,
+    ) -> None:
+        counter("appgate_client_connections_created").inc()
+
+    async def on_connection_reuseconn(
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceConnectionReuseconnParams,
+    ) -> None:
+        counter("appgate_client_connections_reused").inc()
+
+    trace_config.on_connection_queued_start.append(on_connection_queued_start)
+    trace_config.on_connection_queued_end.append(on_connection_queued_end)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace_config
+
+
+def cache_key(path: str, params: Optional[Dict[str, str]] = None) -> str:
+    path = "/" + path.lstrip("/")
+    if params:
+        return f"{path}?{urlencode(sorted(params.items()))}"
+    return path
+
+
 class AppgateClient:
     def __init__(
         self,
@@ -407,15 +1030,46 @@ class AppgateClient:
         expiration_time_delta: int,
         no_verify: bool = False,
         cafile: Optional[Path] = None,
+        page_size: int = 0,
+        max_retries: int = 3,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        read_rate_limit: float = 0,
+        write_rate_limit: float = 0,
+        connection_pool_size: int = 100,
+        connections_per_host: int = 0,
+        keepalive_timeout: float = 15.0,
+        dns_cache_ttl: int = 10,
+        compression: bool = True,
+        record_file: Optional[Path] = None,
+        hedge_percentile: float = 0.0,
+        hedge_budget: float = 0.1,
+        circuit_reset_timeout: float = 30.0,
     ) -> None:
         self.controller = controller
         self.user = user
         self.password = password
         self.provider = provider
-        self._session = aiohttp.ClientSession()
+        # Idle connections are kept open so new requests don't need to go through
+        # the TCP and TLS handshakes again.
+        connector = aiohttp.TCPConnector(
+            limit=connection_pool_size,
+            limit_per_host=connections_per_host,
+            keepalive_timeout=keepalive_timeout,
+            ttl_dns_cache=dns_cache_ttl,
+            enable_cleanup_closed=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            json_serialize=codec.dumps,
+            # aiohttp asks for gzip/deflate by default
+            headers=None if compression else {"Accept-Encoding": "identity"},
+            trace_configs=[connection_pool_trace_config()],
+        )
         self.device_id = device_id
-        self._token = None
+        self._token: Optional[str] = None
         self._expiration_time: float | None = None
+        # Seconds the last token was valid for when it was received
+        self._token_lifetime = 0.0
         self.version = version
         self.no_verify = no_verify
         self.ssl_context = (
@@ -423,9 +1077,43 @@ class AppgateClient:
         )
         self._expiration_time_delta = expiration_time_delta
         self.dry_run = dry_run
+        self.page_size = page_size
+        # Exchanges with the controller are recorded to be replayed later
+        self.recorder = Recorder(record_file) if record_file else None
+        self._cache = ResponseCache()
+        # Entity clients by entity type, they are kept with their state for the
+        # whole life of the client
+        self.entity_clients: Dict[type, AppgateEntityClient] = {}
+        self.retry_policies = retry_policies(max_retries)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(
+            reset_timeout=circuit_reset_timeout
+        )
+        self.hedging = HedgingPolicy(hedge_percentile, hedge_budget)
+        self.read_limiter = TokenBucket("read", read_rate_limit)
+        self.write_limiter = TokenBucket("write", write_rate_limit)
+        self._login_task: Optional[asyncio.Task] = None
+        self._token_renewal_task: Optional[asyncio.Task] = None
+
+    @property
+    def controller(self) -> str:
+        return self._controller
+
+    @controller.setter
+    def controller(self, controller: str) -> None:
+        # The controllers in the collective, comma separated
+        self._controller = controller
+        self.endpoints = EndpointPool(parse_controllers(controller))
 
     async def close(self) -> None:
+        tasks = [t for t in (self._token_renewal_task, self._login_task) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._token_renewal_task = None
+        self._login_task = None
         await self._session.close()
+        if self.recorder:
+            self.recorder.close()
 
     async def __aenter__(self) -> "AppgateClient":
         try:
@@ -433,6 +1121,7 @@ class AppgateClient:
         except Exception as e:
             await self.close()
             raise e
+        self._token_renewal_task = asyncio.create_task(self._renew_token_loop())
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
@@ -449,12 +1138,236 @@ class AppgateClient:
             return f"Bearer {self._token}"
         return None
 
+    async def _renew_token_loop(self) -> None:
+        """
+        Renew the token before it expires so requests don't need to wait for a login.
+        """
+        while self._expiration_time:
+            expires_in = self._expiration_time - datetime.datetime.now().timestamp()
+            margin = self._token_lifetime * TOKEN_RENEWAL_MARGIN
+            await asyncio.sleep(max(expires_in - margin, TOKEN_RENEWAL_MIN_DELAY))
+            log.info("[appgate-client] Renewing auth token")
+            try:
+                await self.login()
+            except AppgateException as e:
+                log.warning("[appgate-client] Unable to renew auth token: %s", e)
+
     async def request(
         self,
         verb: str,
         path: str,
         data: Optional[Dict[str, Any]] = None,
         should_retry: bool = True,
+        params: Optional[Dict[str, str]] = None,
+        auth: bool = True,
+        load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        cache: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Send a request to the controller retrying it when needed.
+        If load is specified for a GET request, the response is decoded while it's
+        being received and each element in its data is loaded with it.
+        """
+        probe = self.circuit_breaker.check()
+        if not probe:
+            return await self._request_with_retries(
+                verb, path, data, should_retry, params, auth, load, cache
+            )
+        token = _circuit_probe.set(True)
+        try:
+            return await self._request_with_retries(
+                verb, path, data, should_retry, params, auth, load, cache
+            )
+        finally:
+            _circuit_probe.reset(token)
+            self.circuit_breaker.end_probe()
+
+    async def _request_with_retries(
+        self,
+        verb: str,
+        path: str,
+        data: Optional[Dict[str, Any]],
+        should_retry: bool,
+        params: Optional[Dict[str, str]],
+        auth: bool,
+        load: Optional[Callable[[Dict[str, Any]], Any]],
+        cache: bool,
+    ) -> Optional[Dict[str, Any]]:
+        policy = self.retry_policies.get(verb, RetryPolicy(max_retries=0))
+        limiter = self.read_limiter if verb == "GET" else self.write_limiter
+        retry = 0
+        while True:
+            if retry:
+                # Stop retrying if the circuit was opened meanwhile
+                self.circuit_breaker.check(probe=False)
+            await limiter.acquire()
+            try:
+                if verb == "GET" and self.hedging.enabled:
+                    resp = await self._hedged_request(
+                        path=path,
+                        should_retry=should_retry,
+                        params=params,
+                        auth=auth,
+                        load=load,
+                        cache=cache,
+                    )
+                else:
+                    resp = await self._request(
+                        verb=verb,
+                        path=path,
+                        data=data,
+                        should_retry=should_retry,
+                        params=params,
+                        auth=auth,
+                        load=load,
+                        cache=cache,
+                    )
+            except AppgateTransientException as e:
+                if e.status == 429:
+                    limiter.backoff(e.retry_after or RATE_LIMITED_BACKOFF)
+                elif e.status == 503:
+                    limiter.backoff(e.retry_after)
+                if not policy.should_retry(e, retry):
+                    self.circuit_breaker.record_failure()
+                    raise e
+                delay = policy.backoff(retry)
+                retry += 1
+                log.warning(
+                    "[appgate-client] %s %s failed, retrying in %.2fs (%s/%s): %s",
+                    verb,
+                    path,
+                    delay,
+                    retry,
+                    policy.max_retries,
+                    e.message,
+                )
+                await asyncio.sleep(delay)
+                continue
+            except AppgateResponseException as e:
+                # The controller answered, it's just not happy with the request
+                self.circuit_breaker.record_success()
+                raise e
+            self.circuit_breaker.record_success()
+            limiter.recover()
+            return resp
+
+    async def _hedged_request(
+        self,
+        path: str,
+        should_retry: bool = True,
+        params: Optional[Dict[str, str]] = None,
+        auth: bool = True,
+        load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        cache: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        GET path sending a second request, to another controller when possible,
+        if the first one takes longer than usual. The first response wins.
+        """
+
+        async def send(endpoint: Endpoint, limited: bool) -> Optional[Dict[str, Any]]:
+            if limited:
+                # Hedges count against the rate limit as any other request
+                await self.read_limiter.acquire()
+            return await self._request(
+                verb="GET",
+                path=path,
+                should_retry=should_retry,
+                params=params,
+                auth=auth,
+                load=load,
+                cache=cache,
+                endpoint=endpoint,
+            )
+
+        start = time.monotonic()
+        endpoint = self.endpoints.read_endpoint()
+        # The caller already waited for the rate limiter
+        first = asyncio.create_task(send(endpoint, limited=False))
+        hedge: Optional[asyncio.Task] = None
+        try:
+            delay = self.hedging.delay(path)
+            if delay is not None:
+                await asyncio.wait({first}, timeout=delay)
+            if first.done() or delay is None or not self.hedging.acquire():
+                resp = await first
+            else:
+                hedge = asyncio.create_task(
+                    send(self.endpoints.read_endpoint(exclude=endpoint), limited=True)
+                )
+                resp = await self._first_response(first, hedge)
+            # When the hedge wins this is a lower bound of the original latency
+            self.hedging.record(path, time.monotonic() - start)
+            return resp
+        finally:
+            first.cancel()
+            if hedge:
+                hedge.cancel()
+
+    async def _first_response(
+        self, first: asyncio.Task, hedge: asyncio.Task
+    ) -> Optional[Dict[str, Any]]:
+        pending = {first, hedge}
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    counter(
+                        "appgate_client_hedged_requests",
+                        winner="hedge" if task is hedge else "original",
+                    ).inc()
+                    return task.result()
+        # Both failed, report the error of the original request
+        return first.result()
+
+    async def _request(
+        self,
+        verb: str,
+        path: str,
+        data: Optional[Dict[str, Any]] = None,
+        should_retry: bool = True,
+        params: Optional[Dict[str, str]] = None,
+        auth: bool = True,
+        load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        cache: bool = False,
+        endpoint: Optional[Endpoint] = None,
+    ) -> Optional[Dict[str, Any]]:
+        # Reads are spread across the controllers, writes go to the primary one
+        if endpoint is None and verb == "GET":
+            endpoint = self.endpoints.read_endpoint()
+        elif endpoint is None:
+            endpoint = self.endpoints.write_endpoint()
+        try:
+            return await self._request_endpoint(
+                endpoint,
+                verb=verb,
+                path=path,
+                data=data,
+                should_retry=should_retry,
+                params=params,
+                auth=auth,
+                load=load,
+                cache=cache,
+            )
+        except AppgateTransientException as e:
+            # Being rate limited does not mean the controller is not healthy
+            if e.status != 429:
+                self.endpoints.record_failure(endpoint)
+            raise e
+
+    async def _request_endpoint(
+        self,
+        endpoint: Endpoint,
+        verb: str,
+        path: str,
+        data: Optional[Dict[str, Any]] = None,
+        should_retry: bool = True,
+        params: Optional[Dict[str, str]] = None,
+        auth: bool = True,
+        load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        cache: bool = False,
     ) -> Optional[Dict[str, Any]]:
         verbs = {
             "POST": self._session.post,
@@ -469,43 +1382,94 @@ class AppgateClient:
             "Accept": f"application/vnd.appgate.peer-v{self.version}+json",
             "Content-Type": "application/json",
         }
-        auth_header = await self.auth_header()
+        auth_header = await self.auth_header() if auth else None
         if auth_header:
             headers["Authorization"] = auth_header
-        url = urljoin(self.controller.rstrip("/") + "/", path.lstrip("/"))
+        token = self._token
+        key = cache_key(path, params)
+        cached = self._cache.get(key) if verb == "GET" and cache else None
+        if verb != "GET":
+            self.invalidate_cache(path)
+        elif cached and cached.streamed != (load is not None):
+            # The cached response is not in the format requested
+            cached = None
+        elif cached:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        url = endpoint.url_for(path)
+        start = time.monotonic()
         try:
             async with method(
                 url=url,  # type: ignore
                 headers=headers,
                 json=data,
+                params=params,
                 ssl=self.ssl_context,  # type: ignore
                 verify_ssl=not self.no_verify,
             ) as resp:
+                if resp.status // 100 != 5:
+                    self.endpoints.record_latency(endpoint, time.monotonic() - start)
                 status_code = resp.status // 100
+                streamed = verb == "GET" and load is not None and status_code == 2
+                if self.recorder and not streamed:
+                    self._record(resp, data, await resp.read())
+                if resp.status == 304 and cached:
+                    log.debug("[appgate-client] GET %s not modified", url)
+                    return cached.data
                 if status_code == 2:
                     if resp.status == 204:
                         return {}
+                    elif verb == "GET" and load is not None:
+                        return await self._stream_response(
+                            key if cache else None, resp, load
+                        )
+                    elif verb == "GET" and cache:
+                        return self._cache_response(key, resp, await resp.read())
                     else:
-                        return await resp.json()
+                        return await resp.json(loads=codec.loads)
                 else:
                     if resp.status == 409 and verb == "POST":
                         log.info("[appgate-client] Retrying %s %s as PUT", verb, url)
-                        return await self.request(
+                        return await self._request(
                             verb="PUT", path=path, data=data, should_retry=False
                         )
-                    if resp.status in [401, 403]:
+                    if auth and resp.status in [401, 403]:
                         # Renew the token and retry again if needed
                         if should_retry:
-                            await self.login()
-                            return await self.request(
-                                verb=verb, path=path, data=data, should_retry=False
+                            # Someone else could have renewed the token already
+                            if self._token == token:
+                                await self.login()
+                            return await self._request(
+                                verb=verb,
+                                path=path,
+                                data=data,
+                                should_retry=False,
+                                params=params,
+                                load=load,
+                                cache=cache,
                             )
                     error_data = await resp.text()
                     log.error(
                         "[aggpate-client] %s :: %s: %s", url, resp.status, error_data
                     )
-                    raise AppgateException(
-                        f"Error: [{method} {url} {resp.status}] {error_data}"
+                    if resp.status == 404:
+                        raise AppgateNotFoundException(
+                            f"Error: [{method} {url} {resp.status}] {error_data}",
+                            status=resp.status,
+                        )
+                    if status_code == 5 or resp.status == 429:
+                        raise AppgateTransientException(
+                            f"Error: [{verb} {url} {resp.status}] {error_data}",
+                            status=resp.status,
+                            retry_after=parse_retry_after(
+                                resp.headers.get("Retry-After")
+                            ),
+                        )
+                    raise AppgateResponseException(
+                        f"Error: [{method} {url} {resp.status}] {error_data}",
+                        status=resp.status,
                     )
         except InvalidURL:
             log.error("[appgate-client] Error preforming query: %s", url)
@@ -523,15 +1487,134 @@ class AppgateClient:
                 e.host,
                 e.strerror,
             )
-            raise AppgateException(f"Error: {e.strerror}")
+            raise AppgateTransientException(
+                f"Error: {e.strerror}", connection_error=True
+            )
+        except (ServerDisconnectedError, ClientOSError) as e:
+            log.error("[appgate-client] Connection error with %s: %s", url, e)
+            raise AppgateTransientException(f"Error: [{verb} {url}] {e}")
+        except asyncio.TimeoutError:
+            log.error("[appgate-client] Timeout waiting for %s %s", verb, url)
+            raise AppgateTransientException(f"Error: [{verb} {url}] Timeout")
+
+    def _record(
+        self,
+        resp: aiohttp.ClientResponse,
+        data: Optional[Dict[str, Any]],
+        body: bytes,
+    ) -> None:
+        assert self.recorder is not None
+        self.recorder.record(
+            method=resp.method,
+            path=resp.url.path,
+            params=dict(resp.url.query),
+            request_headers=dict(resp.request_info.headers),
+            request_body=data,
+            status=resp.status,
+            headers=resp.headers,
+            body=body,
+        )
+
+    def _revalidate_response(
+        self, key: str, resp: aiohttp.ClientResponse, digest: str, streamed: bool
+    ) -> Optional[Dict[str, Any]]:
+        cached = self._cache.get(key)
+        if cached and cached.digest == digest and cached.streamed == streamed:
+            # Same content, keep the entities already loaded
+            cached.etag = resp.headers.get("ETag")
+            cached.last_modified = resp.headers.get("Last-Modified")
+            return cached.data
+        return None
+
+    async def _stream_response(
+        self,
+        key: Optional[str],
+        resp: aiohttp.ClientResponse,
+        load: Callable[[Dict[str, Any]], Any],
+    ) -> Dict[str, Any]:
+        """
+        Decode the response while it's being received, loading each element in its
+        data as soon as it's complete.
+        """
+        digest = hashlib.sha256()
+        cached = self._cache.get(key) if key is not None else None
+        parser = CollectionParser(
+            load, loaded_items=cached.loaded_items if cached else None
+        )
+        chunks: List[bytes] = []
+        async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+            digest.update(chunk)
+            parser.feed(chunk)
+            if self.recorder:
+                chunks.append(chunk)
+        data = parser.close()
+        if self.recorder:
+            self._record(resp, None, b"".join(chunks))
+        if key is None:
+            return data
+        cached_data = self._revalidate_response(
+            key, resp, digest.hexdigest(), streamed=True
+        )
+        if cached_data is not None:
+            return cached_data
+        self._cache.put(
+            key,
+            CachedResponse(
+                digest=digest.hexdigest(),
+                data=data,
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+                streamed=True,
+                loaded_items=parser.loaded_items,
+            ),
+        )
+        return data
+
+    def _cache_response(
+        self, key: str, resp: aiohttp.ClientResponse, body: bytes
+    ) -> Dict[str, Any]:
+        digest = hashlib.sha256(body).hexdigest()
+        cached_data = self._revalidate_response(key, resp, digest, streamed=False)
+        if cached_data is not None:
+            return cached_data
+        data = codec.loads(body)
+        self._cache.put(
+            key,
+            CachedResponse(
+                digest=digest,
+                data=data,
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+            ),
+        )
+        return data
+
+    def cached_response(
+        self, path: str, params: Optional[Dict[str, str]] = None
+    ) -> Optional[CachedResponse]:
+        return self._cache.get(cache_key(path, params))
+
+    def invalidate_cache(self, path: str) -> None:
+        """
+        Forget the cached responses for path and for the collections containing it.
+        """
+        self._cache.invalidate(cache_key(path))
 
     async def post(
         self, path: str, body: Optional[Dict[str, Any]] = None
     ) -> Optional[Dict[str, Any]]:
         return await self.request("POST", path=path, data=body)
 
-    async def get(self, path: str) -> Optional[Dict[str, Any]]:
-        return await self.request("GET", path=path)
+    async def get(
+        self,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        cache: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        return await self.request(
+            "GET", path=path, params=params, load=load, cache=cache
+        )
 
     async def put(
         self, path: str, body: Optional[Dict[str, Any]] = None
@@ -544,13 +1627,22 @@ class AppgateClient:
         return await self.request("DELETE", path=path, data=body)
 
     async def login(self) -> None:
+        """
+        Get a new token. Concurrent callers wait for the same login request.
+        """
+        if not self._login_task or self._login_task.done():
+            self._login_task = asyncio.create_task(self._login())
+        # Don't cancel the login for everybody if one of the callers is cancelled
+        await asyncio.shield(self._login_task)
+
+    async def _login(self) -> None:
         body = {
             "providerName": self.provider,
             "username": self.user,
             "password": self.password,
             "deviceId": self.device_id,
         }
-        resp = await self.post("admin/login", body=body)
+        resp = await self.request("POST", "admin/login", data=body, auth=False)
         if resp:
             self._token = resp["token"]
             self._expiration_time = (
@@ -559,6 +1651,9 @@ class AppgateClient:
                 ).timestamp()
                 - self._expiration_time_delta
             )
+            self._token_lifetime = max(
+                self._expiration_time - datetime.datetime.now().timestamp(), 0.0
+            )
 
     @property
     def authenticated(self) -> bool:
@@ -570,9 +1665,16 @@ class AppgateClient:
         api_path: str,
         singleton: bool,
         magic_entities: Optional[List[Entity_T]],
+        filterable: bool = False,
+        incremental: bool = False,
     ) -> AppgateEntityClient:
+        """
+        Entity client for the entity type, created the first time it's needed.
+        """
+        if entity in self.entity_clients:
+            return self.entity_clients[entity]
         dumper = APPGATE_DUMPER
-        return AppgateEntityClient(
+        client = AppgateEntityClient(
             appgate_client=self,
             path=f"/admin/{api_path}",
             singleton=singleton,
@@ -581,4 +1683,9 @@ class AppgateClient:
             magic_entities=magic_entities,
             kind=entity.__qualname__,
             dry_run=self.dry_run,
+            page_size=self.page_size,
+            filterable=filterable,
+            incremental=incremental,
         )
+        self.entity_clients[entity] = client
+        return client
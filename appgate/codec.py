@@ -0,0 +1,55 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+__all__ = [
+    "BACKEND",
+    "dumps",
+    "loads",
+]
+
+
+# JSON library used to encode and decode payloads
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def dumps(value: Any, sort_keys: bool = False, indent: int = 0) -> str:
+    """
+    Encode value as JSON, sort_keys and indent work as in json.dumps.
+    Values that orjson is not able to encode fallback to json.
+    """
+    if orjson is not None and indent in (0, 2, 4):
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            encoded = orjson.dumps(value, option=option).decode()
+        except TypeError:
+            pass
+        else:
+            if indent == 4:
+                # orjson only indents with 2 spaces, strings never contain a raw
+                # new line so we can just double the indentation of each line.
+                encoded = "\n".join(
+                    " " * (len(line) - len(line.lstrip(" "))) + line
+                    for line in encoded.split("\n")
+                )
+            return encoded
+    if indent:
+        return json.dumps(value, sort_keys=sort_keys, indent=indent, ensure_ascii=False)
+    return json.dumps(
+        value, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=False
+    )
+
+
+def loads(data: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
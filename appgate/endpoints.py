@@ -0,0 +1,139 @@
+import random
+import time
+from typing import List, Optional
+from urllib.parse import urljoin
+
+from attr import attrib, attrs
+
+from appgate.logger import log
+from appgate.metrics import gauge
+
+
+__all__ = [
+    "Endpoint",
+    "EndpointPool",
+    "parse_controllers",
+]
+
+
+# Weight of the last request in the latency average of an endpoint
+LATENCY_SMOOTHING = 0.3
+# Probability of sending a read to a random healthy endpoint, so the latency of
+# the endpoints that are not the fastest one is still measured
+EXPLORATION_RATIO = 0.1
+# Time an endpoint is not used after failing, doubled on each consecutive failure
+DOWN_TIME = 5.0
+MAX_DOWN_TIME = 120.0
+
+
+def parse_controllers(controllers: str) -> List[str]:
+    """
+    Controller URLs from a comma separated list.
+    """
+    return [c.strip() for c in controllers.split(",") if c.strip()]
+
+
+@attrs()
+class Endpoint:
+    url: str = attrib()
+    # Moving average of the time to get the response headers, None until measured
+    latency: Optional[float] = attrib(default=None)
+    # Consecutive failures and until when the endpoint is considered down
+    failures: int = attrib(default=0)
+    down_until: float = attrib(default=0.0)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def url_for(self, path: str) -> str:
+        return urljoin(self.url.rstrip("/") + "/", path.lstrip("/"))
+
+    def __str__(self) -> str:
+        latency = f"{self.latency:.3f}s" if self.latency is not None else "unknown"
+        status = "healthy" if self.healthy else f"down ({self.failures} failures)"
+        return f"{self.url} {status}, latency {latency}"
+
+
+class EndpointPool:
+    """
+    Controllers of a collective. Reads go to the healthy controller with the
+    lowest latency, writes are pinned to the first healthy controller in the
+    configured order (the primary) and fail over to the next one while it's down.
+
+    Endpoints are marked down after a transient error and are retried again after
+    a delay that grows with the consecutive failures. When all of them are down
+    the one that will be back first is used.
+    """
+
+    def __init__(self, urls: List[str], rng: Optional[random.Random] = None) -> None:
+        if not urls:
+            raise ValueError("At least one controller is needed")
+        self.endpoints = [Endpoint(url=url) for url in urls]
+        self._rng = rng or random.Random()
+        for endpoint in self.endpoints:
+            self._report(endpoint)
+
+    def _healthy(self) -> List[Endpoint]:
+        return [e for e in self.endpoints if e.healthy]
+
+    def _first_back(self) -> Endpoint:
+        return min(self.endpoints, key=lambda e: e.down_until)
+
+    @property
+    def primary(self) -> Endpoint:
+        healthy = self._healthy()
+        return healthy[0] if healthy else self._first_back()
+
+    def read_endpoint(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        """
+        Endpoint to send a read to, a different one than exclude when possible.
+        """
+        healthy = [e for e in self._healthy() if e is not exclude] or self._healthy()
+        if not healthy:
+            return self._first_back()
+        # Endpoints not measured yet are tried first
+        unmeasured = [e for e in healthy if e.latency is None]
+        if unmeasured:
+            return unmeasured[0]
+        if len(healthy) > 1 and self._rng.random() < EXPLORATION_RATIO:
+            return self._rng.choice(healthy)
+        return min(healthy, key=lambda e: e.latency or 0.0)
+
+    def write_endpoint(self) -> Endpoint:
+        return self.primary
+
+    def record_latency(self, endpoint: Endpoint, elapsed: float) -> None:
+        if endpoint.latency is None:
+            endpoint.latency = elapsed
+        else:
+            endpoint.latency += LATENCY_SMOOTHING * (elapsed - endpoint.latency)
+        if endpoint.failures:
+            log.info("[appgate-client] Controller %s is available again", endpoint.url)
+        endpoint.failures = 0
+        endpoint.down_until = 0.0
+        self._report(endpoint)
+
+    def record_failure(self, endpoint: Endpoint) -> None:
+        endpoint.failures += 1
+        down_time = min(DOWN_TIME * 2 ** (endpoint.failures - 1), MAX_DOWN_TIME)
+        endpoint.down_until = time.monotonic() + down_time
+        if len(self.endpoints) > 1:
+            log.warning(
+                "[appgate-client] Controller %s failed, not using it for %ss",
+                endpoint.url,
+                down_time,
+            )
+        self._report(endpoint)
+
+    def _report(self, endpoint: Endpoint) -> None:
+        gauge("appgate_controller_healthy", controller=endpoint.url).set(
+            1 if endpoint.healthy else 0
+        )
+        if endpoint.latency is not None:
+            gauge("appgate_controller_latency_seconds", controller=endpoint.url).set(
+                endpoint.latency
+            )
+
+    def __str__(self) -> str:
+        return ", ".join(str(e) for e in self.endpoints)
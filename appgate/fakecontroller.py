@@ -0,0 +1,298 @@
+import asyncio
+import datetime
+import random
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import attr
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from appgate import codec
+from appgate.attrs import APPGATE_DUMPER
+from appgate.logger import log
+from appgate.openapi.types import APISpec, GeneratedEntity
+
+
+__all__ = [
+    "FakeController",
+    "synthetic_entity",
+]
+
+
+TOKEN = "fake-controller-token"
+# Namespace used to generate the ids of the synthetic entities
+SYNTHETIC_NAMESPACE = uuid.UUID("7d1e4bde-52e5-4d4a-9b6b-6a3a2b1f9e0c")
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%S.%fZ"
+    )
+
+
+def _synthetic_value(tpe: Any, name: str, i: int) -> Any:
+    if tpe is str:
+        return f"{name}-{i}"
+    if tpe is bool:
+        return False
+    if tpe in (int, float):
+        return tpe(i)
+    if attr.has(tpe):
+        return tpe(**_required_values(tpe, i))
+    if getattr(tpe, "__origin__", tpe) in (frozenset, set, list, tuple):
+        return frozenset()
+    return None
+
+
+def _required_values(cls: type, i: int) -> Dict[str, Any]:
+    return {
+        f.name: _synthetic_value(f.type, f.name, i)
+        for f in attr.fields(cls)
+        if f.default is attr.NOTHING
+    }
+
+
+def synthetic_entity(
+    entity_name: str, entity: GeneratedEntity, i: int, tags: Iterable[str] = ()
+) -> Any:
+    """
+    Instance number i of the entity with the fields it requires filled with
+    synthetic values. The same values are generated for the same i.
+    """
+    fields = attr.fields_dict(entity.cls)
+    values = _required_values(entity.cls, i)
+    if "id" in fields:
+        values["id"] = str(uuid.uuid5(SYNTHETIC_NAMESPACE, f"{entity_name}-{i}"))
+    if "name" in fields:
+        values["name"] = f"{entity_name.lower()}-{i}"
+    if "tags" in fields:
+        values["tags"] = frozenset(tags)
+    return entity.cls(**values)
+
+
+class FakeController:
+    """
+    Local stand-in for a controller serving the entities in api_spec from memory.
+    It implements admin/login and the CRUD operations on each entity path,
+    collections support the range, orderBy, descending and filterBy[tag]
+    parameters and are served with an ETag.
+
+    Requests can be delayed (latency plus a random jitter), fail with a 503
+    (error_rate is the probability) and be rate limited (rate_limit requests per
+    second, answered with a 429 and Retry-After when exceeded).
+    """
+
+    def __init__(
+        self,
+        api_spec: APISpec,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit: int = 0,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.api_spec = api_spec
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self._rng = rng or random.Random()
+        self._paths = {
+            e.api_path.strip("/"): (n, e)
+            for n, e in api_spec.api_entities.items()
+            if e.api_path is not None
+        }
+        # Entities by path and id, singletons are stored with an empty id
+        self.entities: Dict[str, Dict[str, Dict[str, Any]]] = {
+            p: {} for p in self._paths
+        }
+        self._versions: Dict[str, int] = {p: 0 for p in self._paths}
+        # Requests received by method, including the failed ones
+        self.requests: Dict[str, int] = {}
+        self.rate_limited = 0
+        self.errors = 0
+        self._window = (0.0, 0)
+        self._server: Optional[TestServer] = None
+
+    def seed(
+        self,
+        count: int,
+        entity_types: Optional[Iterable[str]] = None,
+        tags: Iterable[str] = (),
+    ) -> int:
+        """
+        Store count synthetic entities of each entity type (all of them by default,
+        singletons get just one). Returns the number of entities stored.
+        Entity types that can not be generated are skipped.
+        """
+        seeded = 0
+        names = set(entity_types) if entity_types is not None else None
+        for path, (name, entity) in self._paths.items():
+            if names is not None and name not in names:
+                continue
+            try:
+                instances = [
+                    synthetic_entity(name, entity, i, tags)
+                    for i in range(1 if entity.singleton else count)
+                ]
+            except Exception as e:
+                log.warning(
+                    "[fake-controller] Unable to generate entities %s: %s", name, e
+                )
+                continue
+            for instance in instances:
+                self._store(path, APPGATE_DUMPER.dump(instance, True, None))
+                seeded += 1
+        return seeded
+
+    def _store(self, path: str, data: Dict[str, Any], id: Optional[str] = None) -> str:
+        _, entity = self._paths[path]
+        if entity.singleton:
+            id = ""
+        else:
+            id = id or data.get("id") or str(uuid.uuid4())
+            data = {**data, "id": id}
+        now = _now()
+        previous = self.entities[path].get(id)
+        data["created"] = previous["created"] if previous else now
+        data["updated"] = now
+        self.entities[path][id] = data
+        self._versions[path] += 1
+        return id
+
+    @property
+    def url(self) -> str:
+        assert self._server is not None
+        return str(self._server.make_url("/"))
+
+    async def __aenter__(self) -> "FakeController":
+        self._server = TestServer(self.app())
+        await self._server.start_server()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        if self._server:
+            await self._server.close()
+            self._server = None
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/admin/login", self._login)
+        app.router.add_route("*", "/admin/{path:.*}", self._entities)
+        return app
+
+    @web.middleware
+    async def _middleware(
+        self, request: web.Request, handler: Any
+    ) -> web.StreamResponse:
+        self.requests[request.method] = self.requests.get(request.method, 0) + 1
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.rate_limit:
+            now = time.monotonic()
+            start, count = self._window
+            if now - start >= 1:
+                start, count = now, 0
+            self._window = (start, count + 1)
+            if count >= self.rate_limit:
+                self.rate_limited += 1
+                retry_after = 1 - (now - start)
+                return web.Response(
+                    status=429, headers={"Retry-After": f"{retry_after:.3f}"}
+                )
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, text="Injected error")
+        return await handler(request)
+
+    async def _login(self, request: web.Request) -> web.Response:
+        expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            hours=1
+        )
+        return self._json(
+            {"token": TOKEN, "expires": expires.strftime("%Y-%m-%dT%H:%M:%S.000Z")}
+        )
+
+    def _json(
+        self, data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None
+    ) -> web.Response:
+        return web.Response(
+            status=status,
+            body=codec.dumps(data).encode(),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def _resolve(self, path: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Entity path and id of the entity in path (None for the collection).
+        """
+        path = path.strip("/")
+        for p in self._paths:
+            if path == p:
+                return p, None
+            if path.startswith(p + "/"):
+                return p, path[len(p) + 1 :]
+        return None
+
+    async def _entities(self, request: web.Request) -> web.Response:
+        if request.headers.get("Authorization") != f"Bearer {TOKEN}":
+            return web.Response(status=401, text="Unauthorized")
+        resolved = self._resolve(request.match_info["path"])
+        if resolved is None:
+            return web.Response(status=404, text="Not found")
+        path, id = resolved
+        _, entity = self._paths[path]
+        entities = self.entities[path]
+        if entity.singleton:
+            id = ""
+        if request.method == "GET" and id is None:
+            return self._list(request, path)
+        if request.method == "GET":
+            assert id is not None
+            if id not in entities:
+                return web.Response(status=404, text="Not found")
+            return self._json(entities[id])
+        if request.method == "POST" and id is None:
+            data = await request.json()
+            if data.get("id") in entities:
+                return web.Response(status=409, text="Conflict")
+            return self._json(entities[self._store(path, data)])
+        if request.method == "PUT" and id is not None:
+            data = await request.json()
+            if id not in entities and not entity.singleton:
+                return web.Response(status=404, text="Not found")
+            return self._json(entities[self._store(path, data, id)])
+        if request.method == "DELETE" and id is not None:
+            if entities.pop(id, None) is None:
+                return web.Response(status=404, text="Not found")
+            self._versions[path] += 1
+            return web.Response(status=204)
+        return web.Response(status=405, text="Method not allowed")
+
+    def _list(self, request: web.Request, path: str) -> web.Response:
+        _, entity = self._paths[path]
+        if entity.singleton:
+            return self._json(self.entities[path].get("", {}))
+        etag = f'"{path}-{self._versions[path]}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        entities: List[Dict[str, Any]] = list(self.entities[path].values())
+        tag = request.query.get("filterBy[tag]")
+        if tag is not None:
+            entities = [e for e in entities if tag in (e.get("tags") or [])]
+        order_by = request.query.get("orderBy", "name")
+        entities.sort(
+            key=lambda e: str(e.get(order_by) or ""),
+            reverse=request.query.get("descending") == "true",
+        )
+        data: Dict[str, Any] = {"totalCount": len(entities), "orderBy": order_by}
+        if "range" in request.query:
+            start, end = [int(x) for x in request.query["range"].split("-")]
+            entities = entities[start:end]
+            data["range"] = request.query["range"]
+        data["data"] = entities
+        return self._json(data, headers={"ETag": etag})
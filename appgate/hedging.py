@@ -0,0 +1,104 @@
+import collections
+import math
+from typing import Deque, Dict, Optional
+
+from appgate.metrics import counter
+
+
+__all__ = [
+    "LatencyHistogram",
+    "HedgingPolicy",
+    "route",
+]
+
+
+# Latencies kept per route to compute the hedge delay
+HISTOGRAM_SIZE = 200
+# Requests to a path measured before hedging them
+MIN_SAMPLES = 20
+# Hedges are never sent sooner than this
+MIN_HEDGE_DELAY = 0.005
+# Hedges that can be sent in a burst when there are budget left
+MAX_HEDGE_TOKENS = 10.0
+
+
+def route(path: str) -> str:
+    """
+    Route template of path, the entity ids are replaced so all the requests to the
+    entities of a collection share their latencies:
+    /admin/sites/<id> -> /admin/sites/{id}
+    """
+    parts = path.strip("/").split("/")
+    if len(parts) > 2:
+        parts[2] = "{id}"
+    return "/" + "/".join(parts)
+
+
+class LatencyHistogram:
+    """
+    Latencies of the last size requests.
+    """
+
+    def __init__(self, size: int = HISTOGRAM_SIZE) -> None:
+        self.samples: Deque[float] = collections.deque(maxlen=size)
+
+    def record(self, latency: float) -> None:
+        self.samples.append(latency)
+
+    def percentile(self, p: float) -> float:
+        """
+        Latency under which p percent of the requests completed.
+        """
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+class HedgingPolicy:
+    """
+    Decides when a GET request is hedged: a duplicate is sent once the request
+    has taken longer than the percentile of the latencies seen for its route.
+
+    Each request adds budget hedge tokens (0.1 means at most 10% extra requests)
+    and each hedge spends one, so hedging never adds more load than that.
+    A percentile of 0 disables hedging.
+    """
+
+    def __init__(self, percentile: float = 0.0, budget: float = 0.1) -> None:
+        self.percentile = percentile
+        self.budget = budget
+        self.tokens = 0.0
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.percentile > 0 and self.budget > 0
+
+    def record(self, path: str, latency: float) -> None:
+        key = route(path)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        histogram.record(latency)
+
+    def delay(self, path: str) -> Optional[float]:
+        """
+        Time to wait before hedging a request to path, None if it should not be
+        hedged because we don't know yet how long its requests take.
+        """
+        self.tokens = min(self.tokens + self.budget, MAX_HEDGE_TOKENS)
+        histogram = self.histograms.get(route(path))
+        if histogram is None or len(histogram.samples) < MIN_SAMPLES:
+            return None
+        return max(histogram.percentile(self.percentile), MIN_HEDGE_DELAY)
+
+    def acquire(self) -> bool:
+        """
+        Take a token to send a hedge, False if the budget is exhausted.
+        """
+        if self.tokens < 1:
+            counter("appgate_client_hedges_skipped").inc()
+            return False
+        self.tokens -= 1
+        return True
@@ -0,0 +1,160 @@
+import codecs
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+__all__ = [
+    "CollectionParser",
+]
+
+
+WHITESPACE = " \t\n\r"
+
+
+class CollectionParser:
+    """
+    Incremental parser for the JSON object returned when listing a collection:
+
+        {"data": [...], "range": "0-10", "totalCount": 42, ...}
+
+    The document is fed in chunks as it arrives. Each element in data is passed
+    to load as soon as it has been read, the raw element is dropped right after
+    and only the loaded one is kept. The rest of the values are kept as they are.
+
+    Elements already loaded in a previous response (loaded_items, by the digest
+    of their JSON text) are reused instead of being loaded again.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[Any], Any],
+        items_key: str = "data",
+        loaded_items: Optional[Dict[bytes, Any]] = None,
+    ) -> None:
+        self._load = load
+        self._previous_items = loaded_items or {}
+        self.loaded_items: Dict[bytes, Any] = {}
+        self._items_key = items_key
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = "start"
+        self._key: Optional[str] = None
+        self._items: List[Any] = []
+        self.result: Dict[str, Any] = {}
+
+    def feed(self, chunk: bytes, eof: bool = False) -> None:
+        # Forget what we already parsed
+        self._buffer = self._buffer[self._pos :] + self._text_decoder.decode(
+            chunk, final=eof
+        )
+        self._pos = 0
+        self._parse(eof)
+
+    def close(self) -> Dict[str, Any]:
+        self.feed(b"", eof=True)
+        if self._state != "end":
+            raise self._error("Unexpected end of document")
+        return self.result
+
+    def _error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self._buffer, self._pos)
+
+    def _decode(self, eof: bool) -> Optional[Tuple[Any, int]]:
+        """
+        Decode the value starting at the current position, None if we need more
+        data to know it.
+        """
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            return None
+        if end == len(self._buffer) and not eof:
+            # Numbers could continue in the next chunk
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return None
+        return value, end
+
+    def _parse(self, eof: bool) -> None:
+        buffer = self._buffer
+        while True:
+            while self._pos < len(buffer) and buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos == len(buffer):
+                return
+            c = buffer[self._pos]
+            state = self._state
+            if state == "start":
+                if c != "{":
+                    raise self._error("Expecting '{'")
+                self._pos += 1
+                self._state = "first_key"
+            elif state in ("first_key", "key"):
+                if c == "}" and state == "first_key":
+                    self._pos += 1
+                    self._state = "end"
+                    continue
+                if c != '"':
+                    raise self._error("Expecting property name")
+                decoded = self._decode(eof)
+                if decoded is None:
+                    return
+                self._key, self._pos = decoded
+                self._state = "colon"
+            elif state == "colon":
+                if c != ":":
+                    raise self._error("Expecting ':'")
+                self._pos += 1
+                self._state = "value"
+            elif state == "value":
+                assert self._key is not None
+                if self._key == self._items_key and c == "[":
+                    self._pos += 1
+                    self._items = []
+                    self.result[self._key] = self._items
+                    self._state = "first_item"
+                    continue
+                decoded = self._decode(eof)
+                if decoded is None:
+                    return
+                self.result[self._key], self._pos = decoded
+                self._state = "separator"
+            elif state == "separator":
+                if c == ",":
+                    self._state = "key"
+                elif c == "}":
+                    self._state = "end"
+                else:
+                    raise self._error("Expecting ',' or '}'")
+                self._pos += 1
+            elif state in ("first_item", "item"):
+                if c == "]" and state == "first_item":
+                    self._pos += 1
+                    self._state = "separator"
+                    continue
+                decoded = self._decode(eof)
+                if decoded is None:
+                    return
+                item, end = decoded
+                digest = hashlib.sha1(buffer[self._pos : end].encode()).digest()
+                self._pos = end
+                loaded = self._previous_items.get(digest)
+                if loaded is None:
+                    loaded = self._load(item)
+                self.loaded_items[digest] = loaded
+                self._items.append(loaded)
+                self._state = "item_separator"
+            elif state == "item_separator":
+                if c == ",":
+                    self._state = "item"
+                elif c == "]":
+                    self._state = "separator"
+                else:
+                    raise self._error("Expecting ',' or ']'")
+                self._pos += 1
+            else:
+                raise self._error("Extra data")
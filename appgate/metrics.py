@@ -0,0 +1,150 @@
+from typing import Dict, Tuple, List
+
+from attr import attrib, attrs
+
+from appgate.logger import is_debug, log
+
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Summary",
+    "MetricsRegistry",
+    "REGISTRY",
+    "counter",
+    "gauge",
+    "summary",
+    "log_metrics",
+]
+
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+@attrs()
+class Counter:
+    value: float = attrib(default=0)
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def __str__(self) -> str:
+        return f"{self.value:g}"
+
+
+@attrs()
+class Gauge:
+    value: float = attrib(default=0)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def __str__(self) -> str:
+        return f"{self.value:g}"
+
+
+@attrs()
+class Summary:
+    count: int = attrib(default=0)
+    total: float = attrib(default=0)
+    max: float = attrib(default=0)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def __str__(self) -> str:
+        return (
+            f"count={self.count} total={self.total:.3f}"
+            f" mean={self.mean:.3f} max={self.max:.3f}"
+        )
+
+
+class MetricsRegistry:
+    """
+    In-memory registry of the metrics collected by the operator.
+    Metrics are identified by name and labels.
+    """
+
+    def __init__(self) -> None:
+        self.counters: Dict[MetricKey, Counter] = {}
+        self.gauges: Dict[MetricKey, Gauge] = {}
+        self.summaries: Dict[MetricKey, Summary] = {}
+
+    def counter(self, name: str, **labels: str) -> Counter:
+        return self.counters.setdefault(_key(name, labels), Counter())
+
+    def gauge(self, name: str, **labels: str) -> Gauge:
+        return self.gauges.setdefault(_key(name, labels), Gauge())
+
+    def summary(self, name: str, **labels: str) -> Summary:
+        return self.summaries.setdefault(_key(name, labels), Summary())
+
+    def lines(self) -> List[str]:
+        metrics: Dict[MetricKey, Counter | Gauge | Summary] = {
+            **self.counters,
+            **self.gauges,
+            **self.summaries,
+        }
+        return [f"{_format_key(k)}: {metrics[k]}" for k in sorted(metrics.keys())]
+
+    def totals(self) -> Dict[str, float]:
+        """
+        Value of the counters by name, adding up all their labels.
+        """
+        totals: Dict[str, float] = {}
+        for (name, _), c in self.counters.items():
+            totals[name] = totals.get(name, 0) + c.value
+        return totals
+
+    def clear(self) -> None:
+        self.counters.clear()
+        self.gauges.clear()
+        self.summaries.clear()
+
+
+def _key(name: str, labels: Dict[str, str]) -> MetricKey:
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_key(key: MetricKey) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str, **labels: str) -> Counter:
+    return REGISTRY.counter(name, **labels)
+
+
+def gauge(name: str, **labels: str) -> Gauge:
+    return REGISTRY.gauge(name, **labels)
+
+
+def summary(name: str, **labels: str) -> Summary:
+    return REGISTRY.summary(name, **labels)
+
+
+def log_metrics(operator_name: str, namespace: str) -> None:
+    """
+    Log the totals of the counters, and all the metrics in debug mode.
+    """
+    totals = REGISTRY.totals()
+    log.info(
+        "[%s/%s] Metrics: %s",
+        operator_name,
+        namespace,
+        ", ".join(f"{k}={v:g}" for k, v in sorted(totals.items())) or "none",
+    )
+    if is_debug():
+        for line in REGISTRY.lines():
+            log.debug("[%s/%s] Metric %s", operator_name, namespace, line)
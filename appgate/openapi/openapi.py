@@ -332,7 +332,16 @@ MAGIC_ENTITIES = {
 def generate_api_spec_clients(
     api_spec: APISpec, appgate_client: AppgateClient
 ) -> Dict[str, EntityClient | None]:
+    # Collections can be filtered by tag and ordered by update time in the controller
+    list_properties = LIST_PROPERTIES.get(api_spec.api_version, set())
+    filterable = "filterBy" in list_properties
+    # Polling only the updated entities needs the count to find the deleted ones
+    incremental = "orderBy" in list_properties and "totalCount" in list_properties
+
     def _entity_client(e_name: str, e: GeneratedEntity) -> AppgateEntityClient:
+        # Entity clients are created only once and reused on each call
+        if e.cls in appgate_client.entity_clients:
+            return appgate_client.entity_clients[e.cls]
         magic_entities = None
         # We filter the None's in the caller anyway
         assert e.api_path is not None
@@ -344,7 +353,12 @@ def generate_api_spec_clients(
                 for magic_instance in MAGIC_ENTITIES[e_name]
             ]
         return appgate_client.entity_client(
-            e.cls, e.api_path, singleton=e.singleton, magic_entities=magic_entities
+            e.cls,
+            e.api_path,
+            singleton=e.singleton,
+            magic_entities=magic_entities,
+            filterable=filterable and "tags" in attrs.fields_dict(e.cls),
+            incremental=incremental and "updated" in attrs.fields_dict(e.cls),
         )
 
     return {n: _entity_client(n, e) for n, e in api_spec.api_entities.items()}
@@ -388,16 +388,36 @@ class APISpec:
     entities_to_exclude: frozenset[str] | None = attrib(default=None)
     entities_to_include: frozenset[str] | None = attrib(default=None)
 
-    @property
-    def entities_sorted(self) -> List[str]:
+    def _entities_sorter(self) -> TopologicalSorter:
+        """
+        Sorter of the API entities by their dependencies.
+        """
         entities_to_sort: Dict[str, Set[str]] = {
             entity_name: entity.entity_dependencies
             for entity_name, entity in self.entities.items()
             if entity.api_path is not None
         }
         log.trace("Entities to sort %s", entities_to_sort)
-        ts = TopologicalSorter(entities_to_sort)
-        return list(ts.static_order())
+        return TopologicalSorter(entities_to_sort)
+
+    @property
+    def entities_sorted(self) -> List[str]:
+        return list(self._entities_sorter().static_order())
+
+    @property
+    def entities_levels(self) -> List[List[str]]:
+        """
+        Entities grouped in topological levels, entities in a level only
+        depend on entities in previous levels.
+        """
+        ts = self._entities_sorter()
+        ts.prepare()
+        levels = []
+        while ts.is_active():
+            level = sorted(ts.get_ready())
+            levels.append(level)
+            ts.done(*level)
+        return levels
 
     @property
     def api_entities(self) -> EntitiesDict:
@@ -1,9 +1,7 @@
 import asyncio
 import os
-import sys
-import threading
 from asyncio import Queue
-from typing import Type, Any, Coroutine, Callable, Dict, Awaitable
+from typing import Type, Any, Coroutine, Callable, Dict, Awaitable, List, Tuple
 
 from kubernetes.client import CustomObjectsApi
 from kubernetes.config import (
@@ -11,12 +9,11 @@ from kubernetes.config import (
     load_kube_config,
     list_kube_config_contexts,
 )
-from kubernetes.watch import Watch
-from kubernetes.client.exceptions import ApiException
 
 from appgate.attrs import K8S_LOADER, dump_datetime
 from appgate.client import K8SConfigMapClient, entity_unique_id
 from appgate.logger import log
+from appgate.metrics import counter, summary
 from appgate.openapi.openapi import entity_names
 from appgate.openapi.types import (
     AppgateException,
@@ -36,14 +33,15 @@ from appgate.types import (
     AppgateEventError,
     crd_domain,
 )
+from appgate.watcher import Informer, K8sApi, Watch, WatchMultiplexer
 
 
 __all__ = [
     "init_kubernetes",
     "run_k8s",
     "get_crds",
-    "start_entity_loop",
-    "run_entity_loop",
+    "entity_event",
+    "coalesce_events",
 ]
 
 
@@ -68,40 +66,6 @@ def init_kubernetes(namespace: str | None) -> str:
     return ns
 
 
-async def start_entity_loop(
-    namespace: str,
-    crd: str,
-    entity_type: Type[Entity_T],
-    singleton: bool,
-    queue: Queue[AppgateEvent],
-    api_spec: APISpec,
-    k8s_configmap_client: K8SConfigMapClient | None,
-) -> None:
-    log.debug(
-        "[%s/%s] Starting loop event for entities on path: %s", crd, namespace, crd
-    )
-
-    def run(loop: asyncio.AbstractEventLoop) -> None:
-        t = threading.Thread(
-            target=run_entity_loop,
-            args=(
-                namespace,
-                crd,
-                loop,
-                queue,
-                K8S_LOADER.load,
-                entity_type,
-                singleton,
-                api_spec,
-                k8s_configmap_client,
-            ),
-            daemon=True,
-        )
-        t.start()
-
-    await asyncio.to_thread(run, asyncio.get_event_loop())
-
-
 def get_crds() -> CustomObjectsApi:
     global crds
     if not crds:
@@ -109,24 +73,35 @@ def get_crds() -> CustomObjectsApi:
     return crds
 
 
+def crd_path(namespace: str, crd: str, api_spec: APISpec) -> str:
+    domain = crd_domain(api_version=api_spec.api_version)
+    return f"/apis/{domain}/{K8S_APPGATE_VERSION}/namespaces/{namespace}/{crd}"
+
+
 def get_k8s_tasks(
     queue: Queue[AppgateEvent],
     api_spec: APISpec,
     namespace: str,
     k8s_configmap_client: K8SConfigMapClient | None,
-) -> list[Awaitable[None]]:
-    return [
-        start_entity_loop(
+    informer: Informer | None = None,
+) -> list[Watch]:
+    watches = []
+    for kind, e in api_spec.api_entities.items():
+        crd = entity_names(e.cls, {})[2]
+        handler = entity_event_handler(
             namespace=namespace,
+            crd=crd,
             queue=queue,
-            crd=entity_names(e.cls, {})[2],
-            singleton=e.singleton,
+            load=K8S_LOADER.load,
             entity_type=e.cls,
-            api_spec=api_spec,
+            singleton=e.singleton,
             k8s_configmap_client=k8s_configmap_client,
         )
-        for e in api_spec.api_entities.values()
-    ]
+        watch = Watch(crd, crd_path(namespace, crd, api_spec), handler)
+        if informer:
+            informer.add(kind, watch)
+        watches.append(watch)
+    return watches
 
 
 async def run_k8s(
@@ -135,138 +110,159 @@ async def run_k8s(
     api_spec: APISpec,
     k8s_configmap_client: K8SConfigMapClient | None,
     operator: Coroutine[Any, Any, None],
+    informer: Informer | None = None,
 ) -> None:
-    tasks = get_k8s_tasks(
+    """
+    Run the operator while watching the CRDs of all the entities, the watches
+    share the event loop (and the connections) with the operator and keep the
+    objects in informer up to date.
+    """
+    watches = get_k8s_tasks(
         queue=queue,
         api_spec=api_spec,
         namespace=namespace,
         k8s_configmap_client=k8s_configmap_client,
-    ) + [operator]
-
-    await asyncio.gather(*tasks)
+        informer=informer,
+    )
+    async with WatchMultiplexer(K8sApi(), watches) as multiplexer:
+        async with asyncio.TaskGroup() as tasks:
+            tasks.create_task(multiplexer.run())
+            tasks.create_task(operator)
 
 
-def run_entity_loop(
+def entity_event_handler(
     namespace: str,
     crd: str,
-    loop: asyncio.AbstractEventLoop,
     queue: Queue[AppgateEvent],
     load: Callable[[Dict[str, Any], Dict[str, Any] | None, type], Entity_T],
     entity_type: type,
     singleton: bool,
-    api_spec: APISpec,
     k8s_configmap_client: K8SConfigMapClient | None,
-) -> None:
-    log.info(f"[{crd}/{namespace}] Loop for {crd}/{namespace} started")
-    watcher = Watch().stream(
-        get_crds().list_namespaced_custom_object,
-        crd_domain(api_version=api_spec.api_version),
-        K8S_APPGATE_VERSION,
-        namespace,
-        crd,
-    )
-    while True:
-        try:
-            data = next(watcher)
-            data_obj = data["object"]
-            data_mt = data_obj["metadata"]
-            kind = data_obj["kind"]
-            spec = data_obj["spec"]
-            event = EventObject(metadata=data_mt, spec=spec, kind=kind)
-            if singleton:
-                name = "singleton"
-            else:
-                name = event.spec["name"]
-            if event:
-                assert data["type"] in ("ADDED", "DELETED", "MODIFIED")
-                ev = K8SEvent(data["type"], event)
-                try:
-                    # names are not unique between entities, so we need to come up with a unique name now
-                    mt = ev.object.metadata
-                    latest_entity_generation = None
-                    if k8s_configmap_client:
-                        latest_entity_generation = (
-                            k8s_configmap_client.read_entity_generation(
-                                entity_unique_id(kind, name)
-                            )
-                        )
-                    if latest_entity_generation:
-                        mt[APPGATE_METADATA_LATEST_GENERATION_FIELD] = (
-                            latest_entity_generation.generation
-                        )
-                        mt[APPGATE_METADATA_MODIFICATION_FIELD] = dump_datetime(
-                            latest_entity_generation.modified
-                        )
-                    entity = load(ev.object.spec, ev.object.metadata, entity_type)
-                    log.debug(
-                        "[%s/%s] K8SEvent type: %s: %s", crd, namespace, ev.type, entity
-                    )
-                    appgate_event: AppgateEvent = AppgateEventSuccess(
-                        op=ev.type, entity=entity
-                    )
-                except AppgateTypedloadException as e:
-                    log.error(
-                        "[%s/%s] Unable to parse event with name %s of type %s",
-                        crd,
-                        namespace,
-                        event.spec["name"],
-                        event.kind,
-                    )
-                    log.error(
-                        "[%s/%s]%s!!! Error message: %s",
-                        crd,
-                        namespace,
-                        " " * 4,
-                        e.message,
-                    )
-                    log.error(
-                        "[%s/%s]%s!!! Error when loading from: %s",
-                        crd,
-                        namespace,
-                        " " * 4,
-                        e.platform_type,
-                    )
-                    log.error(
-                        "[%s/%s]%s!!! Error when loading type: %s",
-                        crd,
-                        namespace,
-                        " " * 4,
-                        e.type_.__qualname__ if e.type_ else "Unknown",
-                    )
-                    log.error(
-                        "[%s/%s]%s!!! Error when loading value: %s",
-                        crd,
-                        namespace,
-                        " " * 4,
-                        e.value,
-                    )
-                    appgate_event = AppgateEventError(
-                        name=event.spec["name"], kind=event.kind, error=str(e)
-                    )
-
-                asyncio.run_coroutine_threadsafe(queue.put(appgate_event), loop)
-        except ApiException:
-            log.exception(
-                "[appgate-operator/%s] Error when subscribing events in k8s for %s [%s]",
-                namespace,
-                crd,
-                crd_domain(api_version=api_spec.api_version),
+) -> Callable[[Dict[str, Any]], Awaitable[None]]:
+    async def handle(data: Dict[str, Any]) -> None:
+        await queue.put(
+            entity_event(
+                data,
+                namespace=namespace,
+                crd=crd,
+                load=load,
+                entity_type=entity_type,
+                singleton=singleton,
+                k8s_configmap_client=k8s_configmap_client,
             )
-            sys.exit(1)
-        except StopIteration:
-            log.debug(
-                "[appgate-operator/%s] Event loop stopped, re-initializing watchers",
-                namespace,
+        )
+
+    return handle
+
+
+def entity_event(
+    data: Dict[str, Any],
+    namespace: str,
+    crd: str,
+    load: Callable[[Dict[str, Any], Dict[str, Any] | None, type], Entity_T],
+    entity_type: type,
+    singleton: bool,
+    k8s_configmap_client: K8SConfigMapClient | None,
+) -> AppgateEvent:
+    """
+    AppgateEvent for an event received when watching the entities in crd.
+    """
+    data_obj = data["object"]
+    data_mt = data_obj["metadata"]
+    kind = data_obj["kind"]
+    spec = data_obj["spec"]
+    event = EventObject(metadata=data_mt, spec=spec, kind=kind)
+    if singleton:
+        name = "singleton"
+    else:
+        name = event.spec["name"]
+    assert data["type"] in ("ADDED", "DELETED", "MODIFIED")
+    ev = K8SEvent(data["type"], event)
+    try:
+        # names are not unique between entities, so we need to come up with a unique name now
+        mt = ev.object.metadata
+        latest_entity_generation = None
+        if k8s_configmap_client:
+            latest_entity_generation = k8s_configmap_client.read_entity_generation(
+                entity_unique_id(kind, name)
             )
-            watcher = Watch().stream(
-                get_crds().list_namespaced_custom_object,
-                crd_domain(api_version=api_spec.api_version),
-                K8S_APPGATE_VERSION,
-                namespace,
-                crd,
+        if latest_entity_generation:
+            mt[APPGATE_METADATA_LATEST_GENERATION_FIELD] = (
+                latest_entity_generation.generation
             )
-        except Exception:
-            log.exception(
-                "[appgate-operator/%s] Unhandled error for %s", namespace, crd
+            mt[APPGATE_METADATA_MODIFICATION_FIELD] = dump_datetime(
+                latest_entity_generation.modified
             )
-            exit(1)
+        entity = load(ev.object.spec, ev.object.metadata, entity_type)
+        log.debug("[%s/%s] K8SEvent type: %s: %s", crd, namespace, ev.type, entity)
+        return AppgateEventSuccess(op=ev.type, entity=entity)
+    except AppgateTypedloadException as e:
+        log.error(
+            "[%s/%s] Unable to parse event with name %s of type %s",
+            crd,
+            namespace,
+            event.spec["name"],
+            event.kind,
+        )
+        log.error(
+            "[%s/%s]%s!!! Error message: %s",
+            crd,
+            namespace,
+            " " * 4,
+            e.message,
+        )
+        log.error(
+            "[%s/%s]%s!!! Error when loading from: %s",
+            crd,
+            namespace,
+            " " * 4,
+            e.platform_type,
+        )
+        log.error(
+            "[%s/%s]%s!!! Error when loading type: %s",
+            crd,
+            namespace,
+            " " * 4,
+            e.type_.__qualname__ if e.type_ else "Unknown",
+        )
+        log.error(
+            "[%s/%s]%s!!! Error when loading value: %s",
+            crd,
+            namespace,
+            " " * 4,
+            e.value,
+        )
+        return AppgateEventError(name=event.spec["name"], kind=event.kind, error=str(e))
+
+
+def coalesce_events(events: List[AppgateEvent]) -> List[AppgateEvent]:
+    """
+    Events with the same effect on the state as events, keeping only the last
+    one of each entity. An entity added and deleted within events is dropped
+    and one added and then modified is added with its last version.
+    Errors are always kept.
+    """
+    coalesced: Dict[Tuple[str, str], AppgateEventSuccess | None] = {}
+    errors: List[AppgateEvent] = []
+    for event in events:
+        if isinstance(event, AppgateEventError):
+            errors.append(event)
+            continue
+        key = (type(event.entity).__name__, event.entity.name)
+        if key not in coalesced:
+            coalesced[key] = event
+            continue
+        previous = coalesced[key]
+        if previous is None or previous.op != "ADDED":
+            coalesced[key] = event
+        elif event.op == "DELETED":
+            # Added and deleted before reaching the state, drop both
+            coalesced[key] = None
+        else:
+            coalesced[key] = AppgateEventSuccess(op="ADDED", entity=event.entity)
+    result = errors + [e for e in coalesced.values() if e is not None]
+    counter("appgate_operator_events_received").inc(len(events))
+    counter("appgate_operator_events_coalesced").inc(len(events) - len(result))
+    if result:
+        summary("appgate_operator_coalescing_ratio").observe(len(events) / len(result))
+    return result
@@ -0,0 +1,190 @@
+import asyncio
+import datetime
+from typing import Dict, List, Literal, Optional
+
+from attr import attrib, attrs
+
+from appgate.client import AppgateEntityClient
+from appgate.logger import log
+from appgate.metrics import counter
+from appgate.openapi.types import AppgateException, Entity_T
+from appgate.state import AppgateState, EntitiesSet
+from appgate.types import EntityWrapper
+
+
+__all__ = [
+    "EntityDelta",
+    "EntitiesPoller",
+    "AppgateStatePoller",
+    "entities_deltas",
+]
+
+
+DeltaOp = Literal["ADDED", "MODIFIED", "DELETED"]
+
+
+@attrs(slots=True, frozen=True)
+class EntityDelta:
+    op: DeltaOp = attrib()
+    entity: Entity_T = attrib()
+
+
+def entities_deltas(
+    old: Dict[str, Entity_T], new: Dict[str, Entity_T]
+) -> List[EntityDelta]:
+    """
+    Deltas needed to go from old to new, both are entities by id.
+    """
+    deltas = [EntityDelta("DELETED", e) for i, e in old.items() if i not in new]
+    for i, e in new.items():
+        if i not in old:
+            deltas.append(EntityDelta("ADDED", e))
+        elif old[i] != e:
+            deltas.append(EntityDelta("MODIFIED", e))
+    return deltas
+
+
+class EntitiesPoller:
+    """
+    Keeps the entities of a collection in sync with the controller.
+    Once the whole collection has been loaded, we only ask the controller for the
+    entities updated since the last one we know (high-water mark). Deleted entities
+    are detected comparing the number of entities and, only when it differs, listing
+    the collection again (a conditional request that reuses the entities already
+    loaded).
+    """
+
+    def __init__(self, client: AppgateEntityClient) -> None:
+        self.client = client
+        self.entities: Dict[str, Entity_T] = {}
+        self.high_water_mark: Optional[datetime.datetime] = None
+        self.loaded = False
+        self.magic_ids = {e.id for e in client.magic_entities or []}
+
+    @property
+    def incremental(self) -> bool:
+        return self.client.incremental and self.loaded
+
+    def _update_high_water_mark(self) -> None:
+        updated = [
+            e.updated for e in self.entities.values() if e.id not in self.magic_ids
+        ]
+        if any(u is None for u in updated):
+            # We can not know what changed without the update time
+            self.high_water_mark = None
+        else:
+            self.high_water_mark = max(updated, default=None)
+
+    async def load(self) -> List[EntityDelta]:
+        """
+        Load the whole collection.
+        """
+        entities = await self.client.get()
+        if entities is None:
+            raise AppgateException(f"Error reading entities from {self.client.path}")
+        new_entities = {e.id: e for e in entities}
+        deltas = entities_deltas(self.entities, new_entities)
+        self.entities = new_entities
+        self.loaded = True
+        self._update_high_water_mark()
+        return deltas
+
+    async def poll(self) -> List[EntityDelta]:
+        """
+        Get the changes in the collection since the last poll.
+        """
+        if not self.incremental or self.high_water_mark is None:
+            return await self.load()
+        updated = await self.client.get_updated_since(self.high_water_mark)
+        if updated is None:
+            raise AppgateException(f"Error reading entities from {self.client.path}")
+        deltas = []
+        for e in updated:
+            old = self.entities.get(e.id)
+            if old is None:
+                deltas.append(EntityDelta("ADDED", e))
+            elif old != e:
+                deltas.append(EntityDelta("MODIFIED", e))
+            self.entities[e.id] = e
+        known_ids = set(self.entities.keys()) - self.magic_ids
+        count = await self.client.count()
+        if count != len(known_ids):
+            log.debug(
+                "[appgate-poller] %s :: %s entities found, %s expected, listing all of them",
+                self.client.path,
+                count,
+                len(known_ids),
+            )
+            return deltas + await self.load()
+        self._update_high_water_mark()
+        return deltas
+
+
+class AppgateStatePoller:
+    """
+    Keeps the state of the controller in memory polling its collections.
+    """
+
+    def __init__(
+        self, entity_clients: Dict[str, AppgateEntityClient], concurrency: int = 1
+    ) -> None:
+        self.pollers = {k: EntitiesPoller(v) for k, v in entity_clients.items()}
+        self.concurrency = concurrency
+        self._appgate_state: Optional[AppgateState] = None
+
+    async def poll(self, full: bool = False) -> Dict[str, List[EntityDelta]]:
+        """
+        Get the changes in the controller since the last poll, when full is True
+        all the collections are loaded again.
+        """
+        semaphore = asyncio.Semaphore(max(self.concurrency, 1))
+
+        async def poll(poller: EntitiesPoller) -> List[EntityDelta]:
+            async with semaphore:
+                if full:
+                    return await poller.load()
+                return await poller.poll()
+
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                tasks = {
+                    k: task_group.create_task(poll(p)) for k, p in self.pollers.items()
+                }
+        except BaseExceptionGroup as e:
+            raise e.exceptions[0]
+        deltas = {k: t.result() for k, t in tasks.items()}
+        for entity_deltas in deltas.values():
+            for delta in entity_deltas:
+                counter("appgate_poller_deltas", op=delta.op).inc()
+        if full or self._appgate_state is None:
+            self._appgate_state = AppgateState(
+                entities_set={
+                    k: EntitiesSet({EntityWrapper(e) for e in p.entities.values()})
+                    for k, p in self.pollers.items()
+                }
+            )
+        else:
+            for entity_deltas in deltas.values():
+                self._apply_deltas(self._appgate_state, entity_deltas)
+        return {k: v for k, v in deltas.items() if v}
+
+    @staticmethod
+    def _apply_deltas(state: AppgateState, deltas: List[EntityDelta]) -> None:
+        for delta in deltas:
+            entity = EntityWrapper(delta.entity)
+            entities = state.entities_set.get(type(delta.entity).__name__)
+            old = entities.entities_by_id.get(entity.id) if entities else None
+            if old is not None and old.name != entity.name:
+                # Renamed, entities in the state are registered by name
+                state.with_entity(old, "DELETED", state)
+            state.with_entity(entity, delta.op, state)
+
+    @property
+    def appgate_state(self) -> AppgateState:
+        """
+        State of the controller in the last poll, updated with the deltas found.
+        """
+        if self._appgate_state is None:
+            raise AppgateException("The state of the controller was not polled yet")
+        # Resolving the state replaces its entity sets, keep ours
+        return AppgateState(entities_set=dict(self._appgate_state.entities_set))
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from typing import Optional
+
+from appgate.logger import log
+from appgate.metrics import summary, gauge
+
+
+__all__ = ["TokenBucket", "RATE_LIMITED_BACKOFF"]
+
+
+# The rate is never reduced below this fraction of the configured rate
+MIN_RATE_FACTOR = 1 / 16
+# Fraction of the configured rate recovered after each successful request
+RATE_RECOVERY_FACTOR = 1 / 10
+# Time to block requests on 429 when the controller does not send Retry-After
+RATE_LIMITED_BACKOFF = 1.0
+# The rate is reduced at most once per window, the requests in flight when the
+# controller asks to slow down fail together
+BACKOFF_WINDOW = 1.0
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter, rate is the number of requests per second and 0
+    means unlimited.
+
+    The limiter is adaptive: when the controller asks us to slow down (429/503)
+    requests are blocked until Retry-After and the rate is halved (once per
+    BACKOFF_WINDOW). The rate is recovered slowly while requests succeed.
+    """
+
+    def __init__(self, name: str, rate: float, burst: Optional[int] = None) -> None:
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = float(burst or max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.backed_off_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """
+        Wait until a request can be sent, returns the time waited in seconds.
+        """
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if not self.rate:
+                    break
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        waited = time.monotonic() - start
+        summary("appgate_client_rate_limiter_wait_seconds", bucket=self.name).observe(
+            waited
+        )
+        return waited
+
+    def backoff(self, retry_after: Optional[float] = None) -> None:
+        now = time.monotonic()
+        if retry_after is not None:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        if self.max_rate and (
+            self.backed_off_at is None or now - self.backed_off_at >= BACKOFF_WINDOW
+        ):
+            self.backed_off_at = now
+            self._refill(now)
+            self.rate = max(self.rate / 2, self.max_rate * MIN_RATE_FACTOR)
+        log.warning(
+            "[rate-limiter/%s] Controller asked to slow down, waiting %.2fs (rate %s/s)",
+            self.name,
+            max(self.blocked_until - now, 0),
+            self.rate or "unlimited",
+        )
+        gauge("appgate_client_rate_limiter_rate", bucket=self.name).set(self.rate)
+
+    def recover(self) -> None:
+        if self.rate < self.max_rate:
+            self._refill(time.monotonic())
+            self.rate = min(
+                self.max_rate, self.rate + self.max_rate * RATE_RECOVERY_FACTOR
+            )
+            gauge("appgate_client_rate_limiter_rate", bucket=self.name).set(self.rate)
@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import gzip
+import random
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from aiohttp import web
+from attr import attrib, attrs
+
+from appgate import codec
+from appgate.logger import log
+
+
+__all__ = [
+    "Exchange",
+    "Recorder",
+    "load_recording",
+    "redact",
+    "replay_app",
+]
+
+
+# Values of the fields with these words in their name are never recorded
+SECRET_FIELDS = re.compile(
+    r"password|secret|token|privatekey|passphrase|apikey|authorization", re.I
+)
+REDACTED = "<redacted>"
+# Response headers that are recorded, the rest are not needed to replay them
+# (bodies are recorded already decompressed)
+RESPONSE_HEADERS = frozenset({"Content-Type", "ETag", "Last-Modified", "Retry-After"})
+
+
+def redact(value: Any) -> Any:
+    """
+    Copy of value with the secrets replaced.
+    """
+    if isinstance(value, dict):
+        return {
+            k: REDACTED if SECRET_FIELDS.search(k) else redact(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+def redact_body(body: bytes) -> str:
+    try:
+        return codec.dumps(redact(codec.loads(body)))
+    except ValueError:
+        return body.decode(errors="replace")
+
+
+@attrs(frozen=True, slots=True)
+class Exchange:
+    """
+    A request sent to the controller and the response received.
+    """
+
+    method: str = attrib()
+    path: str = attrib()
+    params: Dict[str, str] = attrib(factory=dict)
+    request_headers: Dict[str, str] = attrib(factory=dict)
+    request_body: Optional[Any] = attrib(default=None)
+    status: int = attrib(default=200)
+    headers: Dict[str, str] = attrib(factory=dict)
+    body: str = attrib(default="")
+
+    @property
+    def key(self) -> Tuple[str, str, Tuple[Tuple[str, str], ...]]:
+        return self.method, self.path, tuple(sorted(self.params.items()))
+
+
+class Recorder:
+    """
+    Records the exchanges with the controller in a gzipped JSON lines file. The
+    secrets in the headers and bodies are redacted before they are written.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file: Optional[gzip.GzipFile] = None
+        self.recorded = 0
+
+    def record(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, str]],
+        request_headers: Dict[str, str],
+        request_body: Optional[Dict[str, Any]],
+        status: int,
+        headers: Mapping[str, str],
+        body: bytes,
+    ) -> None:
+        if self._file is None:
+            log.info("[recorder] Recording requests to the controller in %s", self.path)
+            self._file = gzip.open(self.path, "wb")
+        exchange = {
+            "method": method,
+            "path": "/" + path.lstrip("/"),
+            "params": dict(params or {}),
+            "request_headers": redact(dict(request_headers)),
+            "request_body": redact(request_body),
+            "status": status,
+            "headers": {
+                h: headers[h]
+                for h in sorted(RESPONSE_HEADERS)
+                if headers.get(h) is not None
+            },
+            "body": redact_body(body) if body else "",
+        }
+        self._file.write(codec.dumps(exchange).encode() + b"\n")
+        self.recorded += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_recording(path: Path) -> List[Exchange]:
+    with gzip.open(path, "rb") as f:
+        return [Exchange(**codec.loads(line)) for line in f if line.strip()]
+
+
+def replay_app(
+    exchanges: List[Exchange],
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    rng: Optional[random.Random] = None,
+) -> web.Application:
+    """
+    Application serving back the recorded responses, each request gets the
+    recorded responses for the same method, path and parameters in order (the
+    last one is repeated once all of them were served).
+
+    Each response is delayed by latency plus a random time up to jitter seconds.
+    """
+    rng = rng or random.Random()
+    responses: Dict[Tuple[str, str, Tuple[Tuple[str, str], ...]], List[Exchange]] = {}
+    for exchange in exchanges:
+        responses.setdefault(exchange.key, []).append(exchange)
+    served: Dict[Tuple[str, str, Tuple[Tuple[str, str], ...]], int] = {}
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        key = (request.method, request.path, tuple(sorted(request.query.items())))
+        recorded = responses.get(key)
+        if not recorded:
+            return web.Response(status=404, text=f"Not recorded: {request.path_qs}")
+        i = served.get(key, 0)
+        served[key] = i + 1
+        i = min(i, len(recorded) - 1)
+        exchange = recorded[i]
+        if exchange.status == 304 and not (
+            request.headers.get("If-None-Match")
+            or request.headers.get("If-Modified-Since")
+        ):
+            # The client has nothing cached, send the last full response instead
+            exchange = next(
+                (e for e in reversed(recorded[:i]) if e.status != 304), exchange
+            )
+        delay = latency + rng.uniform(0, jitter) if jitter else latency
+        if delay:
+            await asyncio.sleep(delay)
+        return web.Response(
+            status=exchange.status,
+            body=exchange.body.encode(),
+            headers=exchange.headers,
+        )
+
+    app = web.Application()
+    app.router.add_route("*", "/{path:.*}", handler)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve the responses recorded from a controller"
+    )
+    parser.add_argument("recording", type=Path)
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+    exchanges = load_recording(args.recording)
+    log.info("[recorder] Replaying %s recorded requests", len(exchanges))
+    web.run_app(
+        replay_app(exchanges, latency=args.latency, jitter=args.jitter), port=args.port
+    )
+
+
+if __name__ == "__main__":
+    main()
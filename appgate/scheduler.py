@@ -0,0 +1,128 @@
+import asyncio
+import time
+from graphlib import TopologicalSorter
+from typing import Dict, Set, Callable, Awaitable, Optional, List
+
+from attr import attrib, attrs
+
+
+__all__ = [
+    "NodeStats",
+    "GraphStats",
+    "run_graph",
+]
+
+
+@attrs()
+class NodeStats:
+    ready: float = attrib()
+    started: float = attrib()
+    finished: float = attrib()
+    error: Optional[str] = attrib(default=None)
+    skipped: bool = attrib(default=False)
+
+    @property
+    def wait_time(self) -> float:
+        """
+        Time the node waited for a worker once all its dependencies were done.
+        """
+        return self.started - self.ready
+
+    @property
+    def duration(self) -> float:
+        return self.finished - self.started
+
+
+@attrs()
+class GraphStats:
+    nodes: Dict[str, NodeStats] = attrib()
+    # Longest chain of dependent nodes
+    critical_path: List[str] = attrib()
+    critical_path_duration: float = attrib()
+
+    @property
+    def errors(self) -> Dict[str, str]:
+        return {k: v.error for k, v in self.nodes.items() if v.error}
+
+
+def critical_path(
+    graph: Dict[str, Set[str]], nodes: Dict[str, NodeStats]
+) -> tuple[List[str], float]:
+    paths: Dict[str, tuple[float, List[str]]] = {}
+    for n in TopologicalSorter(graph).static_order():
+        duration = nodes[n].duration if n in nodes else 0
+        longest = max(
+            (paths[d] for d in graph.get(n, set()) if d in paths),
+            key=lambda p: p[0],
+            default=(0.0, []),
+        )
+        paths[n] = (longest[0] + duration, longest[1] + [n])
+    duration, path = max(
+        paths.values(), key=lambda p: (p[0], len(p[1])), default=(0, [])
+    )
+    return path, duration
+
+
+async def run_graph(
+    graph: Dict[str, Set[str]],
+    run: Callable[[str], Awaitable[Optional[str]]],
+    skipped_error: Callable[[str, str], str],
+    max_in_flight: int = 0,
+) -> GraphStats:
+    """
+    Run every node in graph (node -> nodes it depends on) as soon as all its
+    dependencies are done, with at most max_in_flight nodes running (0 means no
+    limit). run returns an error message when it fails, nodes depending on a
+    failed node are not run and get the error from skipped_error(node, failed_node).
+    """
+    ts = TopologicalSorter(graph)
+    ts.prepare()
+    queue: asyncio.Queue[Optional[str]] = asyncio.Queue()
+    failed: Set[str] = set()
+    stats: Dict[str, NodeStats] = {}
+    ready_at: Dict[str, float] = {}
+    workers = max_in_flight if max_in_flight > 0 else max(len(graph), 1)
+
+    def schedule() -> None:
+        ready = list(ts.get_ready())
+        while ready:
+            n = ready.pop()
+            failed_deps = graph.get(n, set()) & failed
+            if failed_deps:
+                now = time.monotonic()
+                failed.add(n)
+                stats[n] = NodeStats(
+                    ready=now,
+                    started=now,
+                    finished=now,
+                    error=skipped_error(n, sorted(failed_deps)[0]),
+                    skipped=True,
+                )
+                ts.done(n)
+                ready.extend(ts.get_ready())
+            else:
+                ready_at[n] = time.monotonic()
+                queue.put_nowait(n)
+        if not ts.is_active():
+            for _ in range(workers):
+                queue.put_nowait(None)
+
+    async def worker() -> None:
+        while (n := await queue.get()) is not None:
+            started = time.monotonic()
+            error = await run(n)
+            stats[n] = NodeStats(
+                ready=ready_at[n],
+                started=started,
+                finished=time.monotonic(),
+                error=error,
+            )
+            if error:
+                failed.add(n)
+            ts.done(n)
+            schedule()
+
+    schedule()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    path, duration = critical_path(graph, stats)
+    return GraphStats(nodes=stats, critical_path=path, critical_path_duration=duration)
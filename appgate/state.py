@@ -1,6 +1,7 @@
+import asyncio
+import contextlib
 import difflib
 import itertools
-import json
 import sys
 import datetime
 import time
@@ -17,11 +18,14 @@ from typing import (
     List,
     FrozenSet,
     Iterator,
+    Callable,
+    Awaitable,
 )
 
 import yaml
 from attr import attrib, attrs, evolve
 
+from appgate import codec
 from appgate.logger import is_debug
 from appgate.attrs import DIFF_DUMPER, dump_datetime, K8S_DUMPER
 from appgate.client import (
@@ -29,6 +33,8 @@ from appgate.client import (
     entity_unique_id,
 )
 from appgate.logger import log
+from appgate.metrics import summary, gauge
+from appgate.scheduler import run_graph
 from appgate.openapi.types import (
     Entity_T,
     APISpec,
@@ -45,6 +51,7 @@ from appgate.types import (
     has_tag,
     is_target,
     EntityClient,
+    ApplyMode,
 )
 
 
@@ -267,15 +274,15 @@ def merge_entities(
     share: EntitiesSet,
     create: EntitiesSet,
     modify: EntitiesSet,
-    errors: Optional[Set[str]] = None,
+    failed_ids: Optional[Set[str]] = None,
 ) -> EntitiesSet:
     entities = set()
-    errors = errors or set()
+    failed_ids = failed_ids or set()
     entities.update(share.entities)
     entities.update(
-        {entity_sync_generation(e) for e in modify.entities if e.id not in errors}
+        {entity_sync_generation(e) for e in modify.entities if e.id not in failed_ids}
     )
-    entities.update({e for e in create.entities if e.id not in errors})
+    entities.update({e for e in create.entities if e.id not in failed_ids})
     return EntitiesSet(entities)
 
 
@@ -290,6 +297,8 @@ class Plan:
     not_to_modify: EntitiesSet = attrib(factory=EntitiesSet)
     modifications_diff: Dict[str, List[str]] = attrib(factory=dict)
     errors: Optional[Set[str]] = attrib(default=None)
+    # Ids of the entities that could not be applied
+    failed_ids: Set[str] = attrib(factory=set)
 
     @cached_property
     def expected_entities(self) -> EntitiesSet:
@@ -301,10 +310,13 @@ class Plan:
     @cached_property
     def entities(self) -> EntitiesSet:
         entities = merge_entities(
-            share=self.share, create=self.create, modify=self.modify, errors=self.errors
+            share=self.share,
+            create=self.create,
+            modify=self.modify,
+            failed_ids=self.failed_ids,
         )
         entities.entities.update(
-            {e for e in self.delete.entities if e.id in (self.errors or set())}
+            {e for e in self.delete.entities if e.id in self.failed_ids}
         )
         return entities
 
@@ -330,6 +342,99 @@ class Plan:
         )
 
 
+PlanOperation = Literal["create", "modify", "delete"]
+PLAN_OPERATION_SYMBOLS: Dict[PlanOperation, str] = {
+    "create": "+",
+    "modify": "*",
+    "delete": "-",
+}
+PLAN_OPERATION_VERBS: Dict[PlanOperation, str] = {
+    "create": "creating",
+    "modify": "modifying",
+    "delete": "deleting",
+}
+
+
+async def apply_entity(
+    op: PlanOperation,
+    e: EntityWrapper,
+    operator_name: str,
+    namespace: str,
+    entity_client: EntityClient | None,
+    k8s_configmap_client: K8SConfigMapClient | None,
+    diff: Optional[List[str]] = None,
+) -> Tuple[EntityClient | None, Optional[str]]:
+    """
+    Apply the operation op of a plan for the entity e.
+    Returns the entity client to use for the next operations and the error
+    message if it fails.
+    """
+    log.info(
+        "[%s/%s] %s %s: %s [%s]",
+        operator_name,
+        namespace,
+        PLAN_OPERATION_SYMBOLS[op],
+        e.value.__class__.__name__,
+        e.name,
+        e.id,
+    )
+    if op == "modify" and diff:
+        log.info("[%s/%s]    DIFF for %s:", operator_name, namespace, e.name)
+        for d in diff:
+            log.info("%s", d.rstrip())
+    if not entity_client:
+        return None, None
+    try:
+        name = (
+            "singleton" if e.value._entity_metadata.get("singleton", False) else e.name
+        )
+        key = entity_unique_id(e.value.__class__.__name__, name)
+        if op == "create":
+            entity_client = await entity_client.create(e.value)
+        elif op == "modify":
+            entity_client = await entity_client.modify(e.value)
+        else:
+            entity_client = await entity_client.delete(e.value)
+        if k8s_configmap_client and op == "delete":
+            await k8s_configmap_client.delete_entity_generation(key)
+        elif k8s_configmap_client:
+            await k8s_configmap_client.update_entity_generation(
+                key=key,
+                generation=e.value.appgate_metadata.current_generation,
+            )
+    except Exception as err:
+        log.exception("Error %s entity %s", PLAN_OPERATION_VERBS[op], e.name)
+        return entity_client, f"{e.name} [{e.id}]: {str(err)}"
+    return entity_client, None
+
+
+async def apply_concurrently(
+    entities: Iterable[EntityWrapper],
+    apply: Callable[
+        [EntityWrapper, EntityClient | None], Awaitable[EntityClient | None]
+    ],
+    entity_client: EntityClient | None = None,
+    concurrency: int = 1,
+    semaphore: asyncio.Semaphore | None = None,
+) -> EntityClient | None:
+    """
+    Run apply for all the entities with at most concurrency of them in flight.
+    Each entity is applied with the entity client returned by the last apply,
+    which is returned at the end.
+    semaphore limits the entities in flight when applying several plans at the same time.
+    """
+    pending = iter(entities)
+
+    async def worker() -> None:
+        nonlocal entity_client
+        for e in pending:
+            async with semaphore or contextlib.nullcontext():
+                entity_client = await apply(e, entity_client)
+
+    await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+    return entity_client
+
+
 # TODO: Save the kind info the wrapper
 async def plan_apply(
     plan: Plan,
@@ -337,35 +442,40 @@ async def plan_apply(
     operator_name: str,
     k8s_configmap_client: K8SConfigMapClient | None,
     entity_client: EntityClient | None = None,
+    concurrency: int = 1,
+    semaphore: asyncio.Semaphore | None = None,
+    init: bool = True,
 ) -> Tuple[Plan, EntityClient | None]:
     errors = set()
-    if entity_client:
+    failed_ids = set()
+    if entity_client and init:
         entity_client = await entity_client.init()
-    for e in plan.create.entities:
-        log.info(
-            "[%s/%s] + %s: %s [%s]",
-            operator_name,
-            namespace,
-            e.value.__class__.__qualname__,
-            e.name,
-            e.id,
-        )
-        if entity_client:
-            try:
-                entity_client = await entity_client.create(e.value)
-                name = (
-                    "singleton"
-                    if e.value._entity_metadata.get("singleton", False)
-                    else e.name
-                )
-                if k8s_configmap_client:
-                    await k8s_configmap_client.update_entity_generation(
-                        key=entity_unique_id(e.value.__class__.__name__, name),
-                        generation=e.value.appgate_metadata.current_generation,
-                    )
-            except Exception as err:
-                log.exception("Error creating entity %s", e.name)
-                errors.add(f"{e.name} [{e.id}]: {str(err)}")
+
+    def apply(
+        op: PlanOperation,
+    ) -> Callable[[EntityWrapper, EntityClient | None], Awaitable[EntityClient | None]]:
+        async def _apply(
+            e: EntityWrapper, client: EntityClient | None
+        ) -> EntityClient | None:
+            client, error = await apply_entity(
+                op,
+                e,
+                operator_name=operator_name,
+                namespace=namespace,
+                entity_client=client,
+                k8s_configmap_client=k8s_configmap_client,
+                diff=plan.modifications_diff.get(e.name),
+            )
+            if error:
+                errors.add(error)
+                failed_ids.add(e.id)
+            return client
+
+        return _apply
+
+    entity_client = await apply_concurrently(
+        plan.create.entities, apply("create"), entity_client, concurrency, semaphore
+    )
     if is_debug():
         for e in plan.not_to_create.entities:
             log.debug(
@@ -377,36 +487,9 @@ async def plan_apply(
                 e.id,
             )
 
-    for e in plan.modify.entities:
-        log.info(
-            "[%s/%s] * %s: %s [%s]",
-            operator_name,
-            namespace,
-            e.value.__class__.__name__,
-            e.name,
-            e.id,
-        )
-        diff = plan.modifications_diff.get(e.name)
-        if diff:
-            log.info("[%s/%s]    DIFF for %s:", operator_name, namespace, e.name)
-            for d in diff:
-                log.info("%s", d.rstrip())
-        if entity_client:
-            try:
-                entity_client = await entity_client.modify(e.value)
-                name = (
-                    "singleton"
-                    if e.value._entity_metadata.get("singleton", False)
-                    else e.name
-                )
-                if k8s_configmap_client:
-                    await k8s_configmap_client.update_entity_generation(
-                        key=entity_unique_id(e.value.__class__.__name__, name),
-                        generation=e.value.appgate_metadata.current_generation,
-                    )
-            except Exception as err:
-                log.exception("Error modifying entity %s", e.name)
-                errors.add(f"{e.name} [{e.id}]: {str(err)}")
+    entity_client = await apply_concurrently(
+        plan.modify.entities, apply("modify"), entity_client, concurrency, semaphore
+    )
     if is_debug():
         for e in plan.not_to_modify.entities:
             log.debug(
@@ -418,30 +501,9 @@ async def plan_apply(
                 e.id,
             )
 
-    for e in plan.delete.entities:
-        log.info(
-            "[%s/%s] - %s: %s [%s]",
-            operator_name,
-            namespace,
-            e.value.__class__.__name__,
-            e.name,
-            e.id,
-        )
-        if entity_client:
-            try:
-                entity_client = await entity_client.delete(e.value)
-                name = (
-                    "singleton"
-                    if e.value._entity_metadata.get("singleton", False)
-                    else e.name
-                )
-                if k8s_configmap_client:
-                    await k8s_configmap_client.delete_entity_generation(
-                        entity_unique_id(e.value.__class__.__name__, name)
-                    )
-            except Exception as err:
-                log.exception("Error deleting entity %s", e.name)
-                errors.add(f"{e.name} [{e.id}]: {str(err)}")
+    entity_client = await apply_concurrently(
+        plan.delete.entities, apply("delete"), entity_client, concurrency, semaphore
+    )
     if is_debug():
         for e in plan.not_to_delete.entities:
             log.debug(
@@ -475,6 +537,7 @@ async def plan_apply(
             not_to_modify=plan.not_to_modify,
             modifications_diff=plan.modifications_diff,
             errors=errors if has_errors else None,
+            failed_ids=failed_ids,
         ),
         entity_client,
     )
@@ -506,6 +569,14 @@ class AppgatePlan:
             ),
         )
 
+    def ordered_entities_levels(
+        self, api_spec: APISpec
+    ) -> Iterator[List[Tuple[str, Plan]]]:
+        for level in api_spec.entities_levels:
+            plans = [(k, v) for k in level if (v := self.entities_plan.get(k))]
+            if plans:
+                yield plans
+
     @cached_property
     def errors(self) -> List[str]:
         maybe_errors = filter(
@@ -524,23 +595,288 @@ async def appgate_plan_apply(
     api_spec: APISpec,
     entity_clients: Dict[str, EntityClient | None] | None = None,
     k8s_configmap_client: K8SConfigMapClient | None = None,
+    concurrency: int = 1,
+    mode: ApplyMode = "sequential",
+    max_in_flight: int = 0,
 ) -> Tuple[AppgatePlan, Dict[str, EntityClient | None]]:
     log.info("[%s/%s] AppgatePlan Summary:", operator_name, namespace)
-    entities_plan = {
-        k: await plan_apply(
-            v,
+    if mode == "entities":
+        entities_plan = await entities_plan_apply(
+            appgate_plan,
+            operator_name=operator_name,
             namespace=namespace,
+            api_spec=api_spec,
+            entity_clients=entity_clients or {},
+            k8s_configmap_client=k8s_configmap_client,
+            max_in_flight=max_in_flight,
+        )
+    elif mode == "levels":
+        entities_plan = await levels_plan_apply(
+            appgate_plan,
             operator_name=operator_name,
-            entity_client=(entity_clients or {}).get(k),
+            namespace=namespace,
+            api_spec=api_spec,
+            entity_clients=entity_clients or {},
             k8s_configmap_client=k8s_configmap_client,
+            concurrency=concurrency,
+            max_in_flight=max_in_flight,
         )
-        for k, v in appgate_plan.ordered_entities_plan(api_spec)
-    }
+    else:
+        entities_plan = {
+            k: await plan_apply(
+                v,
+                namespace=namespace,
+                operator_name=operator_name,
+                entity_client=(entity_clients or {}).get(k),
+                k8s_configmap_client=k8s_configmap_client,
+                concurrency=concurrency,
+            )
+            for k, v in appgate_plan.ordered_entities_plan(api_spec)
+        }
     return AppgatePlan(entities_plan={k: v[0] for k, v in entities_plan.items()}), {
         k: v[1] for k, v in entities_plan.items()
     }
 
 
+async def levels_plan_apply(
+    appgate_plan: AppgatePlan,
+    operator_name: str,
+    namespace: str,
+    api_spec: APISpec,
+    entity_clients: Dict[str, EntityClient | None],
+    k8s_configmap_client: K8SConfigMapClient | None,
+    concurrency: int,
+    max_in_flight: int,
+) -> Dict[str, Tuple[Plan, EntityClient | None]]:
+    """
+    Apply the plans of all the entity types in a topological level at the same time.
+    Creates and modifications are applied in level order and deletes in reverse
+    level order, so entities are deleted before the entities they reference.
+    """
+    semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight > 0 else None
+    levels = list(appgate_plan.ordered_entities_levels(api_spec))
+    applied: Dict[str, Tuple[Plan, EntityClient | None]] = {}
+    for level in levels:
+        results = await asyncio.gather(
+            *(
+                plan_apply(
+                    evolve(plan, delete=EntitiesSet(), not_to_delete=EntitiesSet()),
+                    namespace=namespace,
+                    operator_name=operator_name,
+                    entity_client=entity_clients.get(k),
+                    k8s_configmap_client=k8s_configmap_client,
+                    concurrency=concurrency,
+                    semaphore=semaphore,
+                )
+                for k, plan in level
+            )
+        )
+        applied.update({k: r for (k, _), r in zip(level, results)})
+    for level in reversed(levels):
+        results = await asyncio.gather(
+            *(
+                plan_apply(
+                    Plan(delete=plan.delete, not_to_delete=plan.not_to_delete),
+                    namespace=namespace,
+                    operator_name=operator_name,
+                    entity_client=applied[k][1],
+                    k8s_configmap_client=k8s_configmap_client,
+                    concurrency=concurrency,
+                    semaphore=semaphore,
+                    # Already initialized when applying creates and modifications
+                    init=False,
+                )
+                for k, plan in level
+            )
+        )
+        for (k, plan), (deleted, entity_client) in zip(level, results):
+            errors = (applied[k][0].errors or set()) | (deleted.errors or set())
+            applied[k] = (
+                evolve(
+                    plan,
+                    errors=errors or None,
+                    failed_ids=applied[k][0].failed_ids | deleted.failed_ids,
+                ),
+                entity_client,
+            )
+    return applied
+
+
+def field_values(value: Any, paths: List[str]) -> Iterator[str]:
+    """
+    Get all the values in the field with path paths, iterating over
+    collections found in the way.
+    """
+    if isinstance(value, (frozenset, set, list, tuple)):
+        for v in value:
+            yield from field_values(v, paths)
+    elif not paths:
+        if isinstance(value, str):
+            yield value
+    elif (field := getattr(value, paths[0], None)) is not None:
+        yield from field_values(field, paths[1:])
+
+
+def entity_node(kind: str, e: EntityWrapper) -> str:
+    return f"{kind}/{e.id}"
+
+
+def entities_graph(
+    entities: Dict[str, EntitiesSet], api_spec: APISpec
+) -> Dict[str, Set[str]]:
+    """
+    Graph with the entity nodes that each entity references
+    """
+    by_id: Dict[str, Dict[str, str]] = {}
+    by_name: Dict[str, Dict[str, str]] = {}
+    for kind, xs in entities.items():
+        by_id[kind] = {e.id: entity_node(kind, e) for e in xs.entities}
+        by_name[kind] = {e.name: entity_node(kind, e) for e in xs.entities}
+    graph: Dict[str, Set[str]] = {}
+    for kind, xs in entities.items():
+        field_dependencies = api_spec.entities[kind].dependencies
+        for e in xs.entities:
+            references = graph.setdefault(entity_node(kind, e), set())
+            for field_dependency in field_dependencies:
+                for value in field_values(
+                    e.value, field_dependency.field_path.split(".")
+                ):
+                    for dep_kind in field_dependency.dependencies:
+                        # References are ids unless we are running in reverse mode
+                        node = by_id.get(dep_kind, {}).get(value) or by_name.get(
+                            dep_kind, {}
+                        ).get(value)
+                        if node and node != entity_node(kind, e):
+                            references.add(node)
+    return graph
+
+
+def reverse_graph(graph: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    reversed_graph: Dict[str, Set[str]] = {n: set() for n in graph}
+    for n, deps in graph.items():
+        for d in deps:
+            reversed_graph[d].add(n)
+    return reversed_graph
+
+
+async def entities_plan_apply(
+    appgate_plan: AppgatePlan,
+    operator_name: str,
+    namespace: str,
+    api_spec: APISpec,
+    entity_clients: Dict[str, EntityClient | None],
+    k8s_configmap_client: K8SConfigMapClient | None,
+    max_in_flight: int,
+) -> Dict[str, Tuple[Plan, EntityClient | None]]:
+    """
+    Apply every entity as soon as the entities it references have been applied.
+    Creates and modifications are applied first, then deletes are applied once
+    no entity being deleted references them anymore.
+    """
+    plans = dict(appgate_plan.ordered_entities_plan(api_spec))
+    clients: Dict[str, EntityClient | None] = {}
+    for k in plans:
+        client = entity_clients.get(k)
+        clients[k] = await client.init() if client else None
+    errors: Dict[str, Set[str]] = {k: set() for k in plans}
+    failed_ids: Dict[str, Set[str]] = {k: set() for k in plans}
+
+    async def apply_entities(
+        op: Dict[str, PlanOperation],
+        entities: Dict[str, Dict[str, EntityWrapper]],
+        graph: Dict[str, Set[str]],
+    ) -> None:
+        kinds = {n: k for k, xs in entities.items() for n in xs}
+
+        async def run(node: str) -> Optional[str]:
+            kind = kinds[node]
+            e = entities[kind][node]
+            clients[kind], error = await apply_entity(
+                op[node],
+                e,
+                operator_name=operator_name,
+                namespace=namespace,
+                entity_client=clients[kind],
+                k8s_configmap_client=k8s_configmap_client,
+                diff=plans[kind].modifications_diff.get(e.name),
+            )
+            return error
+
+        def skipped(node: str, failed: str) -> str:
+            e = entities[kinds[node]][node]
+            dep = entities[kinds[failed]][failed]
+            log.error(
+                "[%s/%s] Not applying %s %s [%s], it depends on %s [%s] that failed",
+                operator_name,
+                namespace,
+                kinds[node],
+                e.name,
+                e.id,
+                dep.name,
+                dep.id,
+            )
+            return f"{e.name} [{e.id}]: Dependency {dep.name} [{dep.id}] failed"
+
+        stats = await run_graph(graph, run, skipped, max_in_flight)
+        for node, error in stats.errors.items():
+            errors[kinds[node]].add(error)
+            failed_ids[kinds[node]].add(entities[kinds[node]][node].id)
+        for node, node_stats in stats.nodes.items():
+            summary("appgate_plan_entity_wait_seconds", op=op[node]).observe(
+                node_stats.wait_time
+            )
+        gauge("appgate_plan_critical_path_entities").set(len(stats.critical_path))
+        gauge("appgate_plan_critical_path_seconds").set(stats.critical_path_duration)
+        if stats.nodes:
+            log.info(
+                "[%s/%s] Applied %s entities, critical path: %s entities (%.2fs)",
+                operator_name,
+                namespace,
+                len(stats.nodes),
+                len(stats.critical_path),
+                stats.critical_path_duration,
+            )
+
+    upserts: Dict[str, Dict[str, EntityWrapper]] = {}
+    upsert_ops: Dict[str, PlanOperation] = {}
+    for k, plan in plans.items():
+        upserts[k] = {}
+        to_upsert: List[Tuple[PlanOperation, EntitiesSet]] = [
+            ("create", plan.create),
+            ("modify", plan.modify),
+        ]
+        for upsert_op, xs in to_upsert:
+            for e in xs.entities:
+                upserts[k][entity_node(k, e)] = e
+                upsert_ops[entity_node(k, e)] = upsert_op
+    await apply_entities(
+        upsert_ops,
+        upserts,
+        entities_graph(
+            {k: EntitiesSet(set(xs.values())) for k, xs in upserts.items()}, api_spec
+        ),
+    )
+
+    deletes = {
+        k: {entity_node(k, e): e for e in plan.delete.entities}
+        for k, plan in plans.items()
+    }
+    await apply_entities(
+        {n: "delete" for xs in deletes.values() for n in xs},
+        deletes,
+        reverse_graph(
+            entities_graph({k: plan.delete for k, plan in plans.items()}, api_spec)
+        ),
+    )
+    return {
+        k: (
+            evolve(plan, errors=errors[k] or None, failed_ids=failed_ids[k]),
+            clients[k],
+        )
+        for k, plan in plans.items()
+    }
+
+
 def entities_conflict_summary(
     conflicts: Dict[str, List[MissingFieldDependencies]], namespace: str
 ) -> None:
@@ -578,8 +914,8 @@ def compute_diff(e1: EntityWrapper, e2: EntityWrapper) -> List[str]:
             e2_dump["updated"] = dump_datetime(e2.value.appgate_metadata.modified)
     diff = list(
         difflib.unified_diff(
-            json.dumps(e1_dump, indent=4).splitlines(keepends=True),
-            json.dumps(e2_dump, indent=4).splitlines(keepends=True),
+            codec.dumps(e1_dump, indent=4).splitlines(keepends=True),
+            codec.dumps(e2_dump, indent=4).splitlines(keepends=True),
             n=1,
         )
     )
@@ -64,8 +64,27 @@ __all__ = [
     "APPGATE_EXCLUDE_TAGS_ENV",
     "APPGATE_TARGET_TAGS_ENV",
     "APPGATE_BUILTIN_TAGS_ENV",
+    "FETCH_CONCURRENCY_ENV",
+    "PAGE_SIZE_ENV",
+    "MAX_RETRIES_ENV",
+    "READ_RATE_LIMIT_ENV",
+    "WRITE_RATE_LIMIT_ENV",
+    "APPLY_CONCURRENCY_ENV",
+    "APPLY_MODE_ENV",
+    "APPLY_MAX_IN_FLIGHT_ENV",
+    "FULL_REFRESH_INTERVAL_ENV",
+    "CONNECTION_POOL_SIZE_ENV",
+    "CONNECTIONS_PER_HOST_ENV",
+    "KEEPALIVE_TIMEOUT_ENV",
+    "DNS_CACHE_TTL_ENV",
+    "COMPRESSION_ENV",
+    "RECORD_FILE_ENV",
+    "HEDGE_PERCENTILE_ENV",
+    "HEDGE_BUDGET_ENV",
+    "CIRCUIT_RESET_TIMEOUT_ENV",
     "get_tags",
     "get_dry_run",
+    "get_apply_mode",
     "ensure_env",
     "GIT_REPOSITORY_ENV",
     "GIT_VENDOR_ENV",
@@ -106,6 +125,24 @@ APPGATE_TARGET_TAGS_ENV = "APPGATE_OPERATOR_TARGET_TAGS"
 APPGATE_BUILTIN_TAGS_ENV = "APPGATE_OPERATOR_BUILTIN_TAGS"
 APPGATE_EXCLUDE_ENTITIES_ENV = "APPGATE_OPERATOR_EXCLUDE_ENTITIES"
 APPGATE_INCLUDE_ENTITIES_ENV = "APPGATE_OPERATOR_INCLUDE_ENTITIES"
+FETCH_CONCURRENCY_ENV = "APPGATE_OPERATOR_FETCH_CONCURRENCY"
+PAGE_SIZE_ENV = "APPGATE_OPERATOR_PAGE_SIZE"
+MAX_RETRIES_ENV = "APPGATE_OPERATOR_MAX_RETRIES"
+READ_RATE_LIMIT_ENV = "APPGATE_OPERATOR_READ_RATE_LIMIT"
+WRITE_RATE_LIMIT_ENV = "APPGATE_OPERATOR_WRITE_RATE_LIMIT"
+APPLY_CONCURRENCY_ENV = "APPGATE_OPERATOR_APPLY_CONCURRENCY"
+APPLY_MODE_ENV = "APPGATE_OPERATOR_APPLY_MODE"
+APPLY_MAX_IN_FLIGHT_ENV = "APPGATE_OPERATOR_APPLY_MAX_IN_FLIGHT"
+FULL_REFRESH_INTERVAL_ENV = "APPGATE_OPERATOR_FULL_REFRESH_INTERVAL"
+CONNECTION_POOL_SIZE_ENV = "APPGATE_OPERATOR_CONNECTION_POOL_SIZE"
+CONNECTIONS_PER_HOST_ENV = "APPGATE_OPERATOR_CONNECTIONS_PER_HOST"
+KEEPALIVE_TIMEOUT_ENV = "APPGATE_OPERATOR_KEEPALIVE_TIMEOUT"
+DNS_CACHE_TTL_ENV = "APPGATE_OPERATOR_DNS_CACHE_TTL"
+COMPRESSION_ENV = "APPGATE_OPERATOR_COMPRESSION"
+RECORD_FILE_ENV = "APPGATE_OPERATOR_RECORD_FILE"
+HEDGE_PERCENTILE_ENV = "APPGATE_OPERATOR_HEDGE_PERCENTILE"
+HEDGE_BUDGET_ENV = "APPGATE_OPERATOR_HEDGE_BUDGET"
+CIRCUIT_RESET_TIMEOUT_ENV = "APPGATE_OPERATOR_CIRCUIT_RESET_TIMEOUT"
 
 
 GIT_REPOSITORY_MAIN_BRANCH_ENV = "GIT_MAIN_BRANCH"
@@ -163,6 +200,11 @@ class GitCommitState:
 
 GitVendor: TypeAlias = Literal["gitlab", "github"]
 SUPPORTED_GIT_VENDORS: List[GitVendor] = ["gitlab", "github"]
+# sequential: apply entity types one by one in topological order
+# levels: apply entity types in the same topological level concurrently
+# entities: apply each entity as soon as the entities it references are applied
+ApplyMode: TypeAlias = Literal["sequential", "levels", "entities"]
+SUPPORTED_APPLY_MODES: List[ApplyMode] = ["sequential", "levels", "entities"]
 
 
 class EntityClient:
@@ -204,6 +246,24 @@ class AppgateOperatorArguments:
     reverse_mode: bool = attrib(default=False)
     entities_to_include: frozenset[str] | None = attrib(default=None)
     entities_to_exclude: frozenset[str] | None = attrib(default=None)
+    fetch_concurrency: int = attrib(default=1)
+    page_size: int = attrib(default=0)
+    max_retries: int = attrib(default=3)
+    read_rate_limit: float = attrib(default=0)
+    write_rate_limit: float = attrib(default=0)
+    apply_concurrency: int = attrib(default=1)
+    apply_mode: ApplyMode = attrib(default="sequential")
+    apply_max_in_flight: int = attrib(default=10)
+    full_refresh_interval: int = attrib(default=0)
+    connection_pool_size: int = attrib(default=100)
+    connections_per_host: int = attrib(default=0)
+    keepalive_timeout: float = attrib(default=15.0)
+    dns_cache_ttl: int = attrib(default=10)
+    compression: bool = attrib(default=True)
+    record_file: Optional[Path] = attrib(default=None)
+    hedge_percentile: float = attrib(default=0.0)
+    hedge_budget: float = attrib(default=0.1)
+    circuit_reset_timeout: float = attrib(default=30.0)
 
 
 @attrs(slots=True, frozen=True)
@@ -444,6 +504,43 @@ class AppgateOperatorContext:
     no_verify: bool = attrib(default=True)
     cafile: Optional[Path] = attrib(default=None)
     device_id: Optional[str] = attrib(default=None)
+    # maximum number of entity types fetched at the same time from the controller
+    fetch_concurrency: int = attrib(default=1)
+    # number of entities requested per page when reading from the controller, 0 disables paging
+    page_size: int = attrib(default=0)
+    # number of times a failed request to the controller is retried
+    max_retries: int = attrib(default=3)
+    # maximum number of read requests per second sent to the controller, 0 means unlimited
+    read_rate_limit: float = attrib(default=0)
+    # maximum number of write requests per second sent to the controller, 0 means unlimited
+    write_rate_limit: float = attrib(default=0)
+    # maximum number of entities of the same type applied at the same time
+    apply_concurrency: int = attrib(default=1)
+    # how entities are applied: sequential, levels or entities
+    apply_mode: ApplyMode = attrib(default="sequential")
+    # maximum number of entities applied at the same time across entity types
+    apply_max_in_flight: int = attrib(default=10)
+    # Seconds between full refreshes of the controller state in two-way-sync and
+    # reverse mode, 0 means always
+    full_refresh_interval: int = attrib(default=0)
+    # maximum number of connections open with the controller, 0 means no limit
+    connection_pool_size: int = attrib(default=100)
+    # maximum number of connections open with each controller host, 0 means no limit
+    connections_per_host: int = attrib(default=0)
+    # seconds an idle connection with the controller is kept open to be reused
+    keepalive_timeout: float = attrib(default=15.0)
+    # seconds the controller DNS resolution is cached
+    dns_cache_ttl: int = attrib(default=10)
+    # ask the controller for compressed (gzip/deflate) responses
+    compression: bool = attrib(default=True)
+    # Record the requests sent to the controller and their responses in this file
+    record_file: Optional[Path] = attrib(default=None)
+    # Percentile of the latency of a path after which a GET request is hedged
+    hedge_percentile: float = attrib(default=0.0)
+    # Maximum fraction of extra GET requests sent as hedges
+    hedge_budget: float = attrib(default=0.1)
+    # Seconds the circuit breaker stays open before trying the controller again
+    circuit_reset_timeout: float = attrib(default=30.0)
 
 
 @attrs()
@@ -505,6 +602,14 @@ def get_git_vendor(vendor: str) -> GitVendor:
     return cast(GitVendor, vendor)
 
 
+def get_apply_mode(mode: str) -> ApplyMode:
+    if mode not in SUPPORTED_APPLY_MODES:
+        raise AppgateException(
+            f"Environment variable {APPLY_MODE_ENV}={mode} must be one of {', '.join(SUPPORTED_APPLY_MODES)}"
+        )
+    return cast(ApplyMode, mode)
+
+
 def to_bool(value: Optional[str]) -> bool:
     if value:
         # Helm JSON schema validation ensures that the input is true/false string
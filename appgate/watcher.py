@@ -0,0 +1,394 @@
+import asyncio
+import random
+import ssl
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+)
+
+import aiohttp
+from kubernetes.client import Configuration
+
+from appgate import codec
+from appgate.logger import log
+from appgate.metrics import counter, gauge
+
+
+__all__ = [
+    "Informer",
+    "K8sApi",
+    "K8sWatchException",
+    "Watch",
+    "WatchMultiplexer",
+]
+
+
+# Seconds the API server keeps a watch open before closing it
+WATCH_TIMEOUT = 300
+# Backoff between reconnections of a watch that failed
+WATCH_BACKOFF_BASE = 0.5
+WATCH_BACKOFF_MAX = 30.0
+# Status of a watch that can not be resumed from the version requested
+GONE = 410
+
+WatchHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class K8sWatchException(Exception):
+    def __init__(self, message: str, status: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class K8sApi:
+    """
+    Minimal asyncio client for the kubernetes API using the configuration loaded
+    by the kubernetes package (in cluster or from the kube config). All the
+    requests share the same connection pool.
+    """
+
+    def __init__(self, configuration: Optional[Configuration] = None) -> None:
+        self.configuration = configuration or Configuration.get_default_copy()
+        # Watches hold their connection while they are open, don't limit them
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, ssl=self._ssl_context()),
+        )
+
+    def _ssl_context(self) -> ssl.SSLContext | bool:
+        c = self.configuration
+        if not c.host.startswith("https"):
+            return False
+        context = ssl.create_default_context(cafile=c.ssl_ca_cert)
+        if c.cert_file:
+            context.load_cert_chain(c.cert_file, c.key_file)
+        if not c.verify_ssl:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Accept": "application/json"}
+        # Tokens can be rotated, the configuration refreshes them when needed
+        authorization = self.configuration.get_api_key_with_prefix("authorization")
+        if authorization:
+            headers["Authorization"] = authorization
+        return headers
+
+    async def get(self, path: str) -> Dict[str, Any]:
+        url = self.configuration.host.rstrip("/") + path
+        try:
+            async with self._session.get(url, headers=self._headers()) as resp:
+                if resp.status != 200:
+                    raise K8sWatchException(
+                        f"[GET {path} {resp.status}] {await resp.text()}",
+                        status=resp.status,
+                    )
+                return codec.loads(await resp.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise K8sWatchException(f"[GET {path}] {e!r}")
+
+    async def stream(
+        self, path: str, params: Dict[str, str], timeout: float
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Objects in the JSON lines response of a streaming GET (like a watch).
+        """
+        url = self.configuration.host.rstrip("/") + path
+        try:
+            async with self._session.get(
+                url,
+                params=params,
+                headers=self._headers(),
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=timeout),
+            ) as resp:
+                if resp.status != 200:
+                    raise K8sWatchException(
+                        f"[GET {path} {resp.status}] {await resp.text()}",
+                        status=resp.status,
+                    )
+                buffer = b""
+                async for chunk in resp.content.iter_any():
+                    buffer += chunk
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        if line.strip():
+                            yield codec.loads(line)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise K8sWatchException(f"[GET {path}] {e!r}")
+
+    async def close(self) -> None:
+        await self._session.close()
+
+
+class Watch:
+    """
+    A watch on the objects in a path of the kubernetes API, each event is passed
+    to the handler.
+
+    The objects are listed first and then watched from the resourceVersion of the
+    list. The watch is resumed from the last resourceVersion seen (bookmarks keep
+    it up to date when there are no changes), so reconnecting does not list the
+    objects again unless the API server does not have that version anymore.
+    When listing again the handler gets the changes since the last event seen,
+    including the objects deleted meanwhile.
+    """
+
+    def __init__(self, name: str, path: str, handler: WatchHandler) -> None:
+        self.name = name
+        self.path = path
+        self.handler = handler
+        self.failures = 0
+        self.connected = False
+        self.resource_version: Optional[str] = None
+        # Last version of the objects seen, by name
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        # The objects have been listed at least once
+        self.listed = False
+        # Set once the events of the first list have been handled
+        self.synced = asyncio.Event()
+
+    def params(self) -> Dict[str, str]:
+        params = {
+            "watch": "true",
+            "timeoutSeconds": str(WATCH_TIMEOUT),
+            "allowWatchBookmarks": "true",
+        }
+        if self.resource_version:
+            params["resourceVersion"] = self.resource_version
+        return params
+
+    def update(self, event: Dict[str, Any]) -> bool:
+        """
+        Update the objects and the resourceVersion of the watch with event, True
+        if the handler needs to get it.
+        """
+        obj = event.get("object", {})
+        metadata = obj.get("metadata", {})
+        resource_version = metadata.get("resourceVersion")
+        if resource_version:
+            self.resource_version = resource_version
+        if event["type"] == "BOOKMARK":
+            return False
+        name = metadata.get("name", "")
+        if event["type"] == "DELETED":
+            self.objects.pop(name, None)
+            self._report()
+            return True
+        previous = self.objects.get(name)
+        self.objects[name] = obj
+        self._report()
+        if (
+            event["type"] == "ADDED"
+            and resource_version
+            and previous is not None
+            and previous.get("metadata", {}).get("resourceVersion") == resource_version
+        ):
+            counter("appgate_k8s_watch_duplicates_skipped", watch=self.name).inc()
+            return False
+        return True
+
+    def relist(self, objects: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Replace the objects with the ones in a list response, returning the
+        events for the changes.
+        """
+        kind = objects.get("kind", "").removesuffix("List")
+        listed = {}
+        for obj in objects.get("items") or []:
+            obj.setdefault("kind", kind)
+            listed[obj["metadata"]["name"]] = obj
+        events = []
+        for name, obj in listed.items():
+            previous = self.objects.get(name)
+            if previous is None:
+                events.append({"type": "ADDED", "object": obj})
+            elif previous["metadata"].get("resourceVersion") != obj["metadata"].get(
+                "resourceVersion"
+            ):
+                events.append({"type": "MODIFIED", "object": obj})
+        for name, obj in self.objects.items():
+            if name not in listed:
+                events.append({"type": "DELETED", "object": obj})
+        self.objects = listed
+        self.resource_version = (objects.get("metadata") or {}).get("resourceVersion")
+        self.listed = True
+        self._report()
+        return events
+
+    def _report(self) -> None:
+        gauge("appgate_k8s_watch_objects", watch=self.name).set(len(self.objects))
+
+    def backoff(self) -> float:
+        if not self.failures:
+            return 0.0
+        delay = min(WATCH_BACKOFF_BASE * 2 ** (self.failures - 1), WATCH_BACKOFF_MAX)
+        return delay * random.uniform(0.5, 1.0)
+
+
+class Informer:
+    """
+    Custom resources known by the watches, by kind and name. The watches keep
+    them up to date so reading them does not need any request to the API server.
+    The objects returned are the ones stored, they must not be modified.
+    """
+
+    def __init__(self) -> None:
+        self.watches: Dict[str, Watch] = {}
+
+    def add(self, kind: str, watch: Watch) -> None:
+        self.watches[kind] = watch
+
+    def synced(self, kind: str) -> bool:
+        """
+        The objects of kind have been listed, so an object that is not in the
+        informer does not exist (or it was deleted very recently).
+        """
+        watch = self.watches.get(kind)
+        return watch is not None and watch.listed
+
+    def pending(self) -> List[str]:
+        """
+        Kinds whose initial list has not been handled yet.
+        """
+        return [k for k, w in self.watches.items() if not w.synced.is_set()]
+
+    async def wait_synced(self) -> None:
+        """
+        Wait until the events of the initial list of all the kinds are handled.
+        """
+        await asyncio.gather(*(w.synced.wait() for w in self.watches.values()))
+
+    def get(self, kind: str, name: str) -> Optional[Dict[str, Any]]:
+        watch = self.watches.get(kind)
+        return watch.objects.get(name) if watch else None
+
+    def list(self, kind: str) -> List[Dict[str, Any]]:
+        watch = self.watches.get(kind)
+        return list(watch.objects.values()) if watch else []
+
+    def __len__(self) -> int:
+        return sum(len(w.objects) for w in self.watches.values())
+
+
+class WatchMultiplexer:
+    """
+    Runs all the watches in the event loop, sharing the connection pool of api.
+
+    Each watch is reconnected when the API server closes it and, with a backoff,
+    when it fails. Closing the multiplexer stops the watches and closes the
+    connections.
+    """
+
+    def __init__(self, api: K8sApi, watches: Iterable[Watch] = ()) -> None:
+        self.api = api
+        self.watches: List[Watch] = list(watches)
+        self._tasks: List[asyncio.Task] = []
+
+    def add(self, name: str, path: str, handler: WatchHandler) -> Watch:
+        watch = Watch(name, path, handler)
+        self.watches.append(watch)
+        return watch
+
+    async def run(self) -> None:
+        """
+        Run the watches until they are cancelled.
+        """
+        self._tasks = [
+            asyncio.create_task(self._run_watch(w), name=f"watch-{w.name}")
+            for w in self.watches
+        ]
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run_watch(self, watch: Watch) -> None:
+        log.info("[watcher/%s] Watching %s", watch.name, watch.path)
+        while True:
+            await asyncio.sleep(watch.backoff())
+            try:
+                if watch.resource_version is None:
+                    await self._list(watch)
+                async for event in self.api.stream(
+                    watch.path, watch.params(), timeout=WATCH_TIMEOUT + 30
+                ):
+                    self._connected(watch, True)
+                    watch.failures = 0
+                    if event.get("type") == "ERROR":
+                        raise K8sWatchException(
+                            f"[{watch.path}] {event.get('object')}",
+                            status=(event.get("object") or {}).get("code"),
+                        )
+                    if watch.update(event):
+                        await watch.handler(event)
+                log.debug(
+                    "[watcher/%s] Watch closed, resuming from %s",
+                    watch.name,
+                    watch.resource_version,
+                )
+            except K8sWatchException as e:
+                if e.status == GONE:
+                    # The version is too old to resume from it, list the objects
+                    log.info(
+                        "[watcher/%s] Version %s is gone, listing the objects again",
+                        watch.name,
+                        watch.resource_version,
+                    )
+                    watch.resource_version = None
+                    counter("appgate_k8s_watch_relists", watch=watch.name).inc()
+                    continue
+                watch.failures += 1
+                log.error(
+                    "[watcher/%s] Watch failed (%s consecutive failures): %s",
+                    watch.name,
+                    watch.failures,
+                    e.message,
+                )
+            finally:
+                self._connected(watch, False)
+            counter("appgate_k8s_watch_reconnections", watch=watch.name).inc()
+
+    async def _list(self, watch: Watch) -> None:
+        objects = await self.api.get(watch.path)
+        events = watch.relist(objects)
+        log.debug(
+            "[watcher/%s] Listed %s objects (%s changes) at version %s",
+            watch.name,
+            len(watch.objects),
+            len(events),
+            watch.resource_version,
+        )
+        for event in events:
+            await watch.handler(event)
+        if not watch.synced.is_set():
+            log.info("[watcher/%s] Synced %s objects", watch.name, len(watch.objects))
+            watch.synced.set()
+
+    def _connected(self, watch: Watch, connected: bool) -> None:
+        if watch.connected == connected:
+            return
+        watch.connected = connected
+        gauge("appgate_k8s_watches_connected").set(
+            sum(1 for w in self.watches if w.connected)
+        )
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.api.close()
+
+    async def __aenter__(self) -> "WatchMultiplexer":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
@@ -0,0 +1,166 @@
+"""
+Share of JSON encoding/decoding in an operator cycle, with the stdlib json
+module and with orjson (when installed).
+
+A cycle over a collection of synthetic entities:
+  - decode the controller response
+  - load the entities
+  - dump them to k8s (cattrs unstructure, sets are sorted using their JSON)
+  - render the diff of the modified entities
+  - encode the request bodies of the modified entities
+
+Usage:
+    PYTHONPATH=. python benchmarks/codec.py [--entities 5000] [--rounds 5]
+"""
+
+import argparse
+import difflib
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+import attr
+
+from appgate import codec
+from appgate.attrs import _new_converter
+
+
+@attr.attrs(frozen=True, slots=True)
+class Action:
+    subtype: str = attr.attrib()
+    action: str = attr.attrib()
+    hosts: frozenset = attr.attrib(factory=frozenset)
+    ports: frozenset = attr.attrib(factory=frozenset)
+
+
+@attr.attrs(frozen=True, slots=True)
+class Entitlement:
+    id: str = attr.attrib()
+    name: str = attr.attrib()
+    notes: str = attr.attrib()
+    tags: frozenset = attr.attrib(factory=frozenset)
+    conditions: frozenset = attr.attrib(factory=frozenset)
+    actions: frozenset = attr.attrib(factory=frozenset)
+
+
+def load(e: Dict[str, Any]) -> Entitlement:
+    return Entitlement(
+        id=e["id"],
+        name=e["name"],
+        notes=e["notes"],
+        tags=frozenset(e["tags"]),
+        conditions=frozenset(e["conditions"]),
+        actions=frozenset(
+            Action(
+                subtype=a["subtype"],
+                action=a["action"],
+                hosts=frozenset(a["hosts"]),
+                ports=frozenset(a["ports"]),
+            )
+            for a in e["actions"]
+        ),
+    )
+
+
+def raw_entity(i: int) -> Dict[str, Any]:
+    return {
+        "id": str(uuid.UUID(int=i)),
+        "name": f"entitlement-{i}",
+        "notes": "Access to the internal services of the team " * 3,
+        "tags": ["api-created", f"team-{i % 20}", "sdp-operator"],
+        "conditions": [str(uuid.UUID(int=i * 1000 + c)) for c in range(3)],
+        "actions": [
+            {
+                "subtype": "tcp_up",
+                "action": "allow",
+                "hosts": [f"10.{i % 250}.{a}.{h}" for h in range(8)],
+                "ports": ["443", "8443", f"{9000 + a}"],
+            }
+            for a in range(4)
+        ],
+    }
+
+
+class Timer:
+    """
+    Wraps the codec functions to account the time spent in them.
+    """
+
+    def __init__(self) -> None:
+        self.elapsed = 0.0
+
+    def wrap(self, f: Callable[..., Any]) -> Callable[..., Any]:
+        def wrapped(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                self.elapsed += time.perf_counter() - start
+
+        return wrapped
+
+
+def cycle(body: bytes, modified: int) -> None:
+    converter = _new_converter()
+    data = codec.loads(body)
+    entities = [load(e) for e in data["data"]]
+    dumps = [converter.unstructure(e) for e in entities]
+    for before in dumps[:modified]:
+        after = {**before, "notes": "changed"}
+        list(
+            difflib.unified_diff(
+                codec.dumps(before, indent=4).splitlines(keepends=True),
+                codec.dumps(after, indent=4).splitlines(keepends=True),
+                n=1,
+            )
+        )
+        codec.dumps(after)
+
+
+def run(backend: str, body: bytes, modified: int, rounds: int) -> List[float]:
+    orjson = codec.orjson
+    dumps, loads = codec.dumps, codec.loads
+    if backend == "json":
+        codec.orjson = None  # type: ignore
+    timer = Timer()
+    codec.dumps, codec.loads = timer.wrap(dumps), timer.wrap(loads)
+    try:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            cycle(body, modified)
+        total = time.perf_counter() - start
+    finally:
+        codec.orjson = orjson
+        codec.dumps, codec.loads = dumps, loads
+    return [total / rounds, timer.elapsed / rounds]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entities", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument(
+        "--modified",
+        type=float,
+        default=0.1,
+        help="Fraction of entities modified in each cycle",
+    )
+    args = parser.parse_args()
+    body = codec.dumps({"data": [raw_entity(i) for i in range(args.entities)]}).encode()
+    modified = int(args.entities * args.modified)
+    print(
+        f"{args.entities} entities ({len(body) / 1024 / 1024:.1f} MiB),"
+        f" {modified} modified, {args.rounds} rounds"
+    )
+    print(f"{'backend':<8} {'cycle (s)':>10} {'json (s)':>10} {'json share':>11}")
+    backends = ["json"] + (["orjson"] if codec.orjson is not None else [])
+    for backend in backends:
+        total, json_time = run(backend, body, modified, args.rounds)
+        print(
+            f"{backend:<8} {total:>10.3f} {json_time:>10.3f}"
+            f" {json_time / total:>10.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Convergence time and requests sent to a controller, using a local fake controller
+seeded with synthetic entities.
+
+Each round:
+  - fetch the current state from the controller
+  - apply a plan deleting, modifying (tagging) and creating a fraction of the
+    entities of each type
+  - fetch the state again and check that there is nothing left to apply
+
+Usage:
+    PYTHONPATH=. python benchmarks/convergence.py [--entities 1000] [--latency 0.01]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import attr
+
+from appgate.appgate import get_current_appgate_state
+from appgate.client import AppgateClient
+from appgate.fakecontroller import FakeController, synthetic_entity
+from appgate.logger import set_level
+from appgate.openapi.openapi import generate_api_spec, generate_api_spec_clients
+from appgate.openapi.types import APISpec
+from appgate.state import AppgateState, appgate_plan_apply, create_appgate_plan
+from appgate.types import AppgateOperatorContext, EntitiesSet, EntityWrapper
+
+
+BUILTIN_TAGS = frozenset({"builtin"})
+
+
+def expected_state(
+    api_spec: APISpec,
+    current: AppgateState,
+    changes: float,
+    offset: int,
+    rng: random.Random,
+) -> AppgateState:
+    entities_set = {}
+    for kind, entities in current.entities_set.items():
+        api_entity = api_spec.entities[kind]
+        expected = set()
+        for e in entities.entities:
+            r = rng.random()
+            if r < changes / 3 and not api_entity.singleton:
+                continue
+            if r < changes * 2 / 3 and hasattr(e.value, "tags"):
+                e = EntityWrapper(
+                    attr.evolve(e.value, tags=e.value.tags | {"benchmark"})
+                )
+            expected.add(e)
+        if not api_entity.singleton:
+            new = int(len(entities.entities) * changes / 3)
+            expected |= {
+                EntityWrapper(synthetic_entity(kind, api_entity, offset + i))
+                for i in range(new)
+            }
+        entities_set[kind] = EntitiesSet(expected)
+    return AppgateState(entities_set=entities_set)
+
+
+def plan_size(current: AppgateState, expected: AppgateState) -> int:
+    plan = create_appgate_plan(current, expected, BUILTIN_TAGS, None, None)
+    return sum(
+        len(p.create.entities) + len(p.modify.entities) + len(p.delete.entities)
+        for p in plan.entities_plan.values()
+    )
+
+
+async def run(
+    api_spec: APISpec, args: argparse.Namespace
+) -> List[Tuple[str, float, Dict[str, int]]]:
+    rng = random.Random(args.seed)
+    controller = FakeController(
+        api_spec,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        rng=rng,
+    )
+    seeded = controller.seed(args.entities, entity_types=args.entity_types)
+    print(f"{seeded} entities seeded in {len(controller.entities)} entity types")
+    results: List[Tuple[str, float, Dict[str, int]]] = []
+
+    async def step(name: str, coro):
+        requests = dict(controller.requests)
+        start = time.perf_counter()
+        value = await coro
+        elapsed = time.perf_counter() - start
+        results.append(
+            (
+                name,
+                elapsed,
+                {
+                    k: v - requests.get(k, 0)
+                    for k, v in controller.requests.items()
+                    if v - requests.get(k, 0)
+                },
+            )
+        )
+        return value
+
+    async with controller:
+        ctx = AppgateOperatorContext(
+            namespace="benchmark",
+            user="admin",
+            password="admin",
+            provider="local",
+            controller=controller.url,
+            two_way_sync=True,
+            timeout=30,
+            dry_run_mode=False,
+            cleanup_mode=False,
+            api_spec=api_spec,
+            reverse_mode=False,
+            device_id="benchmark",
+            fetch_concurrency=args.fetch_concurrency,
+            page_size=args.page_size,
+        )
+        async with AppgateClient(
+            controller=ctx.controller,
+            user=ctx.user,
+            password=ctx.password,
+            provider=ctx.provider,
+            version=api_spec.api_version,
+            device_id=ctx.device_id,
+            dry_run=False,
+            expiration_time_delta=60,
+            page_size=args.page_size,
+            max_retries=args.max_retries,
+        ) as client:
+            for r in range(args.rounds):
+                current = await step(
+                    f"fetch {r}", get_current_appgate_state(ctx, client)
+                )
+                # New entities get numbers not used by the seeded or created ones
+                offset = args.entities * (r + 1)
+                expected = expected_state(api_spec, current, args.changes, offset, rng)
+                plan = create_appgate_plan(current, expected, BUILTIN_TAGS, None, None)
+                new_plan, _ = await step(
+                    f"apply {r}",
+                    appgate_plan_apply(
+                        plan,
+                        operator_name="benchmark",
+                        namespace="benchmark",
+                        api_spec=api_spec,
+                        entity_clients=generate_api_spec_clients(api_spec, client),
+                        concurrency=args.apply_concurrency,
+                    ),
+                )
+                if new_plan.errors:
+                    print(f"Round {r}: {len(new_plan.errors)} errors when applying")
+                current = await step(
+                    f"refetch {r}", get_current_appgate_state(ctx, client)
+                )
+                print(
+                    f"Round {r}: {plan_size(current, expected)} operations"
+                    " left after applying"
+                )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--spec-directory", type=Path, default=None)
+    parser.add_argument(
+        "--entity-types",
+        nargs="*",
+        default=None,
+        help="Entity types to seed, all of them by default",
+    )
+    parser.add_argument("--entities", type=int, default=1000, help="Per entity type")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument(
+        "--changes",
+        type=float,
+        default=0.1,
+        help="Fraction of entities deleted, modified or created in each round",
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--page-size", type=int, default=0)
+    parser.add_argument("--fetch-concurrency", type=int, default=1)
+    parser.add_argument("--apply-concurrency", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    set_level(log_level="error")
+    api_spec = generate_api_spec(spec_directory=args.spec_directory)
+    results = asyncio.run(run(api_spec, args))
+    print(f"{'step':<10} {'time (s)':>9} requests")
+    for name, elapsed, requests in results:
+        requests_str = " ".join(f"{k}={v}" for k, v in sorted(requests.items()))
+        print(f"{name:<10} {elapsed:>9.3f} {requests_str}")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,3 +26,17 @@ class CoreV1Api:
     def read_namespaced_secret(self, name: str, namespace: str) -> V1Secret: ...
     def read_namespaced_config_map(self, name: str, namespace: str) -> V1ConfigMap: ...
     def patch_namespaced_config_map(self, name: str, namespace: str, body: V1ConfigMap) -> V1ConfigMap: ...
+
+
+class Configuration:
+    host: str
+    ssl_ca_cert: Optional[str]
+    cert_file: Optional[str]
+    key_file: Optional[str]
+    verify_ssl: bool
+    api_key: Dict[str, str]
+    api_key_prefix: Dict[str, str]
+    def __init__(self, host: Optional[str] = None) -> None: ...
+    @classmethod
+    def get_default_copy(cls) -> "Configuration": ...
+    def get_api_key_with_prefix(self, identifier: str) -> Optional[str]: ...
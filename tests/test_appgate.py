@@ -0,0 +1,215 @@
+import asyncio
+from typing import Dict, Any, Optional, List, Callable
+
+import pytest
+
+from appgate.appgate import (
+    get_current_appgate_state,
+    next_event,
+    refresh_appgate_state,
+)
+from appgate.client import AppgateClient, AppgateNotFoundException
+from appgate.openapi.types import AppgateException
+from appgate.types import AppgateOperatorContext
+from tests.utils import load_test_open_api_spec
+
+
+class FakeAppgateClient(AppgateClient):
+    def __init__(self, responses: Dict[str, Any]) -> None:
+        super().__init__(
+            controller="https://controller.devops:8443",
+            user="user",
+            password="password",
+            provider="local",
+            version=18,
+            device_id="device-id",
+            dry_run=False,
+            expiration_time_delta=60,
+        )
+        self._token = "token"
+        self.responses = responses
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests: List[str] = []
+
+    async def get(
+        self,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        cache: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        self.requests.append(path)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        response = self.responses.get(path.split("/")[-1], {"data": []})
+        if isinstance(response, Exception):
+            raise response
+        if load and response and "data" in response:
+            # Collections are loaded by the client while they are being received
+            return {**response, "data": [load(e) for e in response["data"]]}
+        return response
+
+
+def operator_context(fetch_concurrency: int) -> AppgateOperatorContext:
+    api_spec = load_test_open_api_spec(
+        reload=True,
+        entities_to_include=frozenset({"EntityDep1", "EntityDep2", "EntityDep3"}),
+    )
+    return AppgateOperatorContext(
+        namespace="ns",
+        user="user",
+        password="password",
+        provider="local",
+        controller="https://controller.devops:8443",
+        two_way_sync=True,
+        timeout=30,
+        dry_run_mode=False,
+        cleanup_mode=False,
+        api_spec=api_spec,
+        reverse_mode=False,
+        device_id="device-id",
+        fetch_concurrency=fetch_concurrency,
+    )
+
+
+def test_get_current_appgate_state_concurrency() -> None:
+    async def run(fetch_concurrency: int) -> int:
+        client = FakeAppgateClient(
+            {
+                "entity-dep-1": {
+                    "data": [{"id": "id1", "name": "dep1"}],
+                }
+            }
+        )
+        try:
+            state = await get_current_appgate_state(
+                ctx=operator_context(fetch_concurrency), appgate_client=client
+            )
+        finally:
+            await client.close()
+        assert set(state.entities_set.keys()) == {
+            "EntityDep1",
+            "EntityDep2",
+            "EntityDep3",
+        }
+        assert set(state.entities_set["EntityDep1"].entities_by_id.keys()) == {"id1"}
+        return client.max_in_flight
+
+    assert asyncio.run(run(1)) == 1
+    assert asyncio.run(run(2)) == 2
+    assert asyncio.run(run(10)) == 3
+
+
+def test_get_current_appgate_state_missing_entities() -> None:
+    async def run(fetch_concurrency: int) -> None:
+        client = FakeAppgateClient({"entity-dep-2": None})
+        try:
+            await get_current_appgate_state(
+                ctx=operator_context(fetch_concurrency), appgate_client=client
+            )
+        finally:
+            await client.close()
+
+    for fetch_concurrency in (1, 3):
+        with pytest.raises(AppgateException, match="Error reading current state"):
+            asyncio.run(run(fetch_concurrency))
+
+
+def test_refresh_appgate_state() -> None:
+    async def run() -> None:
+        client = FakeAppgateClient(
+            {
+                "entity-dep-1": {
+                    "data": [
+                        {"id": "id1", "name": "dep1"},
+                        {"id": "id2", "name": "dep2"},
+                        {"id": "id3", "name": "dep3"},
+                    ],
+                },
+                "entity-dep-2": {"data": [{"id": "id4", "name": "dep4"}]},
+                "entity-dep-3": {"data": [{"id": "id5", "name": "dep5"}]},
+            }
+        )
+        ctx = operator_context(3)
+        try:
+            state = await get_current_appgate_state(ctx=ctx, appgate_client=client)
+            client.requests = []
+            client.responses.update(
+                {
+                    "id1": {"id": "id1", "name": "dep1-renamed"},
+                    "id2": AppgateNotFoundException("Not found"),
+                    "entity-dep-2": {
+                        "data": [
+                            {"id": "id4", "name": "dep4"},
+                            {"id": "id6", "name": "dep6"},
+                        ]
+                    },
+                    "entity-dep-3": {"data": []},
+                }
+            )
+            new_state = await refresh_appgate_state(
+                ctx=ctx,
+                appgate_client=client,
+                current_appgate_state=state,
+                changed_entities={
+                    # known entities are fetched one by one
+                    "EntityDep1": {"dep1", "dep2"},
+                    # new entities need to fetch the whole collection
+                    "EntityDep2": {"dep6"},
+                },
+            )
+        finally:
+            await client.close()
+        assert sorted(r.split("//")[-1] for r in client.requests) == [
+            "entity-dep-1/id1",
+            "entity-dep-1/id2",
+            "entity-dep-2",
+        ]
+        assert {
+            e.id: e.name for e in new_state.entities_set["EntityDep1"].entities
+        } == {"id1": "dep1-renamed", "id3": "dep3"}
+        assert set(new_state.entities_set["EntityDep2"].entities_by_id.keys()) == {
+            "id4",
+            "id6",
+        }
+        # Not changed, kept from the current state
+        assert set(new_state.entities_set["EntityDep3"].entities_by_id.keys()) == {
+            "id5"
+        }
+        # current state is not modified
+        assert set(state.entities_set["EntityDep1"].entities_by_id.keys()) == {
+            "id1",
+            "id2",
+            "id3",
+        }
+
+    asyncio.run(run())
+
+
+def test_next_event() -> None:
+    async def run() -> None:
+        queue: asyncio.Queue = asyncio.Queue()
+        synced = asyncio.get_running_loop().create_future()
+        await queue.put("e1")
+        await queue.put("e2")
+        assert await next_event(queue, timeout=10, synced=synced) == "e1"
+        assert await next_event(queue, timeout=10, synced=synced) == "e2"
+        # Not synced yet, waits for the timeout
+        with pytest.raises(asyncio.TimeoutError):
+            await next_event(queue, timeout=0.01, synced=synced)
+        synced.set_result(None)
+        await queue.put("e3")
+        # Synced, the events left are received before planning right away
+        assert await next_event(queue, timeout=10, synced=synced) == "e3"
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(next_event(queue, timeout=10, synced=synced), 1)
+        # The queue still works after cancelling a get
+        await queue.put("e4")
+        assert await next_event(queue, timeout=10) == "e4"
+        with pytest.raises(asyncio.TimeoutError):
+            await next_event(queue, timeout=0.01)
+
+    asyncio.run(run())
@@ -0,0 +1,900 @@
+import asyncio
+import datetime
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Type,
+    cast,
+)
+
+import attr
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from appgate.client import (
+    AppgateClient,
+    AppgateEntityClient,
+    AppgateTransientException,
+    AppgateCircuitOpenException,
+    CachedResponse,
+    CircuitBreaker,
+    K8sEntityClient,
+    ResponseCache,
+)
+from appgate.attrs import K8S_DUMPER
+from appgate.metrics import REGISTRY
+from appgate.openapi.types import AppgateException, Entity_T
+from appgate.watcher import Informer, Watch
+from tests.utils import load_test_open_api_spec
+
+
+def loaded(
+    entities: List[Dict[str, Any]], load: Optional[Callable[[Dict[str, Any]], Any]]
+) -> List[Any]:
+    # Collections are loaded by the client while they are being received
+    return [load(e) for e in entities] if load else entities
+
+
+class PagedAppgateClient(AppgateClient):
+    def __init__(
+        self, entities: List[Dict[str, Any]], total_count: bool = True
+    ) -> None:
+        super().__init__(
+            controller="https://controller.devops:8443",
+            user="user",
+            password="password",
+            provider="local",
+            version=18,
+            device_id="device-id",
+            dry_run=False,
+            expiration_time_delta=60,
+            page_size=3,
+        )
+        self._token = "token"
+        self.entities = entities
+        self.total_count = total_count
+        self.requests: List[Optional[Dict[str, str]]] = []
+
+    async def get(
+        self,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        cache: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        self.requests.append(params)
+        if params is None:
+            return {"data": loaded(self.entities, load)}
+        start, end = [int(x) for x in params["range"].split("-")]
+        await asyncio.sleep(0.01)
+        data: Dict[str, Any] = {"data": loaded(self.entities[start:end], load)}
+        if self.total_count:
+            data["totalCount"] = len(self.entities)
+        return data
+
+
+def entity_client(client: AppgateClient) -> AppgateEntityClient:
+    # Entities are just their names
+    magic_entities: List[Any] = ["magic"]
+    return AppgateEntityClient(
+        path="/admin/entities",
+        appgate_client=client,
+        singleton=False,
+        load=lambda e: e["name"],
+        dump=lambda e: {"name": e},
+        kind="Entity",
+        magic_entities=magic_entities,
+        page_size=client.page_size,
+    )
+
+
+def test_appgate_entity_client_get_paged() -> None:
+    async def run(n: int, total_count: bool) -> List[Optional[Dict[str, str]]]:
+        client = PagedAppgateClient(
+            [{"name": f"entity-{i}"} for i in range(n)], total_count=total_count
+        )
+        try:
+            entities = await entity_client(client).get()
+        finally:
+            await client.close()
+        assert entities == [f"entity-{i}" for i in range(n)] + ["magic"]
+        return client.requests
+
+    assert asyncio.run(run(7, True)) == [
+        {"range": "0-3", "orderBy": "name"},
+        {"range": "3-6", "orderBy": "name"},
+        {"range": "6-9", "orderBy": "name"},
+    ]
+    assert len(asyncio.run(run(6, True))) == 2
+    # Without totalCount we stop on the first page that is not full
+    assert len(asyncio.run(run(6, False))) == 3
+    assert len(asyncio.run(run(0, True))) == 1
+
+
+def test_appgate_entity_client_state() -> None:
+    async def run() -> None:
+        client = PagedAppgateClient([{"name": f"entity-{i}"} for i in range(7)])
+        try:
+            entity_type = cast(Type[Entity_T], TaggedEntity)
+            entities_client = client.entity_client(
+                entity_type, "entities", singleton=False, magic_entities=None
+            )
+            # Entity clients are created only once
+            assert (
+                client.entity_client(
+                    entity_type, "entities", singleton=False, magic_entities=None
+                )
+                is entities_client
+            )
+            assert client.entity_clients == {TaggedEntity: entities_client}
+            paged_client = entity_client(client)
+            requests = paged_client.state.latency.count
+            await paged_client.get()
+        finally:
+            await client.close()
+        assert paged_client.state.total_count == 7
+        assert paged_client.state.pages == 3
+        assert paged_client.state.latency.count == requests + 3
+        # The fake controller sends no validators, one entry per page listed
+        assert paged_client.validators == [(None, None)] * 3
+
+    asyncio.run(run())
+
+
+def test_appgate_entity_client_get_paged_disabled() -> None:
+    async def run() -> List[Optional[Dict[str, str]]]:
+        client = PagedAppgateClient([{"name": f"entity-{i}"} for i in range(7)])
+        client.page_size = 0
+        try:
+            entities = await entity_client(client).get()
+        finally:
+            await client.close()
+        assert entities and len(entities) == 8
+        return client.requests
+
+    assert asyncio.run(run()) == [None]
+
+
+def test_appgate_entity_client_get_paged_empty_page() -> None:
+    class EmptyPageClient(PagedAppgateClient):
+        async def get(
+            self,
+            path: str,
+            params: Optional[Dict[str, str]] = None,
+            load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+            cache: bool = False,
+        ) -> Optional[Dict[str, Any]]:
+            if params and params["range"] != "0-3":
+                return None
+            return await super().get(path, params, load)
+
+    async def run() -> None:
+        client = EmptyPageClient([{"name": f"entity-{i}"} for i in range(7)])
+        try:
+            await entity_client(client).get()
+        finally:
+            await client.close()
+
+    with pytest.raises(AppgateException, match="Empty page received"):
+        asyncio.run(run())
+
+
+def tags_set(tags: Iterable[str]) -> FrozenSet[str]:
+    return frozenset(tags)
+
+
+@attr.attrs(frozen=True)
+class TaggedEntity:
+    id: str = attr.attrib()
+    name: str = attr.attrib()
+    tags: FrozenSet[str] = attr.attrib(converter=tags_set, factory=frozenset)
+
+
+class TaggedAppgateClient(PagedAppgateClient):
+    def __init__(self, entities: List[Dict[str, Any]], can_filter: bool) -> None:
+        super().__init__(entities)
+        self.can_filter = can_filter
+
+    async def get(
+        self,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        cache: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        tag = (params or {}).get("filterBy[tag]")
+        if tag is None:
+            return await super().get(path, params, load)
+        self.requests.append(params)
+        if not self.can_filter:
+            raise AppgateException(f"Error: [GET {path} 400] Unknown filter")
+        tagged = [e for e in self.entities if tag in e["tags"]]
+        return {"data": loaded(tagged, load), "totalCount": len(tagged)}
+
+
+def test_appgate_entity_client_get_with_tags() -> None:
+    async def run(
+        can_filter: bool, filterable: bool = True
+    ) -> List[Optional[Dict[str, str]]]:
+        client = TaggedAppgateClient(
+            [
+                {"id": "1", "name": "e1", "tags": ["t1"]},
+                {"id": "2", "name": "e2", "tags": ["t1", "t2"]},
+                {"id": "3", "name": "e3", "tags": ["t3"]},
+                {"id": "4", "name": "e4", "tags": []},
+            ],
+            can_filter=can_filter,
+        )
+        client.page_size = 0
+
+        def load(e: Dict[str, Any]) -> Any:
+            return TaggedEntity(**e)
+
+        magic_entities: List[Any] = [
+            TaggedEntity(id="m", name="magic", tags=["builtin"])
+        ]
+        entity_client = AppgateEntityClient(
+            path="/admin/entities",
+            appgate_client=client,
+            singleton=False,
+            load=load,
+            dump=lambda e: attr.asdict(e),
+            kind="Entity",
+            magic_entities=magic_entities,
+            filterable=filterable,
+        )
+        try:
+            for _ in range(2):
+                entities = await entity_client.get(tags=frozenset({"t1", "t2"}))
+                assert entities and sorted(e.name for e in entities) == ["e1", "e2"]
+            entities = await entity_client.get(tags=frozenset({"builtin"}))
+            assert entities and [e.name for e in entities] == ["magic"]
+        finally:
+            await client.close()
+        return client.requests
+
+    assert asyncio.run(run(can_filter=True)) == [
+        {"filterBy[tag]": "t1"},
+        {"filterBy[tag]": "t2"},
+        {"filterBy[tag]": "t1"},
+        {"filterBy[tag]": "t2"},
+        {"filterBy[tag]": "builtin"},
+    ]
+    # The controller is not able to filter, we fallback to filter the entities
+    # locally and remember it
+    assert asyncio.run(run(can_filter=False)) == [
+        {"filterBy[tag]": "t1"},
+        None,
+        None,
+        None,
+    ]
+    assert asyncio.run(run(can_filter=True, filterable=False)) == [None, None, None]
+
+
+def controller_app(requests: List[Dict[str, Optional[str]]]) -> web.Application:
+    entities = {"data": [{"name": "entity-1"}, {"name": "entity-2"}]}
+
+    async def with_validators(request: web.Request) -> web.Response:
+        requests.append(
+            {
+                "If-None-Match": request.headers.get("If-None-Match"),
+                "If-Modified-Since": request.headers.get("If-Modified-Since"),
+            }
+        )
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response(
+            entities,
+            headers={"ETag": '"v1"', "Last-Modified": "Wed, 21 Oct 2026 07:28:00 GMT"},
+        )
+
+    async def without_validators(request: web.Request) -> web.Response:
+        requests.append({})
+        return web.json_response(entities)
+
+    async def put(request: web.Request) -> web.Response:
+        return web.json_response(await request.json())
+
+    app = web.Application()
+    app.router.add_get("/admin/with-validators", with_validators)
+    app.router.add_get("/admin/without-validators", without_validators)
+    app.router.add_put("/admin/without-validators/{id}", put)
+    return app
+
+
+def test_appgate_client_conditional_get() -> None:
+    async def run() -> None:
+        requests: List[Dict[str, Optional[str]]] = []
+        server = TestServer(controller_app(requests))
+        await server.start_server()
+        client = AppgateClient(
+            controller=str(server.make_url("/")),
+            user="user",
+            password="password",
+            provider="local",
+            version=18,
+            device_id="device-id",
+            dry_run=False,
+            expiration_time_delta=60,
+        )
+        client._token = "token"
+        loads: List[str] = []
+
+        def load(e: Dict[str, Any]) -> Any:
+            loads.append(e["name"])
+            return e["name"]
+
+        try:
+            for path in ("/admin/with-validators", "/admin/without-validators"):
+                entity_client = AppgateEntityClient(
+                    path=path,
+                    appgate_client=client,
+                    singleton=False,
+                    load=load,
+                    dump=lambda e: {"name": e},
+                    kind="Entity",
+                )
+                loads.clear()
+                assert await entity_client.get() == ["entity-1", "entity-2"]
+                assert await entity_client.get() == ["entity-1", "entity-2"]
+                # Entities are loaded only once
+                assert loads == ["entity-1", "entity-2"]
+            assert requests == [
+                {"If-None-Match": None, "If-Modified-Since": None},
+                {
+                    "If-None-Match": '"v1"',
+                    "If-Modified-Since": "Wed, 21 Oct 2026 07:28:00 GMT",
+                },
+                {},
+                {},
+            ]
+            # Writes invalidate the cached collection
+            assert client.cached_response("/admin/without-validators")
+            await client.put("/admin/without-validators/id1", {"name": "entity-1"})
+            assert client.cached_response("/admin/without-validators") is None
+            assert client.cached_response("/admin/with-validators")
+            # Only the collection listings are cached
+            await client.get("/admin/with-validators", params={"range": "0-0"})
+            assert (
+                client.cached_response("/admin/with-validators", {"range": "0-0"})
+                is None
+            )
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_appgate_client_conditional_get_paged() -> None:
+    async def run() -> None:
+        requests: List[Optional[str]] = []
+        entities = [{"name": f"entity-{i}"} for i in range(3)]
+
+        async def paged(request: web.Request) -> web.Response:
+            etag = f'"{request.query["range"]}"'
+            requests.append(request.headers.get("If-None-Match"))
+            if request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304)
+            start, end = [int(x) for x in request.query["range"].split("-")]
+            return web.json_response(
+                {"data": entities[start:end], "totalCount": len(entities)},
+                headers={"ETag": etag},
+            )
+
+        app = web.Application()
+        app.router.add_get("/admin/entities", paged)
+        server = TestServer(app)
+        await server.start_server()
+        client = AppgateClient(
+            controller=str(server.make_url("/")),
+            user="user",
+            password="password",
+            provider="local",
+            version=18,
+            device_id="device-id",
+            dry_run=False,
+            expiration_time_delta=60,
+        )
+        client._token = "token"
+        try:
+            entity_client = AppgateEntityClient(
+                path="/admin/entities",
+                appgate_client=client,
+                singleton=False,
+                load=lambda e: e["name"],
+                dump=lambda e: {"name": e},
+                kind="Entity",
+                page_size=2,
+            )
+            expected = ["entity-0", "entity-1", "entity-2"]
+            assert await entity_client.get() == expected
+            assert entity_client.validators == [('"0-2"', None), ('"2-4"', None)]
+            # Each page is revalidated with its own validators
+            assert await entity_client.get() == expected
+            assert requests == [None, None, '"0-2"', '"2-4"']
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_response_cache() -> None:
+    cache = ResponseCache(max_entries=2)
+    for key in ("/admin/a?range=0-10", "/admin/a?range=10-20", "/admin/b"):
+        cache.put(key, CachedResponse(digest=key, data={}))
+    assert cache.get("/admin/a?range=0-10")
+    # The least recently used listing of each collection is forgotten
+    cache.put("/admin/a?range=20-30", CachedResponse(digest="", data={}))
+    assert cache.get("/admin/a?range=10-20") is None
+    assert cache.get("/admin/a?range=0-10")
+    assert cache.get("/admin/b")
+    assert len(cache) == 3
+    cache.invalidate("/admin/a/id1")
+    assert cache.get("/admin/a?range=0-10") is None
+    assert len(cache) == 1
+
+
+def flaky_app(failures: Dict[str, List[int]], calls: Dict[str, int]) -> web.Application:
+    async def handler(request: web.Request) -> web.Response:
+        key = f"{request.method} {request.path}"
+        calls[key] = calls.get(key, 0) + 1
+        if failures.get(key):
+            return web.Response(status=failures[key].pop(0), text="boom")
+        return web.json_response({"id": "id1"})
+
+    app = web.Application()
+    app.router.add_route("*", "/admin/{path:.*}", handler)
+    return app
+
+
+async def flaky_client(
+    failures: Dict[str, List[int]], calls: Dict[str, int], breaker: CircuitBreaker
+) -> tuple[TestServer, AppgateClient]:
+    server = TestServer(flaky_app(failures, calls))
+    await server.start_server()
+    client = AppgateClient(
+        controller=str(server.make_url("/")),
+        user="user",
+        password="password",
+        provider="local",
+        version=18,
+        device_id="device-id",
+        dry_run=False,
+        expiration_time_delta=60,
+        max_retries=2,
+        circuit_breaker=breaker,
+    )
+    client._token = "token"
+    client.retry_policies = {
+        k: attr.evolve(v, backoff_base=0.001) for k, v in client.retry_policies.items()
+    }
+    return server, client
+
+
+def test_appgate_client_controllers_failover() -> None:
+    async def run() -> None:
+        calls_1: Dict[str, int] = {}
+        calls_2: Dict[str, int] = {}
+        server_1 = TestServer(flaky_app({"GET /admin/a": [503]}, calls_1))
+        server_2 = TestServer(flaky_app({}, calls_2))
+        await server_1.start_server()
+        await server_2.start_server()
+        controllers = [str(server_1.make_url("/")), str(server_2.make_url("/"))]
+        client = AppgateClient(
+            controller=",".join(controllers),
+            user="user",
+            password="password",
+            provider="local",
+            version=18,
+            device_id="device-id",
+            dry_run=False,
+            expiration_time_delta=60,
+            max_retries=2,
+        )
+        client._token = "token"
+        client.retry_policies = {
+            k: attr.evolve(v, backoff_base=0.001)
+            for k, v in client.retry_policies.items()
+        }
+        try:
+            assert await client.get("/admin/a") == {"id": "id1"}
+            # Writes fail over to the next controller while the primary is down
+            assert await client.put("/admin/a", {"name": "a"}) == {"id": "id1"}
+        finally:
+            await client.close()
+            await server_1.close()
+            await server_2.close()
+        assert calls_1 == {"GET /admin/a": 1}
+        assert calls_2 == {"GET /admin/a": 1, "PUT /admin/a": 1}
+        endpoint_1, endpoint_2 = client.endpoints.endpoints
+        assert not endpoint_1.healthy and endpoint_1.failures == 1
+        assert endpoint_2.healthy and endpoint_2.latency is not None
+        healthy = REGISTRY.gauge(
+            "appgate_controller_healthy", controller=controllers[0]
+        )
+        assert healthy.value == 0
+
+    asyncio.run(run())
+
+
+def test_appgate_client_hedged_requests() -> None:
+    asyncio.run(run_hedged_requests(slow_delay=1.0, read_rate_limit=0))
+
+
+def test_appgate_client_hedged_requests_rate_limited() -> None:
+    # The hedge waits for the rate limiter, the original response comes first
+    asyncio.run(run_hedged_requests(slow_delay=0.3, read_rate_limit=1))
+
+
+async def run_hedged_requests(slow_delay: float, read_rate_limit: float) -> None:
+    calls: List[str] = []
+
+    def app(name: str, delay: float) -> web.Application:
+        async def handler(request: web.Request) -> web.Response:
+            calls.append(name)
+            await asyncio.sleep(delay)
+            return web.json_response({"data": [name]})
+
+        app = web.Application()
+        app.router.add_get("/admin/entities", handler)
+        return app
+
+    slow, fast = TestServer(app("slow", slow_delay)), TestServer(app("fast", 0.0))
+    await slow.start_server()
+    await fast.start_server()
+    client = AppgateClient(
+        controller=f"{slow.make_url('/')},{fast.make_url('/')}",
+        user="user",
+        password="password",
+        provider="local",
+        version=18,
+        device_id="device-id",
+        dry_run=False,
+        expiration_time_delta=60,
+        hedge_percentile=90,
+        hedge_budget=1,
+        read_rate_limit=read_rate_limit,
+    )
+    client._token = "token"
+    for _ in range(20):
+        client.hedging.record("/admin/entities", 0.01)
+    REGISTRY.clear()
+    try:
+        start = time.monotonic()
+        # The request goes first to the slow controller, not measured yet
+        resp = await client.get("/admin/entities")
+        elapsed = time.monotonic() - start
+    finally:
+        await client.close()
+        await slow.close()
+        await fast.close()
+    if read_rate_limit:
+        assert resp == {"data": ["slow"]}
+        assert calls == ["slow"]
+    else:
+        assert resp == {"data": ["fast"]}
+        assert elapsed < 0.5
+        assert calls == ["slow", "fast"]
+        assert REGISTRY.counter("appgate_client_hedged_requests", winner="hedge").value
+
+
+def test_appgate_client_retries() -> None:
+    async def run() -> Dict[str, int]:
+        calls: Dict[str, int] = {}
+        failures = {
+            "GET /admin/a": [503, 500],
+            "PUT /admin/a/id1": [502, 502, 502],
+            "POST /admin/b": [503],
+            "POST /admin/c": [500],
+            "DELETE /admin/a/id1": [404],
+            "POST /admin/d": [429],
+        }
+        server, client = await flaky_client(failures, calls, CircuitBreaker())
+        try:
+            assert await client.get("/admin/a") == {"id": "id1"}
+            with pytest.raises(AppgateTransientException):
+                await client.put("/admin/a/id1", {})
+            assert await client.post("/admin/b", {}) == {"id": "id1"}
+            with pytest.raises(AppgateTransientException):
+                await client.post("/admin/c", {})
+            # POST is retried on 429, the controller did not process it
+            assert await client.post("/admin/d", {}) == {"id": "id1"}
+            with pytest.raises(AppgateException) as exc_info:
+                await client.delete("/admin/a/id1")
+            assert not isinstance(exc_info.value, AppgateTransientException)
+            assert client.circuit_breaker.healthy
+        finally:
+            await client.close()
+            await server.close()
+        return calls
+
+    assert asyncio.run(run()) == {
+        "GET /admin/a": 3,
+        "PUT /admin/a/id1": 3,
+        "POST /admin/b": 2,
+        # POST is not retried on 500, it could have been applied
+        "POST /admin/c": 1,
+        "DELETE /admin/a/id1": 1,
+        "POST /admin/d": 2,
+    }
+
+
+def test_appgate_client_circuit_breaker() -> None:
+    async def run() -> None:
+        calls: Dict[str, int] = {}
+        failures = {"GET /admin/a": [503] * 6}
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+        server, client = await flaky_client(failures, calls, breaker)
+        try:
+            for _ in range(2):
+                with pytest.raises(AppgateTransientException):
+                    await client.get("/admin/a")
+            assert breaker.is_open
+            # Fail fast while the circuit is open
+            with pytest.raises(AppgateCircuitOpenException):
+                await client.get("/admin/a")
+            assert calls["GET /admin/a"] == 6
+            await asyncio.sleep(0.2)
+            # Half-open, only one request probes the controller
+            results = await asyncio.gather(
+                client.get("/admin/a"), client.get("/admin/a"), return_exceptions=True
+            )
+            assert results[0] == {"id": "id1"}
+            assert isinstance(results[1], AppgateCircuitOpenException)
+            assert calls["GET /admin/a"] == 7
+            assert not breaker.is_open
+            assert breaker.healthy
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(run())
+
+
+def auth_app(state: Dict[str, Any]) -> web.Application:
+    async def login(request: web.Request) -> web.Response:
+        state["logins"] += 1
+        state.setdefault("login_times", []).append(datetime.datetime.now().timestamp())
+        await asyncio.sleep(0.05)
+        state["token"] = f"token-{state['logins']}"
+        expires = datetime.datetime.now() + datetime.timedelta(
+            seconds=state.get("lifetime", 61)
+        )
+        return web.json_response(
+            {"token": state["token"], "expires": expires.strftime("%Y-%m-%dT%H:%M:%S")}
+        )
+
+    async def entities(request: web.Request) -> web.Response:
+        if request.headers.get("Authorization") != f"Bearer {state['token']}":
+            return web.Response(status=401)
+        return web.json_response({"data": []})
+
+    app = web.Application()
+    app.router.add_post("/admin/login", login)
+    app.router.add_get("/admin/entities", entities)
+    return app
+
+
+def test_appgate_client_single_flight_login() -> None:
+    async def run() -> Dict[str, Any]:
+        state: Dict[str, Any] = {"logins": 0, "token": None}
+        server = TestServer(auth_app(state))
+        await server.start_server()
+        client = AppgateClient(
+            controller=str(server.make_url("/")),
+            user="user",
+            password="password",
+            provider="local",
+            version=18,
+            device_id="device-id",
+            dry_run=False,
+            expiration_time_delta=60,
+        )
+        try:
+            # Expired token
+            client._token = "expired"
+            client._expiration_time = 1
+            await asyncio.gather(*[client.get("/admin/entities") for _ in range(10)])
+            assert state["logins"] == 1
+            # Token rejected by the controller
+            state["token"] = "new-token"
+            await asyncio.gather(*[client.get("/admin/entities") for _ in range(10)])
+            assert state["logins"] == 2
+        finally:
+            await client.close()
+            await server.close()
+        return state
+
+    asyncio.run(run())
+
+
+def test_appgate_client_token_renewal(monkeypatch) -> None:
+    monkeypatch.setattr("appgate.client.TOKEN_RENEWAL_MIN_DELAY", 0.1)
+    monkeypatch.setattr("appgate.client.TOKEN_RENEWAL_MARGIN", 0.5)
+
+    async def run() -> None:
+        # Tokens valid for 1 to 2 seconds once the expiration delta is applied
+        state: Dict[str, Any] = {"logins": 0, "token": None, "lifetime": 62}
+        server = TestServer(auth_app(state))
+        await server.start_server()
+        try:
+            async with AppgateClient(
+                controller=str(server.make_url("/")),
+                user="user",
+                password="password",
+                provider="local",
+                version=18,
+                device_id="device-id",
+                dry_run=False,
+                expiration_time_delta=60,
+            ) as client:
+                assert state["logins"] == 1
+                expiration_time = client._expiration_time
+                assert expiration_time
+                # The token is renewed in the background before it expires
+                await asyncio.sleep(2.5)
+                assert state["logins"] >= 2
+                assert state["login_times"][1] < expiration_time
+                assert client._token == state["token"]
+                # A login in progress is cancelled when closing the client
+                login = asyncio.create_task(client.login())
+                await asyncio.sleep(0)
+            assert client._login_task is None
+            await asyncio.gather(login, return_exceptions=True)
+            assert login.cancelled()
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_appgate_client_retry_after() -> None:
+    async def run() -> float:
+        calls: Dict[str, int] = {}
+
+        async def handler(request: web.Request) -> web.Response:
+            calls["GET"] = calls.get("GET", 0) + 1
+            if calls["GET"] == 1:
+                return web.Response(status=429, headers={"Retry-After": "0.3"})
+            return web.json_response({"data": []})
+
+        app = web.Application()
+        app.router.add_get("/admin/entities", handler)
+        server, client = await flaky_client({}, calls, CircuitBreaker())
+        await server.close()
+        server = TestServer(app)
+        await server.start_server()
+        client.controller = str(server.make_url("/"))
+        try:
+            start = time.monotonic()
+            assert await client.get("/admin/entities") == {"data": []}
+            return time.monotonic() - start
+        finally:
+            await client.close()
+            await server.close()
+
+    assert asyncio.run(run()) >= 0.3
+
+
+def test_appgate_client_connection_pool() -> None:
+    async def run(compression: bool) -> List[Optional[str]]:
+        accept_encodings: List[Optional[str]] = []
+
+        async def handler(request: web.Request) -> web.Response:
+            accept_encodings.append(request.headers.get("Accept-Encoding"))
+            await asyncio.sleep(0.05)
+            return web.json_response({"data": []})
+
+        app = web.Application()
+        app.router.add_get("/admin/entities", handler)
+        server = TestServer(app)
+        await server.start_server()
+        client = AppgateClient(
+            controller=str(server.make_url("/")),
+            user="user",
+            password="password",
+            provider="local",
+            version=18,
+            device_id="device-id",
+            dry_run=False,
+            expiration_time_delta=60,
+            connection_pool_size=1,
+            compression=compression,
+        )
+        client._token = "token"
+        REGISTRY.clear()
+        try:
+            await asyncio.gather(
+                *(client.get("/admin/entities", params={"n": str(i)}) for i in range(3))
+            )
+        finally:
+            await client.close()
+            await server.close()
+        # Only one connection, the other requests waited for it
+        assert REGISTRY.counter("appgate_client_connections_created").value == 1
+        assert REGISTRY.counter("appgate_client_connections_reused").value == 2
+        assert REGISTRY.counter("appgate_client_connections_queued").value == 2
+        assert REGISTRY.summary("appgate_client_connection_queued_seconds").max > 0
+        assert REGISTRY.gauge("appgate_client_connections_waiting").value == 0
+        return accept_encodings
+
+    assert all("gzip" in (e or "") for e in asyncio.run(run(True)))
+    assert asyncio.run(run(False)) == ["identity"] * 3
+
+
+class RecordingCustomObjectsApi:
+    def __init__(self) -> None:
+        self.calls: List[str] = []
+        # Threads where the calls were made
+        self.threads: Set[int] = set()
+
+    def _record(self, call: str) -> None:
+        self.calls.append(call)
+        self.threads.add(threading.get_ident())
+
+    def create_namespaced_custom_object(self, *args: Any) -> None:
+        self._record(f"create {args[-1]['metadata']['name']}")
+
+    def patch_namespaced_custom_object(self, *args: Any) -> None:
+        self._record(f"patch {args[-2]}")
+
+    def delete_namespaced_custom_object(self, *args: Any) -> None:
+        self._record(f"delete {args[-1]}")
+
+
+def test_k8s_entity_client_informer() -> None:
+    api_spec = load_test_open_api_spec(
+        reload=True, entities_to_include=frozenset({"EntityDep1"})
+    )
+    EntityDep1 = api_spec.entities["EntityDep1"].cls
+    k8s_api = RecordingCustomObjectsApi()
+    informer = Informer()
+    watch = Watch("entitydep1s", "/entitydep1s", lambda e: asyncio.sleep(0))
+    informer.add("EntityDep1", watch)
+    client = K8sEntityClient(
+        k8s_api=k8s_api,  # type: ignore
+        api_spec=api_spec,
+        crd_version="v1",
+        namespace="ns",
+        kind="EntityDep1",
+        informer=informer,
+    )
+    dep1 = EntityDep1(id="id1", name="dep1")
+    dep2 = EntityDep1(id="id2", name="dep2")
+    watch.relist(
+        {
+            "kind": "EntityDep1List",
+            "metadata": {"resourceVersion": "1"},
+            "items": [K8S_DUMPER(api_spec).dump(dep1, True, None)],
+        }
+    )
+
+    async def run() -> None:
+        # Up to date, nothing to write
+        await client.modify(dep1)
+        await client.create(dep1)
+        # Unknown entities are not deleted
+        await client.delete(dep2)
+        await client.create(dep2)
+        # Changed in k8s
+        changed = K8S_DUMPER(api_spec).dump(dep1, True, None)
+        changed["spec"] = {"name": "changed"}
+        watch.update({"type": "MODIFIED", "object": changed})
+        await client.modify(dep1)
+        await client.delete(dep1)
+
+    asyncio.run(run())
+    assert k8s_api.calls == ["create dep2", "patch dep1", "delete dep1"]
+    # The blocking k8s calls are made out of the event loop
+    assert threading.get_ident() not in k8s_api.threads
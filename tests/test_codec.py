@@ -0,0 +1,53 @@
+import json
+from typing import Any, Iterator
+
+import pytest
+
+from appgate import codec
+
+
+VALUE = {
+    "name": "entity-å",
+    "tags": ["b", "a"],
+    "nested": {"z": [1, 2.5, None, True], "a": {}, "empty": []},
+    "notes": "line one\nline two",
+}
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request: Any) -> Iterator[str]:
+    orjson = codec.orjson
+    if request.param == "json":
+        codec.orjson = None  # type: ignore
+    elif orjson is None:
+        pytest.skip("orjson is not installed")
+    try:
+        yield request.param
+    finally:
+        codec.orjson = orjson
+
+
+def test_codec_dumps(backend: str) -> None:
+    assert json.loads(codec.dumps(VALUE)) == VALUE
+    assert codec.dumps(VALUE, sort_keys=True) == json.dumps(
+        VALUE, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    # The diffs are rendered the same way with both backends
+    for indent in (2, 4):
+        assert codec.dumps(VALUE, indent=indent) == json.dumps(
+            VALUE, indent=indent, ensure_ascii=False
+        )
+
+
+def test_codec_dumps_fallback(backend: str) -> None:
+    # Keys that are not strings and integers bigger than 64 bits
+    assert json.loads(codec.dumps({1: 2**70})) == {"1": 2**70}
+    with pytest.raises(TypeError):
+        codec.dumps({"set": {1, 2}})
+
+
+def test_codec_loads(backend: str) -> None:
+    assert codec.loads(json.dumps(VALUE)) == VALUE
+    assert codec.loads(json.dumps(VALUE).encode()) == VALUE
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads(b'{"data": ')
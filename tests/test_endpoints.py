@@ -0,0 +1,64 @@
+import random
+import time
+
+import pytest
+
+from appgate.endpoints import EndpointPool, parse_controllers
+
+
+def pool(*urls: str) -> EndpointPool:
+    # Never explore, reads always go to the fastest controller
+    rng = random.Random()
+    rng.random = lambda: 1.0  # type: ignore
+    return EndpointPool(list(urls), rng=rng)
+
+
+def test_parse_controllers() -> None:
+    assert parse_controllers("https://c1:8443") == ["https://c1:8443"]
+    assert parse_controllers(" https://c1:8443, https://c2:8443,") == [
+        "https://c1:8443",
+        "https://c2:8443",
+    ]
+    with pytest.raises(ValueError):
+        EndpointPool(parse_controllers(""))
+
+
+def test_endpoint_pool_reads() -> None:
+    endpoints = pool("https://c1", "https://c2", "https://c3")
+    c1, c2, c3 = endpoints.endpoints
+    assert c1.url_for("/admin/sites") == "https://c1/admin/sites"
+    # Controllers not measured yet are tried first
+    for c, latency in ((c1, 0.3), (c2, 0.1), (c3, 0.2)):
+        assert endpoints.read_endpoint() is c
+        endpoints.record_latency(c, latency)
+    assert endpoints.read_endpoint() is c2
+    # The latency is a moving average
+    endpoints.record_latency(c2, 1.0)
+    endpoints.record_latency(c2, 1.0)
+    assert c2.latency is not None and 0.5 < c2.latency < 1.0
+    assert endpoints.read_endpoint() is c3
+    endpoints.record_failure(c3)
+    assert endpoints.read_endpoint() is c1
+
+
+def test_endpoint_pool_writes() -> None:
+    endpoints = pool("https://c1", "https://c2")
+    c1, c2 = endpoints.endpoints
+    endpoints.record_latency(c2, 0.1)
+    endpoints.record_latency(c1, 0.5)
+    # Writes are pinned to the primary whatever its latency
+    assert endpoints.write_endpoint() is c1
+    endpoints.record_failure(c1)
+    assert endpoints.write_endpoint() is c2
+    # The time a controller is down grows with its failures
+    endpoints.record_failure(c2)
+    endpoints.record_failure(c2)
+    assert c2.down_until > c1.down_until
+    # When all of them are down the one that will be back first is used
+    assert endpoints.write_endpoint() is c1
+    assert endpoints.read_endpoint() is c1
+    c1.down_until = time.monotonic()
+    assert c1.healthy
+    endpoints.record_latency(c1, 0.5)
+    assert c1.failures == 0
+    assert endpoints.write_endpoint() is c1
@@ -15,6 +15,7 @@ from appgate.attrs import (
     DIFF_DUMPER,
     GIT_DUMPER,
     GIT_LOADER,
+    _json_safe,
 )
 from appgate.openapi.openapi import generate_api_spec
 from appgate.openapi.types import (
@@ -1392,3 +1393,10 @@ def test_is_entity_included() -> None:
     assert is_entity_included("a", None, frozenset({"a"})) is False
     assert is_entity_included("a", None, frozenset()) is True
     assert is_entity_included("a", None, frozenset("b")) is True
+
+
+def test_json_safe_set_order() -> None:
+    # Sets are dumped in the order of their stdlib JSON encoding, with non
+    # ascii characters escaped, so dumps don't change between versions
+    assert _json_safe(frozenset({"z", "é", "a"})) == ["é", "a", "z"]
+    assert _json_safe({"values": {2, 10, 1}}) == {"values": [1, 10, 2]}
@@ -0,0 +1,138 @@
+import asyncio
+import random
+from typing import Dict, Set
+
+import attr
+
+from appgate.appgate import get_current_appgate_state
+from appgate.client import AppgateClient
+from appgate.fakecontroller import FakeController, synthetic_entity
+from appgate.openapi.openapi import generate_api_spec_clients
+from appgate.state import AppgateState, appgate_plan_apply, create_appgate_plan
+from appgate.types import AppgateOperatorContext, EntitiesSet, EntityWrapper
+from tests.utils import load_test_open_api_spec
+
+
+KINDS = frozenset({"EntityDep1", "EntityDep2", "EntityDep3"})
+
+
+def operator_context(controller: str) -> AppgateOperatorContext:
+    return AppgateOperatorContext(
+        namespace="ns",
+        user="user",
+        password="password",
+        provider="local",
+        controller=controller,
+        two_way_sync=True,
+        timeout=30,
+        dry_run_mode=False,
+        cleanup_mode=False,
+        api_spec=load_test_open_api_spec(reload=True, entities_to_include=KINDS),
+        reverse_mode=False,
+        device_id="device-id",
+        page_size=4,
+    )
+
+
+def new_client(ctx: AppgateOperatorContext, max_retries: int = 3) -> AppgateClient:
+    assert ctx.device_id is not None
+    client = AppgateClient(
+        controller=ctx.controller,
+        user=ctx.user,
+        password=ctx.password,
+        provider=ctx.provider,
+        version=18,
+        device_id=ctx.device_id,
+        dry_run=False,
+        expiration_time_delta=60,
+        page_size=ctx.page_size,
+        max_retries=max_retries,
+    )
+    client.retry_policies = {
+        k: attr.evolve(v, backoff_base=0.001) for k, v in client.retry_policies.items()
+    }
+    return client
+
+
+def names(state: AppgateState) -> Dict[str, Set[str]]:
+    return {
+        k: {e.name for e in v.entities}
+        for k, v in state.entities_set.items()
+        if k in KINDS
+    }
+
+
+def test_fake_controller_converges() -> None:
+    async def run() -> None:
+        ctx = operator_context("")
+        controller = FakeController(ctx.api_spec)
+        assert controller.seed(10, entity_types=KINDS) == 30
+        async with controller:
+            ctx = attr.evolve(ctx, controller=controller.url)
+            client = new_client(ctx)
+            try:
+                await client.login()
+                current = await get_current_appgate_state(ctx, client)
+                assert names(current) == {
+                    k: {f"{k.lower()}-{i}" for i in range(10)} for k in KINDS
+                }
+                # Drop the first entity of each type and add a new one
+                expected = AppgateState(
+                    entities_set={
+                        k: EntitiesSet(
+                            {
+                                e
+                                for e in current.entities_set[k].entities
+                                if e.name != f"{k.lower()}-0"
+                            }
+                            | {
+                                EntityWrapper(
+                                    synthetic_entity(k, ctx.api_spec.entities[k], 10)
+                                )
+                            }
+                        )
+                        for k in KINDS
+                    }
+                )
+                plan = create_appgate_plan(
+                    current, expected, frozenset({"builtin"}), None, None
+                )
+                new_plan, _ = await appgate_plan_apply(
+                    plan,
+                    operator_name="operator",
+                    namespace="ns",
+                    api_spec=ctx.api_spec,
+                    entity_clients=generate_api_spec_clients(ctx.api_spec, client),
+                )
+                assert not new_plan.errors
+                current = await get_current_appgate_state(ctx, client)
+            finally:
+                await client.close()
+        assert names(current) == names(expected)
+        assert controller.requests["POST"] == 4
+        assert controller.requests["DELETE"] == 3
+
+    asyncio.run(run())
+
+
+def test_fake_controller_errors_and_rate_limit() -> None:
+    async def run() -> None:
+        ctx = operator_context("")
+        controller = FakeController(
+            ctx.api_spec, error_rate=0.2, rate_limit=20, rng=random.Random(1)
+        )
+        controller.seed(10, entity_types=KINDS)
+        async with controller:
+            ctx = attr.evolve(ctx, controller=controller.url)
+            client = new_client(ctx, max_retries=20)
+            try:
+                await client.login()
+                for _ in range(3):
+                    current = await get_current_appgate_state(ctx, client)
+                    assert all(len(v) == 10 for v in names(current).values())
+            finally:
+                await client.close()
+        assert controller.errors > 0
+        assert controller.rate_limited > 0
+
+    asyncio.run(run())
@@ -0,0 +1,51 @@
+from appgate.hedging import HedgingPolicy, LatencyHistogram, MIN_SAMPLES, route
+
+
+def test_latency_histogram_percentile() -> None:
+    histogram = LatencyHistogram(size=100)
+    assert histogram.percentile(95) == 0
+    for i in range(200):
+        histogram.record(i / 1000)
+    # Only the last samples are kept
+    assert len(histogram.samples) == 100
+    assert histogram.percentile(50) == 0.149
+    assert histogram.percentile(95) == 0.194
+    assert histogram.percentile(100) == 0.199
+
+
+def test_hedging_policy() -> None:
+    policy = HedgingPolicy(percentile=90, budget=0.25)
+    assert policy.enabled
+    assert not HedgingPolicy(percentile=0).enabled
+    assert not HedgingPolicy(percentile=90, budget=0).enabled
+    # Paths are not hedged until we know their latency
+    for i in range(MIN_SAMPLES - 1):
+        assert policy.delay("/admin/sites") is None
+        policy.record("/admin/sites", (i % 10) / 10)
+    policy.record("/admin/sites", 0.9)
+    assert policy.delay("/admin/sites") == 0.8
+    assert policy.delay("/admin/entitlements") is None
+    # The requests to the entities of a collection share their latencies
+    for i in range(MIN_SAMPLES):
+        policy.record(f"/admin/sites/site-{i}", 0.5)
+    assert policy.delay("/admin/sites/site-new") == 0.5
+    assert set(policy.histograms) == {"/admin/sites", "/admin/sites/{id}"}
+    # Each request adds a quarter of a hedge to the budget
+    policy = HedgingPolicy(percentile=90, budget=0.25)
+    for _ in range(3):
+        policy.delay("/admin/sites")
+    assert not policy.acquire()
+    policy.delay("/admin/sites")
+    assert policy.acquire()
+    assert not policy.acquire()
+    # The budget saved is capped
+    for _ in range(1000):
+        policy.delay("/admin/sites")
+    assert sum(policy.acquire() for _ in range(100)) == 10
+
+
+def test_route() -> None:
+    assert route("/admin/sites") == "/admin/sites"
+    assert route("admin/sites/") == "/admin/sites"
+    assert route("/admin/sites/site-1") == "/admin/sites/{id}"
+    assert route("/admin/appliances/a-1/upgrade") == "/admin/appliances/{id}/upgrade"
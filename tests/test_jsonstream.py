@@ -0,0 +1,95 @@
+import json
+from typing import Any, Dict, List
+
+import pytest
+
+from appgate.jsonstream import CollectionParser
+
+
+def parse(body: bytes, chunk_size: int, **kwargs: Any) -> Dict[str, Any]:
+    parser = CollectionParser(**kwargs)
+    for i in range(0, len(body), chunk_size):
+        parser.feed(body[i : i + chunk_size])
+    return parser.close()
+
+
+def test_collection_parser() -> None:
+    document = {
+        "range": "0-3",
+        "data": [
+            {"id": "1", "name": "entity-1", "tags": ["å", "ß"]},
+            {"id": "2", "name": "entitý-2", "nested": {"data": [1, 2]}},
+            {"id": "3", "name": "entity-3", "number": 12345.5},
+        ],
+        "orderBy": "name",
+        "totalCount": 12345,
+        "descending": False,
+        "filterBy": [],
+    }
+    body = json.dumps(document, ensure_ascii=False, indent=2).encode()
+    for chunk_size in (1, 2, 3, 7, 64, len(body)):
+        loaded: List[str] = []
+
+        def load(e: Dict[str, Any]) -> str:
+            loaded.append(e["name"])
+            return e["name"].upper()
+
+        assert parse(body, chunk_size, load=load) == {
+            **document,
+            "data": ["ENTITY-1", "ENTITÝ-2", "ENTITY-3"],
+        }
+        assert loaded == ["entity-1", "entitý-2", "entity-3"]
+
+
+def test_collection_parser_items_loaded_as_they_arrive() -> None:
+    loaded: List[str] = []
+    parser = CollectionParser(load=lambda e: loaded.append(e["name"]))
+    parser.feed(b'{"data": [{"name": "entity-1"}, {"name": "ent')
+    assert loaded == ["entity-1"]
+    parser.feed(b'ity-2"}]}')
+    assert loaded == ["entity-1", "entity-2"]
+    parser.close()
+
+
+def test_collection_parser_reuses_loaded_items() -> None:
+    loaded: List[str] = []
+
+    def load(e: Dict[str, Any]) -> Dict[str, Any]:
+        loaded.append(e["name"])
+        return e
+
+    parser = CollectionParser(load=load)
+    parser.feed(b'{"data": [{"name": "entity-1"}, {"name": "entity-2"}]}')
+    first = parser.close()
+    parser = CollectionParser(load=load, loaded_items=parser.loaded_items)
+    parser.feed(b'{"data": [{"name": "entity-1"}, {"name": "entity-3"}]}')
+    second = parser.close()
+    assert loaded == ["entity-1", "entity-2", "entity-3"]
+    assert second["data"][0] is first["data"][0]
+
+
+def test_collection_parser_empty_and_without_data() -> None:
+    assert parse(b'{"data": []}', 1, load=str) == {"data": []}
+    assert parse(b"{}", 1, load=str) == {}
+    assert parse(b'{"name": "singleton", "value": 1}', 3, load=str) == {
+        "name": "singleton",
+        "value": 1,
+    }
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"",
+        b"[]",
+        b'{"data": [1, 2}',
+        b'{"data": [1, 2]',
+        b'{"data": [1,, 2]}',
+        b'{"data" [1]}',
+        b'{"data": [1]} {}',
+        b'{"data": [{"name": }]}',
+    ],
+)
+def test_collection_parser_invalid(body: bytes) -> None:
+    with pytest.raises(json.JSONDecodeError):
+        parse(body, 2, load=str)
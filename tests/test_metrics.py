@@ -0,0 +1,23 @@
+from appgate.metrics import MetricsRegistry
+
+
+def test_metrics_registry() -> None:
+    registry = MetricsRegistry()
+    registry.counter("requests", verb="GET").inc()
+    registry.counter("requests", verb="GET").inc(2)
+    registry.counter("requests", verb="PUT").inc()
+    registry.gauge("rate").set(2.5)
+    registry.summary("wait").observe(1)
+    registry.summary("wait").observe(3)
+    assert registry.counter("requests", verb="GET").value == 3
+    assert registry.summary("wait").mean == 2
+    assert registry.summary("wait").max == 3
+    assert registry.lines() == [
+        "rate: 2.5",
+        "requests{verb=GET}: 3",
+        "requests{verb=PUT}: 1",
+        "wait: count=2 total=4.000 mean=2.000 max=3.000",
+    ]
+    assert registry.totals() == {"requests": 4}
+    registry.clear()
+    assert registry.lines() == []
@@ -1,4 +1,5 @@
 from asyncio import Queue
+from typing import List
 
 import pytest
 
@@ -9,11 +10,16 @@ from appgate.openapi.types import (
     get_supported_entities,
     SPEC_ENTITIES,
 )
-from appgate.operator import get_k8s_tasks
+from appgate.metrics import REGISTRY
+from appgate.operator import coalesce_events, get_k8s_tasks
 from appgate.types import (
+    AppgateEvent,
+    AppgateEventError,
+    AppgateEventSuccess,
     AppgateOperatorArguments,
     get_tags,
 )
+from tests.utils import load_test_open_api_spec
 
 ALL_APPGATE_ENTITIES = set(get_supported_entities(SPEC_ENTITIES).values())
 
@@ -181,3 +187,45 @@ def test_appgate_operator_context_6() -> None:
                 entities_to_include=get_tags([], "DoesNotExistSoItsEmpy"),
             )
         ).api_spec.api_entities
+
+
+def test_coalesce_events() -> None:
+    api_spec = load_test_open_api_spec(
+        reload=True, entities_to_include=frozenset({"EntityDep1", "EntityDep2"})
+    )
+    EntityDep1 = api_spec.entities["EntityDep1"].cls
+    EntityDep2 = api_spec.entities["EntityDep2"].cls
+    dep1_v1 = EntityDep1(id="id1", name="dep1")
+    dep1_v2 = EntityDep1(id="id1-2", name="dep1")
+    dep2 = EntityDep1(id="id2", name="dep2")
+    dep3 = EntityDep1(id="id3", name="dep3")
+    # Different kind with the same name
+    other_dep1 = EntityDep2(id="id4", name="dep1")
+    error = AppgateEventError(name="dep4", kind="EntityDep1", error="error")
+    events: List[AppgateEvent] = [
+        AppgateEventSuccess(op="MODIFIED", entity=dep1_v1),
+        AppgateEventSuccess(op="ADDED", entity=dep2),
+        AppgateEventSuccess(op="ADDED", entity=other_dep1),
+        AppgateEventSuccess(op="MODIFIED", entity=dep1_v2),
+        AppgateEventSuccess(op="ADDED", entity=dep3),
+        error,
+        AppgateEventSuccess(op="MODIFIED", entity=dep2),
+        AppgateEventSuccess(op="DELETED", entity=dep3),
+    ]
+    REGISTRY.clear()
+    assert coalesce_events(events) == [
+        error,
+        AppgateEventSuccess(op="MODIFIED", entity=dep1_v2),
+        AppgateEventSuccess(op="ADDED", entity=dep2),
+        AppgateEventSuccess(op="ADDED", entity=other_dep1),
+    ]
+    assert REGISTRY.counter("appgate_operator_events_received").value == 8
+    assert REGISTRY.counter("appgate_operator_events_coalesced").value == 4
+    assert REGISTRY.summary("appgate_operator_coalescing_ratio").max == 2
+    # Deleted and added again
+    events = [
+        AppgateEventSuccess(op="DELETED", entity=dep1_v1),
+        AppgateEventSuccess(op="ADDED", entity=dep1_v2),
+    ]
+    assert coalesce_events(events) == [events[-1]]
+    assert coalesce_events([]) == []
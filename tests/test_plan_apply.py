@@ -0,0 +1,274 @@
+import asyncio
+from typing import List, Tuple, Set
+
+from appgate.openapi.types import Entity_T
+from appgate.state import plan_apply, Plan, AppgatePlan, appgate_plan_apply
+from appgate.types import EntityClient, EntityWrapper, EntitiesSet
+from tests.utils import load_test_open_api_spec
+
+
+class FakeEntityClient(EntityClient):
+    def __init__(
+        self, fail: Set[str] | None = None, shared: "FakeEntityClient | None" = None
+    ) -> None:
+        self.fail = fail or set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls: List[Tuple[str, str]] = []
+        self.inits = 0
+        # Client used to track calls across entity types
+        self.shared = shared
+
+    async def init(self) -> EntityClient:
+        for t in [self] + ([self.shared] if self.shared else []):
+            t.inits += 1
+        return self
+
+    async def _apply(self, op: str, e: Entity_T) -> EntityClient:
+        trackers = [self] + ([self.shared] if self.shared else [])
+        for t in trackers:
+            t.calls.append((op, e.name))
+            t.in_flight += 1
+            t.max_in_flight = max(t.max_in_flight, t.in_flight)
+        await asyncio.sleep(0.01)
+        for t in trackers:
+            t.in_flight -= 1
+        if e.name in self.fail:
+            raise Exception(f"Unable to {op} {e.name}")
+        return self
+
+    async def create(self, e: Entity_T) -> EntityClient:
+        return await self._apply("create", e)
+
+    async def modify(self, e: Entity_T) -> EntityClient:
+        return await self._apply("modify", e)
+
+    async def delete(self, e: Entity_T) -> EntityClient:
+        return await self._apply("delete", e)
+
+
+def entities(prefix: str, n: int, kind: str = "EntityDep1") -> EntitiesSet:
+    api = load_test_open_api_spec(reload=True)
+    cls = api.entities[kind].cls
+    return EntitiesSet(
+        {EntityWrapper(cls(id=f"{prefix}{i}", name=f"{prefix}{i}")) for i in range(n)}
+    )
+
+
+def test_plan_apply_concurrency() -> None:
+    plan = Plan(
+        create=entities("create", 10),
+        modify=entities("modify", 10),
+        delete=entities("delete", 10),
+    )
+
+    def run(concurrency: int) -> FakeEntityClient:
+        client = FakeEntityClient(fail={"create3", "modify7", "delete2"})
+        new_plan, _ = asyncio.run(
+            plan_apply(
+                plan,
+                namespace="ns",
+                operator_name="operator",
+                k8s_configmap_client=None,
+                entity_client=client,
+                concurrency=concurrency,
+            )
+        )
+        assert new_plan.errors == {
+            "create3 [create3]: Unable to create create3",
+            "modify7 [modify7]: Unable to modify modify7",
+            "delete2 [delete2]: Unable to delete delete2",
+        }
+        # Only the operations applied change the state
+        ids = {e.id for e in new_plan.entities.entities}
+        assert {"create0", "modify0", "delete2"} <= ids
+        assert not {"create3", "modify7", "delete0"} & ids
+        # Creates are applied before modifications and those before deletes
+        ops = [op for op, _ in client.calls]
+        assert ops == ["create"] * 10 + ["modify"] * 10 + ["delete"] * 10
+        return client
+
+    assert run(1).max_in_flight == 1
+    assert run(4).max_in_flight == 4
+    assert run(50).max_in_flight == 10
+
+
+class ChainedEntityClient(EntityClient):
+    """
+    Entity client returning a new client for every operation applied.
+    """
+
+    def __init__(self, applied: Tuple[str, ...] = ()) -> None:
+        self.applied = applied
+
+    async def create(self, e: Entity_T) -> EntityClient:
+        return ChainedEntityClient(self.applied + (f"create {e.name}",))
+
+    async def modify(self, e: Entity_T) -> EntityClient:
+        return ChainedEntityClient(self.applied + (f"modify {e.name}",))
+
+    async def delete(self, e: Entity_T) -> EntityClient:
+        return ChainedEntityClient(self.applied + (f"delete {e.name}",))
+
+
+def test_plan_apply_returned_entity_client() -> None:
+    plan = Plan(
+        create=entities("create", 2),
+        modify=entities("modify", 1),
+        delete=entities("delete", 1),
+    )
+    _, client = asyncio.run(
+        plan_apply(
+            plan,
+            namespace="ns",
+            operator_name="operator",
+            k8s_configmap_client=None,
+            entity_client=ChainedEntityClient(),
+        )
+    )
+    # Every operation is applied with the client returned by the previous one
+    assert isinstance(client, ChainedEntityClient)
+    assert sorted(client.applied) == [
+        "create create0",
+        "create create1",
+        "delete delete0",
+        "modify modify0",
+    ]
+    assert client.applied[-2:] == ("modify modify0", "delete delete0")
+
+
+def test_entities_levels() -> None:
+    api = load_test_open_api_spec(reload=True)
+    levels = {k: i for i, level in enumerate(api.entities_levels) for k in level}
+    assert set(levels.keys()) == set(api.entities_sorted)
+    assert levels["EntityDep1"] == levels["EntityDep2"] == 0
+    assert levels["EntityDep3"] == levels["EntityDep4"] == 1
+    assert levels["EntityDep6"] == 2
+
+
+def test_appgate_plan_apply_levels() -> None:
+    api = load_test_open_api_spec(reload=True)
+    kinds = ["EntityDep1", "EntityDep2", "EntityDep4", "EntityDep6"]
+    appgate_plan = AppgatePlan(
+        entities_plan={
+            kind: Plan(
+                create=entities(f"{kind}-create", 3, kind),
+                delete=entities(f"{kind}-delete", 3, kind),
+            )
+            for kind in kinds
+        }
+    )
+
+    def run(mode, max_in_flight: int) -> FakeEntityClient:
+        tracker = FakeEntityClient()
+        clients = {
+            kind: FakeEntityClient(
+                fail={"EntityDep2-delete0"} if kind == "EntityDep2" else None,
+                shared=tracker,
+            )
+            for kind in kinds
+        }
+        new_plan, _ = asyncio.run(
+            appgate_plan_apply(
+                appgate_plan,
+                operator_name="operator",
+                namespace="ns",
+                api_spec=api,
+                entity_clients=clients,  # type: ignore
+                concurrency=2,
+                mode=mode,
+                max_in_flight=max_in_flight,
+            )
+        )
+        assert new_plan.errors == [
+            "EntityDep2-delete0 [EntityDep2-delete0]: Unable to delete EntityDep2-delete0"
+        ]
+        assert len(tracker.calls) == 24
+        # Entity clients are initialized once per type
+        assert tracker.inits == len(kinds)
+        return tracker
+
+    def kinds_order(tracker: FakeEntityClient, op: str) -> List[str]:
+        order: List[str] = []
+        for o, name in tracker.calls:
+            kind = name.split("-")[0]
+            if o == op and kind not in order:
+                order.append(kind)
+        return order
+
+    tracker = run("levels", 3)
+    # Types in the same level are applied at the same time, up to max_in_flight
+    assert tracker.max_in_flight == 3
+    created = kinds_order(tracker, "create")
+    assert set(created[:2]) == {"EntityDep1", "EntityDep2"}
+    assert created[2:] == ["EntityDep4", "EntityDep6"]
+    # Deletes are applied in reverse level order
+    deleted = kinds_order(tracker, "delete")
+    assert deleted[:2] == ["EntityDep6", "EntityDep4"]
+    assert set(deleted[2:]) == {"EntityDep1", "EntityDep2"}
+    # Creates are done before deletes
+    assert [o for o, _ in tracker.calls] == ["create"] * 12 + ["delete"] * 12
+
+    assert run("levels", 0).max_in_flight == 4
+    assert run("sequential", 0).max_in_flight == 2
+
+
+def test_appgate_plan_apply_entities() -> None:
+    api = load_test_open_api_spec(reload=True)
+    EntityDep1 = api.entities["EntityDep1"].cls
+    EntityDep3 = api.entities["EntityDep3"].cls
+    appgate_plan = AppgatePlan(
+        entities_plan={
+            "EntityDep1": Plan(
+                create=EntitiesSet(
+                    {
+                        EntityWrapper(EntityDep1(id="d1a", name="d1a")),
+                        EntityWrapper(EntityDep1(id="d1b", name="d1b")),
+                    }
+                ),
+                delete=EntitiesSet({EntityWrapper(EntityDep1(id="d1c", name="d1c"))}),
+            ),
+            "EntityDep3": Plan(
+                create=EntitiesSet(
+                    {
+                        EntityWrapper(
+                            EntityDep3(id="d3a", name="d3a", deps1=frozenset({"d1a"}))
+                        ),
+                        EntityWrapper(
+                            EntityDep3(id="d3b", name="d3b", deps1=frozenset({"d1b"}))
+                        ),
+                    }
+                ),
+                delete=EntitiesSet(
+                    {
+                        EntityWrapper(
+                            EntityDep3(id="d3c", name="d3c", deps1=frozenset({"d1c"}))
+                        )
+                    }
+                ),
+            ),
+        }
+    )
+    tracker = FakeEntityClient()
+    new_plan, _ = asyncio.run(
+        appgate_plan_apply(
+            appgate_plan,
+            operator_name="operator",
+            namespace="ns",
+            api_spec=api,
+            entity_clients={
+                "EntityDep1": FakeEntityClient(fail={"d1b"}, shared=tracker),
+                "EntityDep3": FakeEntityClient(shared=tracker),
+            },
+            mode="entities",
+            max_in_flight=0,
+        )
+    )
+    assert sorted(new_plan.errors) == [
+        "d1b [d1b]: Unable to create d1b",
+        "d3b [d3b]: Dependency d1b [d1b] failed",
+    ]
+    calls = [name for _, name in tracker.calls]
+    assert set(calls[:2]) == {"d1a", "d1b"}
+    # d3b is not applied since d1b failed
+    assert calls[2:] == ["d3a", "d3c", "d1c"]
@@ -0,0 +1,189 @@
+import asyncio
+import datetime
+from typing import Dict, Any, Optional, List, Callable
+
+import attr
+
+from appgate.client import AppgateClient, AppgateEntityClient
+from appgate.poller import AppgateStatePoller, EntitiesPoller, EntityDelta
+
+
+@attr.attrs(frozen=True)
+class Entity:
+    id: str = attr.attrib()
+    name: str = attr.attrib()
+    updated: datetime.datetime = attr.attrib(eq=False)
+    _entity_metadata: Dict[str, Any] = {}
+
+
+def at(seconds: int) -> datetime.datetime:
+    return datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc) + (
+        datetime.timedelta(seconds=seconds)
+    )
+
+
+class ControllerClient(AppgateClient):
+    def __init__(self, entities: List[Entity]) -> None:
+        super().__init__(
+            controller="https://controller.devops:8443",
+            user="user",
+            password="password",
+            provider="local",
+            version=18,
+            device_id="device-id",
+            dry_run=False,
+            expiration_time_delta=60,
+        )
+        self._token = "token"
+        self.entities = {e.id: e for e in entities}
+        self.requests: List[Optional[Dict[str, str]]] = []
+
+    async def get(
+        self,
+        path: str,
+        params: Optional[Dict[str, str]] = None,
+        load: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        cache: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        self.requests.append(params)
+        entities = sorted(
+            self.entities.values(),
+            key=lambda e: getattr(e, (params or {}).get("orderBy", "name")),
+            reverse=(params or {}).get("descending") == "true",
+        )
+        # Collections are loaded by the client while they are being received
+        data = [load(attr.asdict(e)) if load else attr.asdict(e) for e in entities]
+        if params and "range" in params:
+            start, end = [int(x) for x in params["range"].split("-")]
+            return {"data": data[start:end], "totalCount": len(data)}
+        return {"data": data}
+
+
+def entity_client(
+    client: AppgateClient, incremental: bool = True, page_size: int = 0
+) -> AppgateEntityClient:
+    def load(e: Dict[str, Any]) -> Any:
+        return Entity(**e)
+
+    return AppgateEntityClient(
+        path="/admin/entities",
+        appgate_client=client,
+        singleton=False,
+        load=load,
+        dump=lambda e: attr.asdict(e),
+        kind="Entity",
+        page_size=page_size,
+        incremental=incremental,
+    )
+
+
+def ops(deltas: List[EntityDelta]) -> List[tuple[str, str]]:
+    return sorted((d.op, d.entity.name) for d in deltas)
+
+
+def test_entities_poller() -> None:
+    async def run(page_size: int) -> None:
+        client = ControllerClient(
+            [
+                Entity("1", "e1", at(1)),
+                Entity("2", "e2", at(2)),
+                Entity("3", "e3", at(3)),
+            ]
+        )
+        poller = EntitiesPoller(entity_client(client, page_size=page_size))
+        try:
+            assert ops(await poller.poll()) == [
+                ("ADDED", "e1"),
+                ("ADDED", "e2"),
+                ("ADDED", "e3"),
+            ]
+            assert poller.high_water_mark == at(3)
+
+            # Nothing changed, we only look for updated entities and count them
+            client.requests = []
+            assert await poller.poll() == []
+            assert client.requests == [
+                {
+                    "orderBy": "updated",
+                    "descending": "true",
+                    "range": f"0-{page_size or 50}",
+                },
+                {"range": "0-0"},
+            ]
+
+            client.entities["1"] = Entity("1", "e1-renamed", at(4))
+            client.entities["4"] = Entity("4", "e4", at(5))
+            del client.entities["2"]
+            client.requests = []
+            assert ops(await poller.poll()) == [
+                ("ADDED", "e4"),
+                ("DELETED", "e2"),
+                ("MODIFIED", "e1-renamed"),
+            ]
+            assert poller.high_water_mark == at(5)
+            # The updated entities were all in the first page
+            assert client.requests[0] == {
+                "orderBy": "updated",
+                "descending": "true",
+                "range": f"0-{page_size or 50}",
+            }
+            assert {"range": "0-0"} in client.requests
+            assert sorted(e.name for e in poller.entities.values()) == [
+                "e1-renamed",
+                "e3",
+                "e4",
+            ]
+        finally:
+            await client.close()
+
+    asyncio.run(run(0))
+    asyncio.run(run(2))
+
+
+def test_entities_poller_not_incremental() -> None:
+    async def run() -> None:
+        client = ControllerClient([Entity("1", "e1", at(1))])
+        poller = EntitiesPoller(entity_client(client, incremental=False))
+        try:
+            assert ops(await poller.poll()) == [("ADDED", "e1")]
+            client.entities["1"] = Entity("1", "e1-renamed", at(2))
+            assert ops(await poller.poll()) == [("MODIFIED", "e1-renamed")]
+            assert client.requests == [None, None]
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+
+
+def test_appgate_state_poller() -> None:
+    async def run() -> None:
+        client = ControllerClient([Entity("1", "e1", at(1)), Entity("2", "e2", at(2))])
+        poller = AppgateStatePoller({"Entity": entity_client(client)}, concurrency=2)
+        try:
+            deltas = await poller.poll()
+            assert ops(deltas["Entity"]) == [("ADDED", "e1"), ("ADDED", "e2")]
+            assert await poller.poll() == {}
+            del client.entities["1"]
+            assert ops((await poller.poll())["Entity"]) == [("DELETED", "e1")]
+            client.entities["2"] = Entity("2", "e2-renamed", at(3))
+            client.entities["3"] = Entity("3", "e3", at(4))
+            assert ops((await poller.poll())["Entity"]) == [
+                ("ADDED", "e3"),
+                ("MODIFIED", "e2-renamed"),
+            ]
+            # The deltas are applied to the state
+            entities = poller.appgate_state.entities_set["Entity"]
+            assert set(entities.entities_by_name) == {"e2-renamed", "e3"}
+            assert {e.name for e in entities.entities} == {"e2-renamed", "e3"}
+            # A full poll loads everything again
+            client.requests = []
+            assert await poller.poll(full=True) == {}
+            assert client.requests == [None]
+        finally:
+            await client.close()
+        assert set(poller.appgate_state.entities_set["Entity"].entities_by_id) == {
+            "2",
+            "3",
+        }
+
+    asyncio.run(run())
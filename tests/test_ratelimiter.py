@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from appgate.metrics import REGISTRY
+from appgate.ratelimiter import BACKOFF_WINDOW, TokenBucket
+
+
+def test_token_bucket_rate() -> None:
+    async def run() -> float:
+        bucket = TokenBucket("test", rate=20, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # The first request uses the burst, the other 5 wait 50ms each
+    assert 0.2 <= asyncio.run(run()) < 0.5
+
+
+def test_token_bucket_unlimited() -> None:
+    async def run() -> float:
+        bucket = TokenBucket("test", rate=0)
+        start = time.monotonic()
+        for _ in range(100):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.1
+
+
+def test_token_bucket_backoff() -> None:
+    async def run() -> float:
+        bucket = TokenBucket("test-backoff", rate=0)
+        bucket.backoff(retry_after=0.2)
+        return await bucket.acquire()
+
+    REGISTRY.clear()
+    assert asyncio.run(run()) >= 0.19
+    wait = REGISTRY.summary(
+        "appgate_client_rate_limiter_wait_seconds", bucket="test-backoff"
+    )
+    assert wait.count == 1
+    assert wait.max >= 0.19
+
+
+def test_token_bucket_adaptive_rate() -> None:
+    bucket = TokenBucket("test", rate=16)
+    bucket.backoff(retry_after=0)
+    assert bucket.rate == 8
+    # A burst of 429s only halves the rate once
+    for _ in range(10):
+        bucket.backoff(retry_after=0)
+    assert bucket.rate == 8
+    for _ in range(10):
+        assert bucket.backed_off_at is not None
+        bucket.backed_off_at -= BACKOFF_WINDOW
+        bucket.backoff(retry_after=0)
+    assert bucket.rate == 1
+    bucket.recover()
+    assert bucket.rate == 1 + 1.6
+    for _ in range(10):
+        bucket.recover()
+    assert bucket.rate == 16
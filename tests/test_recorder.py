@@ -0,0 +1,122 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from appgate.client import AppgateClient
+from appgate.recorder import REDACTED, load_recording, redact, replay_app
+
+
+def controller_app() -> web.Application:
+    async def login(request: web.Request) -> web.Response:
+        return web.json_response(
+            {"token": "secret-token", "expires": "2099-01-01T00:00:00.000Z"}
+        )
+
+    async def entities(request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "data": [
+                    {"id": "1", "name": "entity-1", "sharedSecret": "s1"},
+                    {"id": "2", "name": "entity-2", "sharedSecret": "s2"},
+                ],
+                "range": request.query.get("range", "0-2"),
+            },
+            headers={"ETag": '"v1"'},
+        )
+
+    async def put(request: web.Request) -> web.Response:
+        return web.json_response(await request.json())
+
+    app = web.Application()
+    app.router.add_post("/admin/login", login)
+    app.router.add_get("/admin/entities", entities)
+    app.router.add_put("/admin/entities/{id}", put)
+    return app
+
+
+def new_client(server: TestServer, **kwargs: Any) -> AppgateClient:
+    return AppgateClient(
+        controller=str(server.make_url("/")),
+        user="user",
+        password="password",
+        provider="local",
+        version=18,
+        device_id="device-id",
+        dry_run=False,
+        expiration_time_delta=60,
+        **kwargs,
+    )
+
+
+async def session(client: AppgateClient) -> List[Any]:
+    await client.login()
+    return [
+        await client.get("/admin/entities", params={"range": "0-2"}),
+        await client.get("/admin/entities", load=lambda e: e["name"]),
+        await client.put("/admin/entities/1", {"id": "1", "password": "p1"}),
+    ]
+
+
+def test_redact() -> None:
+    assert redact(
+        {"name": "n", "password": "p", "nested": [{"privateKey": "k", "tags": []}]}
+    ) == {
+        "name": "n",
+        "password": REDACTED,
+        "nested": [{"privateKey": REDACTED, "tags": []}],
+    }
+
+
+def test_record_and_replay(tmp_path: Path) -> None:
+    recording = tmp_path / "controller.jsonl.gz"
+
+    async def record() -> List[Any]:
+        server = TestServer(controller_app())
+        await server.start_server()
+        client = new_client(server, record_file=recording)
+        try:
+            return await session(client)
+        finally:
+            await client.close()
+            await server.close()
+
+    async def replay(latency: float) -> List[Any]:
+        server = TestServer(replay_app(load_recording(recording), latency=latency))
+        await server.start_server()
+        client = new_client(server)
+        try:
+            return await session(client)
+        finally:
+            await client.close()
+            await server.close()
+
+    recorded = asyncio.run(record())
+    exchanges = load_recording(recording)
+    assert [(e.method, e.path, e.params, e.status) for e in exchanges] == [
+        ("POST", "/admin/login", {}, 200),
+        ("GET", "/admin/entities", {"range": "0-2"}, 200),
+        ("GET", "/admin/entities", {}, 200),
+        ("PUT", "/admin/entities/1", {}, 200),
+    ]
+    # Secrets are never written
+    raw = recording.read_bytes()
+    assert all(s not in raw for s in (b"secret-token", b"Bearer", b"s1", b"p1"))
+    assert exchanges[0].request_body
+    assert exchanges[0].request_body["password"] == REDACTED
+    assert exchanges[1].request_headers["Authorization"] == REDACTED
+    assert exchanges[1].headers["ETag"] == '"v1"'
+
+    start = time.monotonic()
+    replayed = asyncio.run(replay(latency=0.05))
+    assert time.monotonic() - start >= 4 * 0.05
+    redacted: List[Dict[str, Any]] = [
+        {"id": "1", "name": "entity-1", "sharedSecret": REDACTED},
+        {"id": "2", "name": "entity-2", "sharedSecret": REDACTED},
+    ]
+    assert replayed[0] == {**recorded[0], "data": redacted}
+    assert replayed[1] == recorded[1]
+    assert replayed[2] == {"id": "1", "password": REDACTED}
@@ -0,0 +1,82 @@
+import asyncio
+from typing import Dict, Set, List, Optional
+
+from appgate.scheduler import run_graph, GraphStats
+
+
+def run(
+    graph: Dict[str, Set[str]],
+    max_in_flight: int = 0,
+    fail: Optional[Set[str]] = None,
+    durations: Optional[Dict[str, float]] = None,
+) -> tuple[GraphStats, List[str], int]:
+    started: List[str] = []
+    in_flight = 0
+    max_seen = 0
+
+    async def _run(node: str) -> Optional[str]:
+        nonlocal in_flight, max_seen
+        started.append(node)
+        in_flight += 1
+        max_seen = max(max_seen, in_flight)
+        await asyncio.sleep((durations or {}).get(node, 0.01))
+        in_flight -= 1
+        if node in (fail or set()):
+            return f"{node} failed"
+        return None
+
+    stats = asyncio.run(
+        run_graph(
+            graph,
+            _run,
+            lambda node, failed: f"{node} skipped because of {failed}",
+            max_in_flight,
+        )
+    )
+    return stats, started, max_seen
+
+
+def test_run_graph_dependencies() -> None:
+    graph = {"a": set(), "b": set(), "c": {"a"}, "d": {"c", "b"}, "e": set()}
+    stats, started, max_seen = run(graph)
+    assert set(started) == set(graph.keys())
+    for n, deps in graph.items():
+        for d in deps:
+            assert stats.nodes[d].finished <= stats.nodes[n].started
+    assert max_seen == 3
+    assert stats.critical_path == ["a", "c", "d"]
+    assert stats.errors == {}
+
+
+def test_run_graph_max_in_flight() -> None:
+    graph: Dict[str, Set[str]] = {str(i): set() for i in range(10)}
+    stats, _, max_seen = run(graph, max_in_flight=2)
+    assert max_seen == 2
+    assert max(s.wait_time for s in stats.nodes.values()) > 0
+    assert len(stats.critical_path) == 1
+
+
+def test_run_graph_does_not_wait_for_unrelated_nodes() -> None:
+    # c only depends on a, it does not wait for the slow b
+    graph = {"a": set(), "b": set(), "c": {"a"}}
+    stats, _, _ = run(graph, durations={"b": 0.3})
+    assert stats.nodes["c"].finished < stats.nodes["b"].finished
+    assert stats.critical_path == ["b"]
+
+
+def test_run_graph_failures() -> None:
+    graph = {"a": set(), "b": {"a"}, "c": {"b"}, "d": set()}
+    stats, started, _ = run(graph, fail={"a"})
+    assert sorted(started) == ["a", "d"]
+    assert stats.errors == {
+        "a": "a failed",
+        "b": "b skipped because of a",
+        "c": "c skipped because of b",
+    }
+    assert stats.nodes["c"].skipped
+
+
+def test_run_graph_empty() -> None:
+    stats, started, _ = run({})
+    assert started == []
+    assert stats.nodes == {}
@@ -0,0 +1,241 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+from aiohttp import web
+from aiohttp.test_utils import BaseTestServer, TestServer
+from kubernetes.client import Configuration
+
+from appgate.watcher import Informer, K8sApi, Watch, WatchMultiplexer
+
+
+def watch_event(type: str, name: str, version: str | None = None) -> Dict[str, Any]:
+    metadata = {"name": name}
+    if version:
+        metadata["resourceVersion"] = version
+    return {
+        "type": type,
+        "object": {"kind": "Policy", "metadata": metadata, "spec": {}},
+    }
+
+
+def list_response(version: str, *names_versions: tuple[str, str]) -> Dict[str, Any]:
+    return {
+        "kind": "PolicyList",
+        "metadata": {"resourceVersion": version},
+        "items": [
+            {"metadata": {"name": n, "resourceVersion": v}, "spec": {}}
+            for n, v in names_versions
+        ],
+    }
+
+
+def k8s_app(connections: Dict[str, int]) -> web.Application:
+    """
+    API server closing each watch after sending two events.
+    """
+
+    async def watch(request: web.Request) -> web.StreamResponse:
+        plural = request.match_info["plural"]
+        assert request.headers["Authorization"] == "Bearer token"
+        if "watch" not in request.query:
+            return web.json_response(list_response("1"))
+        connections[plural] = connections.get(plural, 0) + 1
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        n = connections[plural]
+        for type in ("ADDED", "MODIFIED"):
+            line = json.dumps(watch_event(type, f"{plural}-{n}")) + "\n"
+            # Split the lines in several chunks
+            await resp.write(line[:10].encode())
+            await resp.write(line[10:].encode())
+        await resp.write_eof()
+        return resp
+
+    app = web.Application()
+    app.router.add_get("/apis/sdp/v1/namespaces/ns/{plural}", watch)
+    return app
+
+
+def k8s_api(server: BaseTestServer) -> K8sApi:
+    configuration = Configuration(host=str(server.make_url("")))
+    configuration.api_key = {"authorization": "token"}
+    configuration.api_key_prefix = {"authorization": "Bearer"}
+    return K8sApi(configuration)
+
+
+def test_watch_multiplexer() -> None:
+    connections: Dict[str, int] = {}
+    events: Dict[str, List[str]] = {"policies": [], "sites": []}
+
+    def handler(plural: str):
+        async def handle(event: Dict[str, Any]) -> None:
+            events[plural].append(
+                f"{event['type']} {event['object']['metadata']['name']}"
+            )
+
+        return handle
+
+    async def run() -> None:
+        async with TestServer(k8s_app(connections)) as server:
+            async with WatchMultiplexer(k8s_api(server)) as watches:
+                for plural in events:
+                    watches.add(
+                        plural, f"/apis/sdp/v1/namespaces/ns/{plural}", handler(plural)
+                    )
+                task = asyncio.create_task(watches.run())
+                while min(len(e) for e in events.values()) < 4:
+                    await asyncio.sleep(0.01)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                assert not any(w.connected for w in watches.watches)
+
+    asyncio.run(run())
+    # Watches closed by the server are opened again
+    assert connections["policies"] >= 2
+    assert connections["sites"] >= 2
+    for plural, received in events.items():
+        assert received[:4] == [
+            f"ADDED {plural}-1",
+            f"MODIFIED {plural}-1",
+            f"ADDED {plural}-2",
+            f"MODIFIED {plural}-2",
+        ]
+
+
+def test_watch_multiplexer_failures() -> None:
+    calls: List[int] = []
+    received: List[Dict[str, Any]] = []
+
+    async def watch(request: web.Request) -> web.StreamResponse:
+        calls.append(1)
+        if len(calls) < 3:
+            return web.Response(status=500, text="Internal error")
+        if "watch" not in request.query:
+            return web.json_response(list_response("1"))
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        await resp.write((json.dumps(watch_event("ADDED", "p1")) + "\n").encode())
+        await asyncio.sleep(10)
+        return resp
+
+    async def handle(event: Dict[str, Any]) -> None:
+        received.append(event)
+
+    async def run() -> None:
+        app = web.Application()
+        app.router.add_get("/policies", watch)
+        async with TestServer(app) as server:
+            watches = WatchMultiplexer(k8s_api(server))
+            watch_ = watches.add("policies", "/policies", handle)
+            task = asyncio.create_task(watches.run())
+            while not received:
+                await asyncio.sleep(0.01)
+            # The failures are forgotten once the watch is connected
+            assert watch_.failures == 0
+            assert watch_.connected
+            await watches.close()
+            # Closing stops the watches
+            await asyncio.wait_for(asyncio.gather(task, return_exceptions=True), 1)
+
+    asyncio.run(run())
+    # Two failures, the list and the watch
+    assert len(calls) == 4
+    assert received == [watch_event("ADDED", "p1")]
+
+
+def test_watch_multiplexer_resume() -> None:
+    requests: List[str] = []
+    received: List[str] = []
+    gone = {"type": "ERROR", "object": {"kind": "Status", "code": 410}}
+    lists = [
+        list_response("3", ("p1", "1"), ("p2", "2"), ("p3", "3")),
+        # p1 did not change, p2 was modified and p3 deleted
+        list_response("7", ("p1", "4"), ("p2", "6")),
+    ]
+    watches = [
+        [watch_event("MODIFIED", "p1", "4")],
+        [{"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "5"}}}],
+        [gone],
+        [],
+    ]
+
+    async def watch(request: web.Request) -> web.StreamResponse:
+        if "watch" not in request.query:
+            requests.append("list")
+            return web.json_response(lists.pop(0))
+        assert request.query["allowWatchBookmarks"] == "true"
+        requests.append(f"watch {request.query.get('resourceVersion')}")
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        for event in watches.pop(0):
+            await resp.write((json.dumps(event) + "\n").encode())
+        if not watches:
+            await asyncio.sleep(10)
+        return resp
+
+    async def handle(event: Dict[str, Any]) -> None:
+        metadata = event["object"]["metadata"]
+        received.append(
+            f"{event['type']} {metadata['name']} {metadata['resourceVersion']}"
+        )
+
+    async def run() -> None:
+        app = web.Application()
+        app.router.add_get("/policies", watch)
+        async with TestServer(app) as server:
+            async with WatchMultiplexer(k8s_api(server)) as multiplexer:
+                watch_ = multiplexer.add("policies", "/policies", handle)
+                informer = Informer()
+                informer.add("Policy", watch_)
+                assert informer.pending() == ["Policy"]
+                task = asyncio.create_task(multiplexer.run())
+                # Synced once the events of the initial list are handled
+                await asyncio.wait_for(informer.wait_synced(), 1)
+                assert informer.pending() == []
+                assert len(received) == 3
+                while watches:
+                    await asyncio.sleep(0.01)
+                assert watch_.failures == 0
+                assert watch_.resource_version == "7"
+                assert set(watch_.objects) == {"p1", "p2"}
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    # Resumed from the last version seen, listing again only when it's gone
+    assert requests == ["list", "watch 3", "watch 4", "watch 5", "list", "watch 7"]
+    assert received == [
+        "ADDED p1 1",
+        "ADDED p2 2",
+        "ADDED p3 3",
+        "MODIFIED p1 4",
+        "MODIFIED p2 6",
+        "DELETED p3 3",
+    ]
+
+
+def test_informer() -> None:
+    informer = Informer()
+    assert not informer.synced("Policy")
+    assert informer.get("Policy", "p1") is None
+    assert informer.list("Policy") == []
+
+    async def handle(event: Dict[str, Any]) -> None:
+        pass
+
+    watch = Watch("policies", "/policies", handle)
+    informer.add("Policy", watch)
+    watch.relist(list_response("2", ("p1", "1"), ("p2", "2")))
+    assert informer.synced("Policy")
+    assert not informer.synced("Site")
+    assert len(informer) == 2
+    assert informer.get("Policy", "p1") == {
+        "kind": "Policy",
+        "metadata": {"name": "p1", "resourceVersion": "1"},
+        "spec": {},
+    }
+    watch.update(watch_event("DELETED", "p1", "3"))
+    watch.update(watch_event("ADDED", "p3", "4"))
+    assert [p["metadata"]["name"] for p in informer.list("Policy")] == ["p2", "p3"]
+    assert informer.get("Policy", "p1") is None